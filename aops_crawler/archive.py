@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from scrapy.http import HtmlResponse, Response, TextResponse
+try:
+    import zstandard  # optional: smaller and much faster than gzip
+except Exception:  # pragma: no cover
+    zstandard = None
+
+__all__ = ["ResponseArchive"]
+
+logger = logging.getLogger(__name__)
+
+_RESPONSE_CLASSES = {
+    "HtmlResponse": HtmlResponse,
+    "TextResponse": TextResponse,
+    "Response": Response,
+}
+
+
+def _compress(data: bytes) -> Tuple[bytes, str]:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(data), "zst"
+    return gzip.compress(data, compresslevel=6), "gz"
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zst":
+        if zstandard is None:
+            raise RuntimeError("archive blob is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class ResponseArchive:
+    """
+    Compressed, content-addressed store of rendered responses keyed by (driver, id).
+
+    Each response (the JSON snapshot of a contest/category page or the scrolled
+    HTML of a topic) is serialized as a JSON header line plus the raw body,
+    compressed (zstd when `zstandard` is installed, gzip otherwise) and written
+    once under `blobs/<sha256[:2]>/<sha256>`; identical renders share a blob. A
+    small SQLite index next to the blobs maps (driver, id) to the latest digest,
+    so a recorded crawl can be replayed without a browser.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        os.makedirs(os.path.join(self.root, "blobs"), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(self.root, "index.sqlite3"), timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                driver TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                url TEXT,
+                status INTEGER,
+                size INTEGER,
+                recorded_at REAL NOT NULL,
+                PRIMARY KEY (driver, item_id)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+    def _blob_path(self, digest: str, codec: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.{codec}")
+
+    def put(self, driver: str, item_id: int, response: Response) -> str:
+        """Archive `response` as the latest render of (driver, id); returns its digest."""
+        header: Dict[str, Any] = {
+            "class": type(response).__name__,
+            "url": response.url,
+            "status": response.status,
+            "headers": {
+                k.decode("latin-1"): [v.decode("latin-1") for v in vs]
+                for k, vs in response.headers.items()
+            },
+            "encoding": getattr(response, "encoding", None),
+        }
+        payload = json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n" + response.body
+        digest = hashlib.sha256(payload).hexdigest()
+        codec = "zst" if zstandard is not None else "gz"
+        path = self._blob_path(digest, codec)
+        if not os.path.exists(path):
+            data, codec = _compress(payload)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self._conn.execute(
+            """
+            INSERT INTO responses (driver, item_id, digest, codec, url, status, size, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(driver, item_id) DO UPDATE SET
+                digest = excluded.digest, codec = excluded.codec, url = excluded.url,
+                status = excluded.status, size = excluded.size, recorded_at = excluded.recorded_at
+            """,
+            (driver, int(item_id), digest, codec, response.url, response.status, len(response.body), time.time()),
+        )
+        self._conn.commit()
+        return digest
+
+    def get(self, driver: str, item_id: int, url: Optional[str] = None) -> Optional[Response]:
+        """Rebuild the recorded response for (driver, id), or None if it was never recorded.
+        `url` overrides the recorded URL (e.g. replaying against another base URL)."""
+        row = self._conn.execute(
+            "SELECT digest, codec FROM responses WHERE driver = ? AND item_id = ?",
+            (driver, int(item_id)),
+        ).fetchone()
+        if row is None:
+            return None
+        digest, codec = row
+        with open(self._blob_path(digest, codec), "rb") as f:
+            payload = _decompress(f.read(), codec)
+        header_line, _, body = payload.partition(b"\n")
+        header = json.loads(header_line.decode("utf-8"))
+        cls = _RESPONSE_CLASSES.get(header.get("class"), Response)
+        kwargs: Dict[str, Any] = {
+            "url": url or header["url"],
+            "status": header.get("status", 200),
+            "headers": header.get("headers") or {},
+            "body": body,
+        }
+        if issubclass(cls, TextResponse) and header.get("encoding"):
+            kwargs["encoding"] = header["encoding"]
+        return cls(**kwargs)
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
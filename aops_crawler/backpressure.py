@@ -0,0 +1,145 @@
+import logging
+import time
+import weakref
+from collections import deque
+from typing import Dict
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer, reactor
+from twisted.python import threadable
+from aops_crawler.items import PostItem
+
+__all__ = ["ByteBudget", "ByteBudgetSpiderMiddleware"]
+
+logger = logging.getLogger(__name__)
+
+
+class ByteBudget:
+    """
+    Bytes of downloaded responses that are still queued or being processed.
+
+    The download handler `hold()`s every page it returns and, while the total
+    is over `limit`, waits on `when_available()` before leasing another page.
+    A response is held by the scraper until its callback output is consumed,
+    and by every item that carries it (`PostItem.response`) until the item
+    leaves the pipeline; `ByteBudgetSpiderMiddleware` does the bookkeeping.
+    Responses that are garbage-collected while still held (dropped by a
+    middleware, errors) are released by a finalizer. One per crawler.
+    """
+
+    def __init__(self, limit: int, stats=None) -> None:
+        self.limit = limit
+        self.used = 0
+        self._stats = stats
+        self._held: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._waiters: deque = deque()
+
+    @classmethod
+    def from_crawler(cls, crawler) -> "ByteBudget":
+        """The crawler's shared budget (created on first use)."""
+        budget = getattr(crawler, "aops_byte_budget", None)
+        if budget is None:
+            budget = cls(crawler.settings.getint("AOPS_BYTE_BUDGET", 0), crawler.stats)
+            crawler.aops_byte_budget = budget
+        return budget
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def when_available(self) -> defer.Deferred:
+        """Fires once the bytes in use are below the limit."""
+        if not self.enabled or self.used < self.limit:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._waiters.append((d, time.monotonic()))
+        self._inc("aops/budget/waits")
+        return d
+
+    def hold(self, response):
+        """Account for a freshly downloaded response (one reference: the scraper)."""
+        if not self.enabled or response in self._held:
+            return response
+        entry = [len(response.body), 1]
+        self._held[response] = entry
+        weakref.finalize(response, self._finalize, entry)
+        self._update(entry[0])
+        return response
+
+    def ref(self, response) -> None:
+        entry = self._held.get(response)
+        if entry is not None:
+            entry[1] += 1
+
+    def unref(self, response) -> None:
+        entry = self._held.get(response)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            self._release(entry)
+
+    def _finalize(self, entry) -> None:
+        if threadable.isInIOThread():
+            self._release(entry)
+        else:
+            reactor.callFromThread(self._release, entry)
+
+    def _release(self, entry) -> None:
+        size, entry[0] = entry[0], 0
+        if size:
+            self._update(-size)
+
+    def _update(self, delta: int) -> None:
+        self.used += delta
+        if self._stats is not None:
+            self._stats.set_value("aops/budget/bytes", self.used)
+            self._stats.max_value("aops/budget/max_bytes", self.used)
+        while self._waiters and self.used < self.limit:
+            d, since = self._waiters.popleft()
+            self._inc("aops/budget/wait_seconds", round(time.monotonic() - since, 3))
+            d.callback(None)
+
+    def _inc(self, key: str, count=1) -> None:
+        if self._stats is not None:
+            self._stats.inc_value(key, count)
+
+
+class ByteBudgetSpiderMiddleware:
+    """
+    Releases `ByteBudget` holds: the scraper's once a callback's output is
+    exhausted, and one per `PostItem` carrying the response once the item is
+    scraped, dropped or fails in the pipeline. Enabled by `AOPS_BYTE_BUDGET`.
+    """
+
+    def __init__(self, budget: ByteBudget) -> None:
+        self._budget = budget
+        # id(item) -> the response it carries, until the item leaves the pipeline
+        self._items: Dict[int, object] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        budget = ByteBudget.from_crawler(crawler)
+        if not budget.enabled:
+            raise NotConfigured
+        s = cls(budget)
+        crawler.signals.connect(s.item_done, signal=signals.item_scraped)
+        crawler.signals.connect(s.item_done, signal=signals.item_dropped)
+        crawler.signals.connect(s.item_done, signal=signals.item_error)
+        return s
+
+    async def process_spider_output(self, response, result, spider):
+        try:
+            async for r in result:
+                if isinstance(r, PostItem) and r.get("response") is not None:
+                    self._budget.ref(r["response"])
+                    self._items[id(r)] = r["response"]
+                yield r
+        finally:
+            self._budget.unref(response)
+
+    def item_done(self, item, **kwargs):
+        response = self._items.pop(id(item), None)
+        if response is not None:
+            self._budget.unref(response)
@@ -0,0 +1,82 @@
+import glob
+import os
+from typing import Dict, List, Optional
+
+from scrapy.http import HtmlResponse, Request
+from aops_crawler.bench.stub_server import ROOT_CONTEST_ID, StubConfig, StubTree, render_listing, render_topic
+
+__all__ = ["CORPUS_CASES", "TIME_STRINGS", "build_corpus", "load_corpus", "dump_corpus"]
+
+# Topic / listing shapes the parsers must stay fast on: a typical thread, a long
+# one, and a pathological one (thousands of posts, mostly LaTeX images)
+CORPUS_CASES: Dict[str, StubConfig] = {
+    "small": StubConfig(fanout=6, depth=1, threads_per_category=1, posts_min=4, posts_max=12, latex_ratio=0.3, seed=101),
+    "large": StubConfig(fanout=80, depth=1, threads_per_category=1, posts_min=400, posts_max=400, latex_ratio=0.3, seed=102),
+    "pathological": StubConfig(fanout=400, depth=1, threads_per_category=1, posts_min=3000, posts_max=3000, latex_ratio=0.95, seed=103),
+}
+
+# Every date style the topic view shows (absolute, relative, day words)
+TIME_STRINGS: List[str] = [
+    "Jan 5, 2023, 3:15 pm",
+    "Dec 31, 2019, 11:59 PM",
+    "Aug 24, 2026, 01:25 PM",
+    "Today at 9:02 AM",
+    "Yesterday at 11:40 PM",
+    "5 minutes ago",
+    "2 hours ago",
+    "3 days ago",
+    "1 week ago",
+    "Just now",
+]
+
+
+def _response(url: str, html: str, driver: str, item_id: int, parent_id: Optional[int]) -> HtmlResponse:
+    request = Request(url, meta={"driver": driver, "id": item_id, "parent_id": parent_id, "depth": 1})
+    return HtmlResponse(url=url, body=html.encode("utf-8"), encoding="utf-8", request=request)
+
+
+def build_corpus(base_url: str = "https://artofproblemsolving.com") -> Dict[str, Dict[str, HtmlResponse]]:
+    """Rendered pages per case: {"topic": {case: response}, "category": {case: response}},
+    generated deterministically from `CORPUS_CASES` with the stand-in server's templates."""
+    corpus: Dict[str, Dict[str, HtmlResponse]] = {"topic": {}, "category": {}}
+    for case, config in CORPUS_CASES.items():
+        tree = StubTree(config)
+        topic_id = max(tree.topics, key=lambda t: tree.topics[t]["num_posts"])
+        corpus["topic"][case] = _response(
+            f"{base_url}/community/p{topic_id}",
+            render_topic(tree, topic_id, prerendered=True),
+            "post", topic_id, tree.topics[topic_id]["category_id"],
+        )
+        corpus["category"][case] = _response(
+            f"{base_url}/community/c{ROOT_CONTEST_ID}",
+            render_listing(tree, ROOT_CONTEST_ID, prerendered=True),
+            "category", ROOT_CONTEST_ID, None,
+        )
+    return corpus
+
+
+def dump_corpus(path: str) -> None:
+    """Write the generated corpus as `<kind>-<case>.html` files (to check in, as
+    test/corpus holds the small cases, or to diff)."""
+    os.makedirs(path, exist_ok=True)
+    for kind, cases in build_corpus().items():
+        for case, response in cases.items():
+            with open(os.path.join(path, f"{kind}-{case}.html"), "wb") as f:
+                f.write(response.body)
+
+
+def load_corpus(path: Optional[str] = None) -> Dict[str, Dict[str, HtmlResponse]]:
+    """The generated corpus, or saved pages from `path` (`topic-*.html` /
+    `category-*.html`, e.g. real pages from a recorded crawl)."""
+    if not path:
+        return build_corpus()
+    corpus: Dict[str, Dict[str, HtmlResponse]] = {"topic": {}, "category": {}}
+    for file_path in sorted(glob.glob(os.path.join(path, "*.html"))):
+        kind, _, case = os.path.basename(file_path)[:-len(".html")].partition("-")
+        if kind not in corpus:
+            continue
+        with open(file_path, "rb") as f:
+            html = f.read().decode("utf-8")
+        driver = "post" if kind == "topic" else "category"
+        corpus[kind][case] = _response(f"file://{os.path.abspath(file_path)}", html, driver, 0, None)
+    return corpus
@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from scrapy.utils.test import get_crawler
+from aops_crawler.bench.corpus import TIME_STRINGS, dump_corpus, load_corpus
+from aops_crawler.items import PostItem
+from aops_crawler.pipelines import (
+    AopsCrawlerPipeline,
+    extract_post_fields,
+    parse_aops_time,
+    select_posts,
+    transform_cmty_post_html,
+)
+from aops_crawler.spiders.aops_spider import QuotesSpider
+
+__all__ = ["run_stages", "compare", "main"]
+
+
+def _stage_functions(corpus, workdir: str) -> Dict[str, Callable[[], int]]:
+    """One zero-arg callable per (stage, case); each run returns the number of items processed."""
+    crawler = get_crawler(QuotesSpider, {
+        "AOPS_SQLITE_PATH": os.path.join(workdir, "bench.sqlite3"),
+        "AOPS_EXPORT_DIR": os.path.join(workdir, "export"),
+    })
+    spider = QuotesSpider.from_crawler(crawler)
+    pipeline = AopsCrawlerPipeline.from_crawler(crawler)
+    stages: Dict[str, Callable[[], int]] = {}
+
+    for case, response in corpus["topic"].items():
+        fragments = [extract_post_fields(post)[4] for post in select_posts(response)]
+
+        def _extract(response=response):
+            n = 0
+            for post in select_posts(response):
+                extract_post_fields(post)
+                n += 1
+            return n
+
+        def _transform(fragments=fragments):
+            for fragment in fragments:
+                transform_cmty_post_html(fragment)
+            return len(fragments)
+
+        def _process_item(response=response, n=len(fragments)):
+            item = PostItem(
+                post_id=response.meta["id"],
+                parent_id=response.meta.get("parent_id"),
+                url=response.url,
+                response=response,
+            )
+            pipeline.process_item(item, spider)
+            return n
+
+        stages[f"extract_posts/{case}"] = _extract
+        stages[f"transform_html/{case}"] = _transform
+        stages[f"process_item/{case}"] = _process_item
+
+    for case, response in corpus["category"].items():
+        def _parse_category(response=response):
+            return sum(1 for _ in spider.parse_category(response))
+        stages[f"parse_category_html/{case}"] = _parse_category
+
+    def _parse_time():
+        for _ in range(50):
+            for text in TIME_STRINGS:
+                parse_aops_time(text)
+        return 50 * len(TIME_STRINGS)
+    stages["parse_time/mixed"] = _parse_time
+
+    stages["_close"] = lambda: pipeline.close_spider(spider) or 0
+    return stages
+
+
+def _measure(fn: Callable[[], int], repeat: int) -> Dict[str, Any]:
+    fn()  # warm-up (lxml parse caches, SQLite pages, dateparser tables)
+    timings: List[float] = []
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = fn()
+        timings.append(time.perf_counter() - start)
+    # Allocations in a separate pass: tracemalloc slows the timed runs several-fold
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    finally:
+        tracemalloc.stop()
+    median = statistics.median(timings)
+    return {
+        "items": items,
+        "median_s": round(median, 6),
+        "items_per_s": round(items / median, 1) if median > 0 else None,
+        "alloc_peak_kib": round(peak / 1024.0, 1),
+        "live_blocks": blocks,
+    }
+
+
+def run_stages(corpus_path: str = None, repeat: int = 5, only: Tuple[str, ...] = ()) -> Dict[str, Dict[str, Any]]:
+    corpus = load_corpus(corpus_path)
+    results: Dict[str, Dict[str, Any]] = {}
+    with tempfile.TemporaryDirectory(prefix="aops-parsers-") as workdir:
+        stages = _stage_functions(corpus, workdir)
+        close = stages.pop("_close")
+        for name, fn in stages.items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            results[name] = _measure(fn, repeat)
+            print(f"{name:<36} {results[name]['items_per_s']:>12} items/s  "
+                  f"{results[name]['alloc_peak_kib']:>10} KiB peak", file=sys.stderr)
+        close()
+    return results
+
+
+def compare(baseline: Dict[str, Dict[str, Any]], current: Dict[str, Dict[str, Any]], threshold: float = 0.10) -> List[str]:
+    """Stages whose throughput dropped by more than `threshold` (fraction) against `baseline`."""
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        cur = current.get(name)
+        if not cur or not base.get("items_per_s") or not cur.get("items_per_s"):
+            continue
+        ratio = cur["items_per_s"] / base["items_per_s"]
+        status = "REGRESSION" if ratio < 1.0 - threshold else "ok"
+        print(f"{name:<36} {base['items_per_s']:>12} -> {cur['items_per_s']:>12} items/s  ({ratio - 1.0:+.1%})  {status}")
+        if status != "ok":
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the topic/category parsing hot paths")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="measure items/s and allocations per stage")
+    p_run.add_argument("--corpus", default=None, help="directory of saved topic-*.html / category-*.html pages (default: generated)")
+    p_run.add_argument("--repeat", type=int, default=5)
+    p_run.add_argument("--only", action="append", default=[], help="stage name prefix (repeatable)")
+    p_run.add_argument("--out", default=None, help="write results as JSON")
+
+    p_cmp = sub.add_parser("compare", help="fail when throughput regressed beyond a threshold")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("current")
+    p_cmp.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown as a fraction (default 0.10)")
+
+    p_dump = sub.add_parser("dump-corpus", help="write the generated corpus as HTML files")
+    p_dump.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        results = run_stages(args.corpus, args.repeat, tuple(args.only))
+        text = json.dumps(results, indent=2, sort_keys=True)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+    if args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        return 0
+    dump_corpus(args.path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import resource
+import sqlite3
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from scrapy.crawler import CrawlerRunner
+from twisted.internet import defer, task
+from aops_crawler.bench.stub_server import ROOT_CONTEST_ID, StubServer
+from aops_crawler.utils.timing import get_recorder
+
+try:
+    import psutil  # optional: browser process RSS
+except Exception:  # pragma: no cover
+    psutil = None
+
+__all__ = ["run_benchmark", "run_profiles", "format_report", "format_comparison", "write_report"]
+
+logger = logging.getLogger(__name__)
+
+
+def _self_peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _RssSampler:
+    """Peak RSS of the crawler process and (with psutil) of its browser children."""
+
+    def __init__(self, interval: float = 1.0) -> None:
+        self._interval = interval
+        self._task = None
+        self.peak_browser_bytes: Optional[int] = None
+
+    def start(self) -> None:
+        if psutil is None:
+            return
+        self.peak_browser_bytes = 0
+        self._task = task.LoopingCall(self.sample)
+        self._task.start(self._interval)
+
+    def sample(self) -> None:
+        try:
+            total = 0
+            for child in psutil.Process().children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    continue
+            self.peak_browser_bytes = max(self.peak_browser_bytes or 0, total)
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        if self._task is not None and self._task.running:
+            self._task.stop()
+
+
+def _db_report(sqlite_path: str) -> Dict[str, Any]:
+    size = sum(
+        os.path.getsize(p)
+        for p in (sqlite_path, f"{sqlite_path}-wal", f"{sqlite_path}-shm")
+        if os.path.exists(p)
+    )
+    report: Dict[str, Any] = {"db_bytes": size, "pages_by_driver": {}, "posts": 0}
+    if not os.path.exists(sqlite_path):
+        return report
+    conn = sqlite3.connect(sqlite_path)
+    try:
+        # The seen-store has one row per fetched (driver, id) page
+        report["pages_by_driver"] = dict(conn.execute("SELECT driver, COUNT(*) FROM seen GROUP BY driver").fetchall())
+        report["posts"] = conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+    finally:
+        conn.close()
+    return report
+
+
+@defer.inlineCallbacks
+def run_benchmark(settings, stub_config, workdir: str, spider_name: str = "aops_crawler"):
+    """
+    Crawl a fresh `StubServer` tree with the project's spider, download handler
+    and pipeline, writing the database and logs under `workdir`.
+
+    `settings` are the project settings (plus any overrides); the benchmark only
+    redirects the base URL, seeds and output paths. Fires with a report dict.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    sqlite_path = os.path.join(workdir, "aops.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(sqlite_path + suffix):
+            os.remove(sqlite_path + suffix)
+
+    server = StubServer(stub_config).start()
+    settings = settings.copy()
+    for key, value in {
+        "AOPS_BASE_URL": server.base_url,
+        "AOPS_SEED_CONTESTS": [ROOT_CONTEST_ID],
+        "AOPS_SQLITE_PATH": sqlite_path,
+        "AOPS_FRONTIER_PATH": None,
+        "AOPS_EXPORT_DIR": os.path.join(workdir, "export"),
+        "AOPS_BROWSER_USER_DATA_DIR": os.path.join(workdir, "profile"),
+        "AOPS_BROWSER_KEEPALIVE": False,
+        "AOPS_WORK_QUEUE": False,
+        "AOPS_LATENCY_PROM_FILE": os.path.join(workdir, "latency.prom"),
+    }.items():
+        settings.set(key, value, priority="cmdline")
+    logger.info(
+        f"[bench] Stub tree: {server.tree.page_count()} pages, {server.tree.post_count()} posts at {server.base_url}"
+    )
+
+    get_recorder().reset()
+    sampler = _RssSampler()
+    runner = CrawlerRunner(settings)
+    crawler = runner.create_crawler(spider_name)
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        yield runner.crawl(crawler)
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        server.stop()
+
+    report: Dict[str, Any] = {
+        "elapsed_s": round(elapsed, 2),
+        "tree_pages": server.tree.page_count(),
+        "tree_posts": server.tree.post_count(),
+    }
+    report.update(_db_report(sqlite_path))
+    pages = sum(report["pages_by_driver"].values())
+    report["pages"] = pages
+    report["pages_per_min"] = round(pages / elapsed * 60.0, 1) if elapsed > 0 else 0.0
+    report["posts_per_s"] = round(report["posts"] / elapsed, 2) if elapsed > 0 else 0.0
+    report["peak_rss_bytes"] = _self_peak_rss_bytes()
+    report["peak_browser_rss_bytes"] = sampler.peak_browser_bytes
+    stats = crawler.stats.get_stats()
+    report["launch_profile"] = settings.get("AOPS_LAUNCH_PROFILE") or "default"
+    report["finish_reason"] = stats.get("finish_reason")
+    report["errors"] = stats.get("log_count/ERROR", 0)
+    report["download_exceptions"] = stats.get("downloader/exception_count", 0)
+    report["latency_ms"] = {
+        f"{driver}/{stage}": {q: round(summary[q] * 1000.0, 1) for q in ("p50", "p95", "p99")}
+        for (stage, driver), summary in sorted(get_recorder().snapshot().items(), key=lambda kv: (kv[0][1], kv[0][0]))
+    }
+    return report
+
+
+@defer.inlineCallbacks
+def run_profiles(settings, stub_config, workdir: str, profiles: List[str], spider_name: str = "aops_crawler"):
+    """
+    `run_benchmark` once per launch profile (AOPS_LAUNCH_PROFILES), each in its
+    own `workdir/<profile>` with a fresh browser profile and disk cache, against
+    an identical stub tree. Fires with {profile: report}.
+    """
+    reports: Dict[str, Dict[str, Any]] = {}
+    for name in profiles:
+        profile_settings = settings.copy()
+        profile_settings.set("AOPS_LAUNCH_PROFILE", name, priority="cmdline")
+        logger.info(f"[bench] Launch profile {name!r}")
+        reports[name] = yield run_benchmark(
+            profile_settings, stub_config, os.path.join(workdir, name), spider_name=spider_name
+        )
+    return reports
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    def mib(n):
+        return "n/a (install psutil)" if n is None else f"{n / 1048576:.1f} MiB"
+
+    lines = [
+        f"elapsed        {report['elapsed_s']:.1f} s ({report.get('finish_reason')})",
+        f"pages          {report['pages']} / {report['tree_pages']}  "
+        + "  ".join(f"{d}={n}" for d, n in sorted(report["pages_by_driver"].items())),
+        f"posts          {report['posts']} / {report['tree_posts']}",
+        f"pages/min      {report['pages_per_min']}",
+        f"posts/s        {report['posts_per_s']}",
+        f"peak RSS       crawler {mib(report['peak_rss_bytes'])}, browser {mib(report['peak_browser_rss_bytes'])}",
+        f"DB size        {mib(report['db_bytes'])}",
+        f"errors         {report['errors']} logged, {report['download_exceptions']} download exceptions",
+    ]
+    if report.get("latency_ms"):
+        lines.append("latency (ms)   p50 / p95 / p99")
+        for key, q in report["latency_ms"].items():
+            lines.append(f"  {key:<28} {q['p50']:>8} {q['p95']:>8} {q['p99']:>8}")
+    return "\n".join(lines)
+
+
+def format_comparison(reports: Dict[str, Dict[str, Any]]) -> str:
+    """Side-by-side summary of `run_profiles` results."""
+    def mib(n):
+        return "n/a" if n is None else f"{n / 1048576:.0f}"
+
+    def p50(report, key):
+        return report.get("latency_ms", {}).get(key, {}).get("p50", "n/a")
+
+    lines = [
+        f"{'profile':<16} {'elapsed s':>10} {'pages/min':>10} {'posts/s':>8} {'errors':>7} "
+        f"{'rss MiB':>8} {'browser MiB':>12} {'contest p50':>12} {'post p50':>10}"
+    ]
+    for name, report in reports.items():
+        lines.append(
+            f"{name:<16} {report['elapsed_s']:>10} {report['pages_per_min']:>10} {report['posts_per_s']:>8} "
+            f"{report['errors']:>7} {mib(report['peak_rss_bytes']):>8} {mib(report['peak_browser_rss_bytes']):>12} "
+            f"{p50(report, 'contest/fetch'):>12} {p50(report, 'post/fetch'):>10}"
+        )
+    return "\n".join(lines)
+
+
+def write_report(report: Dict[str, Any], path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,576 @@
+import argparse
+import html as html_module
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+__all__ = ["StubConfig", "StubTree", "StubServer", "render_listing", "render_topic"]
+
+ROOT_CONTEST_ID = 13
+_FIRST_CATEGORY_ID = 1000
+_FIRST_TOPIC_ID = 100000
+
+_WORDS = (
+    "let prove that triangle integer prime show find all functions real numbers "
+    "such sum product circle polynomial sequence inequality positive points line "
+    "angle equal divisible maximum minimum solution case hence therefore"
+).split()
+_FORMULAS = (
+    "$x^2+y^2=z^2$", "$\\frac{a}{b}$", "$\\sqrt{2}$", "$a_n = a_{n-1} + a_{n-2}$",
+    "$\\sum_{k=1}^{n} k^2$", "$f(x+y)=f(x)+f(y)$", "$\\angle ABC = 90^\\circ$",
+    "$\\binom{n}{k}$", "$p \\mid n^2+1$", "$\\left(\\frac{a+b}{2}\\right)^2 \\ge ab$",
+)
+
+
+@dataclass
+class StubConfig:
+    """Shape of the synthetic community tree and how slowly it is served."""
+
+    fanout: int = 4                 # sub-folders per folder
+    depth: int = 2                  # folder levels below the contest root
+    threads_per_category: int = 30  # topics in each leaf forum
+    posts_min: int = 2              # posts per topic (at least 2: the crawler waits for a second post)
+    posts_max: int = 40
+    listing_page_size: int = 50     # listing items per XHR page (larger forums take the HTML scroll route)
+    posts_page_size: int = 20       # posts per topic scroll page
+    latency_ms: float = 50.0        # added to every page load and XHR
+    latex_ratio: float = 0.3        # chance a post fragment is a LaTeX image
+    seed: int = 1
+
+
+class StubTree:
+    """Deterministic synthetic contest -> folders -> forums -> topics tree."""
+
+    def __init__(self, config: StubConfig) -> None:
+        self.config = config
+        self.started_at = time.time()
+        self.categories: Dict[int, Dict[str, Any]] = {}
+        self.topics: Dict[int, Dict[str, Any]] = {}
+        rng = random.Random(config.seed)
+        next_category = _FIRST_CATEGORY_ID
+        next_topic = _FIRST_TOPIC_ID
+
+        self.categories[ROOT_CONTEST_ID] = {"id": ROOT_CONTEST_ID, "title": "Contest Collections", "children": [], "topics": []}
+        level = [ROOT_CONTEST_ID]
+        for d in range(1, max(1, config.depth) + 1):
+            next_level = []
+            for parent in level:
+                for _ in range(config.fanout):
+                    cid = next_category
+                    next_category += 1
+                    self.categories[cid] = {
+                        "id": cid,
+                        "title": f"Folder {cid}",
+                        "subtitle": f"Level {d} collection",
+                        "children": [],
+                        "topics": [],
+                    }
+                    self.categories[parent]["children"].append(cid)
+                    next_level.append(cid)
+            level = next_level
+
+        for cid in level:
+            for _ in range(config.threads_per_category):
+                tid = next_topic
+                next_topic += 1
+                num_posts = rng.randint(max(2, config.posts_min), max(2, config.posts_min, config.posts_max))
+                self.topics[tid] = {
+                    "id": tid,
+                    "category_id": cid,
+                    "title": f"Problem {tid}",
+                    "num_posts": num_posts,
+                    "last_post_time": int(self.started_at - rng.randint(0, 90 * 86400)),
+                    "tags": rng.sample(_WORDS, 2),
+                }
+                self.categories[cid]["topics"].append(tid)
+            # Listings show the most recently active topics first
+            self.categories[cid]["topics"].sort(key=lambda t: -self.topics[t]["last_post_time"])
+
+    # ---- listings ----
+    def listing(self, category_id: int) -> List[Dict[str, Any]]:
+        cat = self.categories[category_id]
+        items: List[Dict[str, Any]] = []
+        for cid in cat["children"]:
+            child = self.categories[cid]
+            items.append({
+                "item_id": cid,
+                "item_type": "folder",
+                "item_text": child["title"],
+                "item_subtitle": child.get("subtitle"),
+            })
+        for tid in cat["topics"]:
+            topic = self.topics[tid]
+            items.append({
+                "item_id": tid,
+                "item_type": "post",
+                "item_text": topic["title"],
+                "post_data": {
+                    "post_type": "forum",
+                    "topic_id": tid,
+                    "num_posts": topic["num_posts"],
+                    "last_post_time": topic["last_post_time"],
+                },
+            })
+        return items
+
+    def listing_page(self, category_id: int, start: int) -> Tuple[List[Dict[str, Any]], bool]:
+        items = self.listing(category_id)
+        page = items[start:start + self.config.listing_page_size]
+        return page, start + len(page) >= len(items)
+
+    def contest_page(self, start: int) -> Tuple[List[Dict[str, Any]], bool]:
+        children = self.categories[ROOT_CONTEST_ID]["children"]
+        page = [
+            {"category_id": cid, "category_name": self.categories[cid]["title"]}
+            for cid in children[start:start + self.config.listing_page_size]
+        ]
+        return page, start + len(page) >= len(children)
+
+    # ---- topics ----
+    def post_html(self, topic_id: int, index: int) -> str:
+        """One `div.cmty-post` shaped like the AoPS topic view."""
+        rng = random.Random(topic_id * 1_000_003 + index)
+        parts = []
+        for _ in range(rng.randint(3, 12)):
+            if rng.random() < self.config.latex_ratio:
+                formula = rng.choice(_FORMULAS)
+                parts.append(
+                    f'<img src="/latex/{rng.randrange(1 << 30):x}.png" class="latex" '
+                    f'alt="{html_module.escape(formula, quote=True)}">'
+                )
+            else:
+                parts.append(html_module.escape(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 14)))))
+            if rng.random() < 0.2:
+                parts.append("<br>")
+        if rng.random() < 0.1:
+            parts.append("<i>Source: synthetic</i>")
+        posted = self.topics[topic_id]["last_post_time"] - (self.topics[topic_id]["num_posts"] - index) * 3600
+        created = datetime.fromtimestamp(posted).strftime("%b %d, %Y, %I:%M %p")
+        user_id = rng.randint(1, 50000)
+        return (
+            '<div class="cmty-post">'
+            '<div class="cmty-post-left">'
+            f'<a href="/community/user/{user_id}"><img class="cmty-avatar" src="/avatar/{user_id}.png" alt=""></a>'
+            '</div>'
+            '<div class="cmty-post-middle">'
+            f'<div class="cmty-post-top"><a href="/community/user/{user_id}">user{user_id}</a>'
+            f'<span class="cmty-post-date">{created}</span></div>'
+            f'<div class="cmty-post-body"><div class="cmty-post-html">{" ".join(parts)}</div></div>'
+            '<div class="cmty-post-bottom">'
+            f'<span class="cmty-post-thank-count">{rng.randint(0, 9)}</span>'
+            f'<span class="cmty-post-nothank-count">{rng.randint(0, 2)}</span>'
+            '</div></div></div>'
+        )
+
+    def posts_page(self, topic_id: int, start: int, limit: Optional[int] = None) -> Tuple[str, bool]:
+        total = self.topics[topic_id]["num_posts"]
+        end = min(total, start + (limit or self.config.posts_page_size))
+        return "".join(self.post_html(topic_id, i) for i in range(start, end)), end >= total
+
+    def page_count(self) -> int:
+        return 1 + (len(self.categories) - 1) + len(self.topics)
+
+    def post_count(self) -> int:
+        return sum(t["num_posts"] for t in self.topics.values())
+
+
+_AJAX_JS = """
+function aopsAjax(params) {
+  return fetch('/m/community/ajax.php', {
+    method: 'POST',
+    headers: {'Content-Type': 'application/x-www-form-urlencoded'},
+    body: new URLSearchParams(params).toString(),
+  }).then(r => r.json());
+}
+"""
+
+_LISTING_JS = """
+const CATEGORY_ID = %(category_id)d;
+const IS_CONTEST = %(is_contest)s;
+let start = 0, loading = false, done = false;
+const loader = document.querySelector('.aops-loader');
+const grid = document.querySelector('.cmty-folder-grid');
+const topics = document.querySelector('.cmty-topic-list');
+
+function esc(s) { const d = document.createElement('div'); d.textContent = s == null ? '' : String(s); return d.innerHTML; }
+
+function render(items) {
+  for (const it of items) {
+    if (IS_CONTEST || it.item_type === 'folder') {
+      const id = IS_CONTEST ? it.category_id : it.item_id;
+      const title = IS_CONTEST ? it.category_name : it.item_text;
+      grid.insertAdjacentHTML('beforeend',
+        '<div class="cmty-category-cell cmty-category-cell-folder">' +
+        '<a class="cmty-full-cell-link" href="/community/c' + id + '"></a>' +
+        '<div class="cmty-category-cell-title">' + esc(title) + '</div>' +
+        '<span class="cmty-category-cell-small-desc">' + esc(it.item_subtitle || '') + '</span></div>');
+    } else {
+      topics.insertAdjacentHTML('beforeend',
+        '<div class="cmty-topic-cell"><a href="/community/p' + it.item_id + '">' + esc(it.item_text) + '</a>' +
+        '<span class="cmty-topic-posts">' + it.post_data.num_posts + '</span></div>');
+    }
+  }
+}
+
+function loadMore() {
+  if (loading || done) return;
+  loading = true;
+  loader.style.display = 'block';
+  aopsAjax({a: start === 0 ? 'fetch_category_data' : 'fetch_more_items', category_id: CATEGORY_ID, start: start})
+    .then(j => {
+      const r = j.response || {};
+      const items = IS_CONTEST ? (r.categories || []) : ((r.category || {}).items || []);
+      render(items);
+      start += items.length;
+      done = !!(r.category || {}).no_more_items;
+      loading = false;
+      loader.style.display = 'none';
+      // Keep filling while the page is shorter than the window (no scroll event otherwise)
+      if (!done && document.body.scrollHeight <= window.innerHeight) loadMore();
+    })
+    .catch(() => { loading = false; loader.style.display = 'none'; });
+}
+
+window.addEventListener('scroll', () => {
+  if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 200) loadMore();
+});
+loadMore();
+"""
+
+_TOPIC_JS = """
+const TOPIC_ID = %(topic_id)d;
+let start = %(start)d, loading = false, done = %(done)s;
+const loader = document.querySelector('.aops-loader');
+const scroller = document.querySelector('.cmty-topic-posts-outer-wrapper');
+const posts = document.querySelector('.cmty-topic-posts');
+
+function loadMore() {
+  if (loading || done) return;
+  loading = true;
+  loader.style.display = 'block';
+  aopsAjax({a: 'fetch_more_posts', topic_id: TOPIC_ID, start: start})
+    .then(j => {
+      const r = j.response || {};
+      posts.insertAdjacentHTML('beforeend', r.posts_html || '');
+      start = r.next_start;
+      done = !!r.no_more_posts;
+      loading = false;
+      loader.style.display = 'none';
+    })
+    .catch(() => { loading = false; loader.style.display = 'none'; });
+}
+
+scroller.addEventListener('scroll', () => {
+  if (scroller.scrollTop + scroller.clientHeight >= scroller.scrollHeight - 200) loadMore();
+});
+"""
+
+_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>%(title)s</title>
+<style>
+body { margin: 0; font-family: sans-serif; }
+.cmty-category-cell { height: 80px; margin: 4px; border: 1px solid #ccc; }
+.cmty-topic-cell { height: 40px; border-bottom: 1px solid #eee; }
+.cmty-topic-posts-outer-wrapper { height: 600px; overflow-y: auto; }
+.cmty-post { min-height: 120px; border-bottom: 1px solid #ddd; }
+.aops-loader { display: none; height: 40px; }
+</style></head>
+<body>
+<div id="page">
+  <div class="header"></div>
+  <div class="nav"></div>
+  <div class="main"><div>%(main)s</div></div>
+</div>
+<div class="aops-loader">Loading...</div>
+<script>%(ajax_js)s%(script)s</script>
+</body></html>
+"""
+
+# Laid out so the crawler's XPaths resolve: /html/body/div[1]/div[3]/div/div/div/div[3]
+# for listings and #cmty-topic-view-right == /html/body/div[1]/div[3]/div/div/div[3]
+_LISTING_MAIN = """<div id="community-all"><div class="cmty-category-view">
+<div class="cmty-folder-grid"></div>
+<div class="cmty-category-header"><h1>%(title)s</h1></div>
+<div class="cmty-topic-list"></div>
+</div></div>"""
+
+_TOPIC_MAIN = """<div class="cmty-topic-view">
+<div class="cmty-topic-view-left"></div>
+<div class="cmty-topic-view-middle"></div>
+<div id="cmty-topic-view-right"><div class="cmty-topic-view-inner">
+  <div class="cmty-topic-breadcrumbs"></div>
+  <div class="cmty-topic-jump"></div>
+  <div class="cmty-topic-header">
+    <div class="cmty-topic-title">%(title)s</div>
+    <div class="cmty-topic-meta"><div>
+      <div class="cmty-topic-source"></div>
+      <div class="cmty-topic-tags-wrapper"><div>%(tags)s</div></div>
+    </div></div>
+  </div>
+  <div class="cmty-topic-posts-wrapper"><div>
+    <div class="cmty-topic-posts-top"></div>
+    <div class="cmty-topic-posts-outer-wrapper"><div class="cmty-topic-posts">%(posts)s</div></div>
+  </div></div>
+</div></div>
+</div>"""
+
+
+def _folder_cell_html(item_id: int, title: str, subtitle: Optional[str]) -> str:
+    return (
+        '<div class="cmty-category-cell cmty-category-cell-folder">'
+        f'<a class="cmty-full-cell-link" href="/community/c{item_id}"></a>'
+        f'<div class="cmty-category-cell-title">{html_module.escape(title)}</div>'
+        f'<span class="cmty-category-cell-small-desc">{html_module.escape(subtitle or "")}</span></div>'
+    )
+
+
+def _topic_cell_html(item: Dict[str, Any]) -> str:
+    return (
+        f'<div class="cmty-topic-cell"><a href="/community/p{item["item_id"]}">{html_module.escape(item["item_text"])}</a>'
+        f'<span class="cmty-topic-posts">{item["post_data"]["num_posts"]}</span></div>'
+    )
+
+
+def render_listing(tree: StubTree, category_id: int, prerendered: bool = False) -> str:
+    """Listing page as served (filled in by XHR on scroll) or, with `prerendered`,
+    as the crawler captures it once every page has been scrolled in."""
+    title = html_module.escape(tree.categories[category_id]["title"])
+    main = _LISTING_MAIN % {"title": title}
+    if prerendered:
+        cells, rows = [], []
+        if category_id == ROOT_CONTEST_ID:
+            cells = [
+                _folder_cell_html(cid, tree.categories[cid]["title"], None)
+                for cid in tree.categories[ROOT_CONTEST_ID]["children"]
+            ]
+        else:
+            for item in tree.listing(category_id):
+                if item["item_type"] == "folder":
+                    cells.append(_folder_cell_html(item["item_id"], item["item_text"], item.get("item_subtitle")))
+                else:
+                    rows.append(_topic_cell_html(item))
+        main = main.replace('<div class="cmty-folder-grid"></div>', f'<div class="cmty-folder-grid">{"".join(cells)}</div>')
+        main = main.replace('<div class="cmty-topic-list"></div>', f'<div class="cmty-topic-list">{"".join(rows)}</div>')
+    return _PAGE % {
+        "title": title,
+        "main": main,
+        "ajax_js": _AJAX_JS,
+        "script": _LISTING_JS % {
+            "category_id": category_id,
+            "is_contest": "true" if category_id == ROOT_CONTEST_ID else "false",
+        },
+    }
+
+
+def render_topic(tree: StubTree, topic_id: int, prerendered: bool = False) -> str:
+    """Topic page with its first page of posts or, with `prerendered`, all of them."""
+    topic = tree.topics[topic_id]
+    if prerendered:
+        posts_html, _ = tree.posts_page(topic_id, 0, limit=topic["num_posts"])
+        start, done = topic["num_posts"], True
+    else:
+        posts_html, done = tree.posts_page(topic_id, 0)
+        start = tree.config.posts_page_size
+    tags = "".join(
+        f'<a href="/community/c{topic["category_id"]}"><div class="cmty-item-tag">{html_module.escape(t)}</div></a>'
+        for t in topic["tags"]
+    )
+    title = html_module.escape(topic["title"])
+    return _PAGE % {
+        "title": title,
+        "main": _TOPIC_MAIN % {"title": title, "tags": tags, "posts": posts_html},
+        "ajax_js": _AJAX_JS,
+        "script": _TOPIC_JS % {
+            "topic_id": topic_id,
+            "start": start,
+            "done": "true" if done else "false",
+        },
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "AopsStub/1.0"
+    protocol_version = "HTTP/1.1"
+
+    # Set on the per-server subclass
+    tree: StubTree = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self) -> None:
+        latency = self.tree.config.latency_ms
+        if latency > 0:
+            time.sleep(latency / 1000.0)
+
+    def _send(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload: Dict[str, Any]) -> None:
+        self._send(200, json.dumps(payload).encode("utf-8"), "application/json; charset=utf-8")
+
+    def _send_html(self, html: str, status: int = 200) -> None:
+        self._send(status, html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self._delay()
+        if path.startswith("/community/c") and path[len("/community/c"):].isdigit():
+            return self._listing(int(path[len("/community/c"):]))
+        if path.startswith("/community/p") and path[len("/community/p"):].isdigit():
+            return self._topic(int(path[len("/community/p"):]))
+        if path.endswith(".png"):
+            # Stand-in for LaTeX images / avatars: a 1x1 transparent GIF
+            return self._send(200, b"GIF89a\x01\x00\x01\x00\x00\x00\x00!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x00;", "image/gif")
+        self._send_html("<html><body>Not found</body></html>", status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+        self._delay()
+        if urlparse(self.path).path != "/m/community/ajax.php":
+            return self._send_json({"error_code": "not_found"})
+        try:
+            action = params.get("a")
+            start = int(params.get("start") or 0)
+            if action in ("fetch_category_data", "fetch_more_items"):
+                category_id = int(params["category_id"])
+                if category_id == ROOT_CONTEST_ID:
+                    cats, done = self.tree.contest_page(start)
+                    return self._send_json({"response": {
+                        "categories": cats,
+                        "category": {"category_id": category_id, "items": [], "no_more_items": done},
+                    }})
+                items, done = self.tree.listing_page(category_id, start)
+                return self._send_json({"response": {"category": {
+                    "category_id": category_id,
+                    "category_name": self.tree.categories[category_id]["title"],
+                    "items": items,
+                    "no_more_items": done,
+                }}})
+            if action == "fetch_more_posts":
+                topic_id = int(params["topic_id"])
+                posts_html, done = self.tree.posts_page(topic_id, start)
+                return self._send_json({"response": {
+                    "posts_html": posts_html,
+                    "next_start": start + self.tree.config.posts_page_size,
+                    "no_more_posts": done,
+                }})
+        except (KeyError, ValueError):
+            pass
+        self._send_json({"error_code": "bad_request"})
+
+    def _listing(self, category_id: int) -> None:
+        if category_id not in self.tree.categories:
+            return self._send_html("<html><body>No such category</body></html>", status=404)
+        self._send_html(render_listing(self.tree, category_id))
+
+    def _topic(self, topic_id: int) -> None:
+        if topic_id not in self.tree.topics:
+            return self._send_html("<html><body>No such topic</body></html>", status=404)
+        self._send_html(render_topic(self.tree, topic_id))
+
+
+class StubServer:
+    """
+    Local stand-in for artofproblemsolving.com community pages, for offline
+    benchmarks (see `aops_crawler.bench.runner`).
+
+    Serves `/community/c{id}` listings and `/community/p{id}` topics with the DOM
+    shape the crawler's selectors expect, answers the `fetch_category_data` /
+    `fetch_more_items` / `fetch_more_posts` XHRs on `/m/community/ajax.php`, and
+    loads listings and topics page by page on scroll behind an `.aops-loader`.
+    Contest id 13 is the root of the generated tree.
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.tree = StubTree(config or StubConfig())
+        handler = type("StubHandler", (_Handler,), {"tree": self.tree})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="aops-stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = StubConfig()
+    parser.add_argument("--fanout", type=int, default=defaults.fanout, help="Sub-folders per folder")
+    parser.add_argument("--depth", type=int, default=defaults.depth, help="Folder levels below the contest root")
+    parser.add_argument("--threads", type=int, default=defaults.threads_per_category, help="Topics per leaf forum")
+    parser.add_argument("--posts-min", type=int, default=defaults.posts_min)
+    parser.add_argument("--posts-max", type=int, default=defaults.posts_max)
+    parser.add_argument("--listing-page-size", type=int, default=defaults.listing_page_size, help="Listing items per XHR page")
+    parser.add_argument("--posts-page-size", type=int, default=defaults.posts_page_size, help="Posts per topic scroll page")
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="Delay added to every response")
+    parser.add_argument("--latex-ratio", type=float, default=defaults.latex_ratio)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        fanout=args.fanout,
+        depth=args.depth,
+        threads_per_category=args.threads,
+        posts_min=args.posts_min,
+        posts_max=args.posts_max,
+        listing_page_size=args.listing_page_size,
+        posts_page_size=args.posts_page_size,
+        latency_ms=args.latency_ms,
+        latex_ratio=args.latex_ratio,
+        seed=args.seed,
+    )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve a synthetic AoPS community tree")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+    server = StubServer(config_from_args(args), host=args.host, port=args.port)
+    print(f"Serving {server.tree.page_count()} pages / {server.tree.post_count()} posts at {server.base_url}/community/c{ROOT_CONTEST_ID}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from twisted.internet.defer import Deferred
+from patchright.async_api import async_playwright
+from aops_crawler.utils.async_threads import (
+    run_coro_on_background_loop,
+    start_background_proactor_loop,
+)
+
+__all__ = ["BrowserService", "get_browser_service", "resolve_launch_profile", "split_launch_options"]
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_launch_profile(settings, user_data_dir: str) -> Dict[str, Any]:
+    """
+    Launch options of the `AOPS_LAUNCH_PROFILE` entry of `AOPS_LAUNCH_PROFILES`.
+
+    A profile may set `headless` (overrides AOPS_HEADLESS), `args` (extra
+    Chromium flags), `viewport` ({"width", "height"}; unset keeps the window
+    size), `reduced_motion` and `disk_cache` / `disk_cache_size`. The disk cache
+    lives in AOPS_BROWSER_DISK_CACHE_DIR, or next to the profile directory, so
+    it survives context recycles and profile resets.
+    """
+    name = settings.get("AOPS_LAUNCH_PROFILE") or "default"
+    profiles = settings.getdict("AOPS_LAUNCH_PROFILES")
+    if name not in profiles:
+        raise ValueError(f"Unknown AOPS_LAUNCH_PROFILE {name!r} (known: {', '.join(sorted(profiles))})")
+    options = dict(profiles[name] or {})
+    if options.pop("disk_cache", False):
+        options["disk_cache_dir"] = os.path.abspath(
+            settings.get("AOPS_BROWSER_DISK_CACHE_DIR") or f"{user_data_dir.rstrip('/')}-cache"
+        )
+    options["name"] = name
+    return options
+
+
+def split_launch_options(options: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split launch options into (browser launch kwargs, context kwargs)."""
+    args = list(options.get("args") or [])
+    if options.get("disk_cache_dir"):
+        os.makedirs(options["disk_cache_dir"], exist_ok=True)
+        args.append(f"--disk-cache-dir={options['disk_cache_dir']}")
+        if options.get("disk_cache_size"):
+            args.append(f"--disk-cache-size={int(options['disk_cache_size'])}")
+    launch: Dict[str, Any] = {"args": args} if args else {}
+    context: Dict[str, Any] = {}
+    if options.get("viewport"):
+        context["viewport"] = dict(options["viewport"])
+    else:
+        context["no_viewport"] = True
+    if options.get("reduced_motion"):
+        context["reduced_motion"] = options["reduced_motion"]
+    return launch, context
+
+
+class BrowserService:
+    """
+    Process-wide owner of the Playwright driver and the shared browser context.
+
+    Lives on the persistent background loop and outlives individual crawlers:
+    each crawler's download handler `acquire()`s the context on engine start and
+    `release()`s it on engine stop. With `keep_alive=True` the context stays open
+    between crawl cycles, so cache, cookies and the renderer stay warm and the
+    next cycle skips Chromium cold start. `shutdown()` closes everything.
+    """
+
+    def __init__(self) -> None:
+        self._p_mgr = None
+        self._p = None
+        self._ctx = None
+        self._browser = None  # only used when falling back to non-persistent
+        self._users = 0
+        self._launch_key: Optional[tuple] = None
+        # Serializes launches when several pages find the context gone at once
+        self._launch_lock = asyncio.Lock()
+
+    # ---- lifecycle (all return Deferreds fired on the reactor thread) ----
+    def acquire(self, *, channel: str = "msedge", headless: bool = False, user_data_dir: Optional[str] = None,
+                launch_options: Optional[Dict[str, Any]] = None) -> Deferred:
+        d = start_background_proactor_loop()
+
+        def _after_start(_):
+            return run_coro_on_background_loop(
+                self._acquire(channel, headless, user_data_dir or f"./browser_data/{channel}", launch_options or {})
+            )
+        d.addCallback(_after_start)
+        return d
+
+    def release(self, *, keep_alive: bool = False) -> Deferred:
+        return run_coro_on_background_loop(self._release(keep_alive))
+
+    def shutdown(self) -> Deferred:
+        return run_coro_on_background_loop(self._close())
+
+    def is_live(self, ctx) -> bool:
+        """False once `ctx` was closed or crashed (the service dropped it)."""
+        return ctx is not None and ctx is self._ctx
+
+    async def context_for(self, ctx, *, channel: str = "msedge", headless: bool = False,
+                          user_data_dir: Optional[str] = None, launch_options: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        On the background loop: `ctx` while it is live, else the current context,
+        relaunched if needed. For users that already `acquire()`d; the user count
+        is unchanged.
+        """
+        if self.is_live(ctx):
+            return ctx
+        return await self._ensure_context(
+            channel, headless, user_data_dir or f"./browser_data/{channel}", launch_options or {}
+        )
+
+    # ---- coroutines (run on the background loop) ----
+    async def _acquire(self, channel: str, headless: bool, user_data_dir: str, launch_options: Dict[str, Any]) -> Any:
+        self._users += 1
+        try:
+            return await self._ensure_context(channel, headless, user_data_dir, launch_options)
+        except Exception:
+            self._users = max(0, self._users - 1)
+            raise
+
+    async def _ensure_context(self, channel: str, headless: bool, user_data_dir: str, launch_options: Dict[str, Any]) -> Any:
+        async with self._launch_lock:
+            return await self._launch(channel, headless, user_data_dir, launch_options)
+
+    async def _launch(self, channel: str, headless: bool, user_data_dir: str, launch_options: Dict[str, Any]) -> Any:
+        launch_key = (channel, headless, user_data_dir, json.dumps(launch_options, sort_keys=True))
+        if self._ctx is not None and launch_key != self._launch_key:
+            # Launch options changed between crawlers: recycle the browser
+            logger.info("[BrowserService] Launch options changed; relaunching browser")
+            await self._close_context()
+        if self._ctx is not None:
+            logger.info("[BrowserService] Reusing warm browser context")
+            return self._ctx
+        if self._browser is not None:
+            # Context of the non-persistent fallback crashed: drop its browser too
+            await self._close_context()
+        # Reuse manager if already started
+        if self._p is None:
+            self._p_mgr = async_playwright()
+            self._p = await self._p_mgr.start()
+        launch_kwargs, context_kwargs = split_launch_options(launch_options)
+        logger.info(f"[BrowserService] Launching {channel} with profile {launch_options.get('name', 'default')!r}")
+        # Try to launch persistent context; retry on transient failure
+        for _ in range(2):
+            try:
+                self._ctx = await self._p.chromium.launch_persistent_context(
+                    headless=headless,
+                    channel=channel,
+                    user_data_dir=user_data_dir,
+                    **launch_kwargs,
+                    **context_kwargs,
+                )
+                break
+            except Exception:
+                # small delay and retry
+                await asyncio.sleep(0.5)
+        # Fallback: non-persistent browser/context
+        if self._ctx is None:
+            self._browser = await self._p.chromium.launch(
+                headless=headless,
+                channel=channel,
+                **launch_kwargs,
+            )
+            self._ctx = await self._browser.new_context(**context_kwargs)
+        self._launch_key = launch_key
+        ctx = self._ctx
+
+        def _on_close(*_):
+            # Browser crashed or was closed externally; relaunch on next acquire
+            if self._ctx is ctx:
+                self._ctx = None
+        ctx.on("close", _on_close)
+        return ctx
+
+    async def _release(self, keep_alive: bool) -> None:
+        self._users = max(0, self._users - 1)
+        if self._users > 0:
+            return None
+        if not keep_alive:
+            await self._close_context()
+            return None
+        # Keep the context warm but drop pages leaked by an interrupted cycle
+        ctx = self._ctx
+        if ctx is None:
+            return None
+        for page in list(getattr(ctx, "pages", []) or []):
+            try:
+                await page.close()
+            except Exception:
+                pass
+        return None
+
+    async def _close_context(self) -> None:
+        try:
+            if self._ctx is not None:
+                # Close context more gently
+                try:
+                    await self._ctx.close()
+                except Exception as e:
+                    # Log but don't fail - context might already be closed
+                    logger.warning(f"Warning: Context close failed: {e}")
+        except Exception:
+            pass
+        finally:
+            self._ctx = None
+
+        try:
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception as e:
+                    logger.warning(f"Warning: Browser close failed: {e}")
+        except Exception:
+            pass
+        finally:
+            self._browser = None
+
+    async def _close(self) -> None:
+        self._users = 0
+        await self._close_context()
+        try:
+            if self._p is not None:
+                await self._p.stop()
+        except Exception as e:
+            logger.warning(f"Warning: Playwright stop failed: {e}")
+        finally:
+            self._p_mgr = None
+            self._p = None
+        return None
+
+
+_SERVICE: Optional[BrowserService] = None
+
+
+def get_browser_service() -> BrowserService:
+    """Return the process-wide `BrowserService`, creating it on first use."""
+    global _SERVICE
+    if _SERVICE is None:
+        _SERVICE = BrowserService()
+    return _SERVICE
@@ -0,0 +1,41 @@
+import argparse
+import logging
+import sys
+import time
+
+from scrapy.utils.project import get_project_settings
+from aops_crawler.db.sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+
+def rebuild_rollups(sqlite_path: str) -> None:
+    store = SqliteStore(sqlite_path)
+    store.open()
+    try:
+        started = time.perf_counter()
+        threads, categories = store.rebuild_rollups()
+        store.commit()
+        print(f"Rebuilt rollups for {threads} threads and {categories} categories "
+              f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        store.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Maintenance commands for the crawler's SQLite database")
+    parser.add_argument("--db", default=None, help="database path (default: AOPS_SQLITE_PATH)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild-rollups", help="recompute thread_stats / category_stats from posts and connections")
+    args = parser.parse_args(argv)
+
+    sqlite_path = args.db or get_project_settings().get("AOPS_SQLITE_PATH")
+    if not sqlite_path:
+        parser.error("no --db given and AOPS_SQLITE_PATH is not set")
+    if args.command == "rebuild-rollups":
+        rebuild_rollups(sqlite_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
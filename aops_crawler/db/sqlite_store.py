@@ -1,16 +1,25 @@
+import hashlib
 import os
 import sqlite3
-from typing import Optional
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from aops_crawler.minhash import signature_similarity
 
 
 class SqliteStore:
     def __init__(self, db_path: str) -> None:
         self._db_path = db_path
         self._conn: Optional[sqlite3.Connection] = None
+        # thread_id -> categories above it, for the rollups; dropped when link() adds edges
+        self._ancestors: Dict[int, List[int]] = {}
 
     def open(self) -> None:
         os.makedirs(os.path.dirname(self._db_path), exist_ok=True)
-        self._conn = sqlite3.connect(self._db_path)
+        # Several connections (pipeline, dupefilter, worker processes) share the file:
+        # WAL lets readers run alongside the single writer, timeout waits out write locks
+        self._conn = sqlite3.connect(self._db_path, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode = WAL")
         self._conn.execute("PRAGMA foreign_keys = ON")
         self._create_schema()
 
@@ -75,6 +84,15 @@ class SqliteStore:
             cur.execute("ALTER TABLE posts ADD COLUMN is_first_post BOOLEAN")
         if "source" not in existing_columns:
             cur.execute("ALTER TABLE posts ADD COLUMN source TEXT")
+        if "position" not in existing_columns:
+            cur.execute("ALTER TABLE posts ADD COLUMN position INTEGER")
+        # Re-crawled threads upsert by (thread, position); legacy rows keep NULL positions
+        cur.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_posts_thread_position
+            ON posts(thread_id, position) WHERE position IS NOT NULL
+            """
+        )
         # Remove legacy backfill from unknown 'value' column if present; do not auto-backfill
         # Categories table migrations
         cur.execute("PRAGMA table_info(categories)")
@@ -124,6 +142,213 @@ class SqliteStore:
             ON connections(parent_id, child_id, type_of_child)
             """
         )
+        # Fingerprint of each category's listing (item ids + activity); `since` is when
+        # it last changed, so children fetched after that are known to be current
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS listing_fingerprints (
+                category_id INTEGER PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                since REAL NOT NULL,
+                checked_at REAL NOT NULL
+            )
+            """
+        )
+        # Child -> parent lookups for rollup propagation up the category graph
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_connections_child
+            ON connections(child_id, type_of_child)
+            """
+        )
+        # Seen-store: last fetch time and content hash per (driver, id), used for TTL-based recrawls
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS seen (
+                driver TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                last_fetched REAL NOT NULL,
+                content_hash TEXT,
+                PRIMARY KEY (driver, item_id)
+            )
+            """
+        )
+        cur.execute("PRAGMA table_info(seen)")
+        if "settled_at" not in {row[1] for row in cur.fetchall()}:
+            # Last fetch made during a crawl that ran to completion (see settle_fetches)
+            cur.execute("ALTER TABLE seen ADD COLUMN settled_at REAL")
+        # Lease-based work queue shared by multi-process crawl workers
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS work_queue (
+                driver TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                parent_id INTEGER,
+                priority INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL,
+                PRIMARY KEY (driver, item_id)
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_work_queue_claim
+            ON work_queue(state, priority DESC, lease_until)
+            """
+        )
+        # Crawl frontier: pending requests reduced to what is needed to rebuild them
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS frontier (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                driver TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                parent_id INTEGER,
+                priority INTEGER NOT NULL DEFAULT 0,
+                depth INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (driver, item_id)
+            )
+            """
+        )
+        cur.execute("PRAGMA table_info(frontier)")
+        frontier_columns = {row[1] for row in cur.fetchall()}
+        if "popped_at" not in frontier_columns:
+            # Set while a popped row is in flight; deleted once its response arrives
+            cur.execute("ALTER TABLE frontier ADD COLUMN popped_at REAL")
+        if "retry_meta" not in frontier_columns:
+            # JSON of the retry meta keys (retry counts, resume offsets) of a re-queued request
+            cur.execute("ALTER TABLE frontier ADD COLUMN retry_meta TEXT")
+        cur.execute("DROP INDEX IF EXISTS idx_frontier_pop")
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_frontier_pending
+            ON frontier(priority DESC, seq) WHERE popped_at IS NULL
+            """
+        )
+        # Formula index: each normalized LaTeX string stored once (keyed by its hash)
+        # and mapped to the posts containing it, for exact and prefix lookups
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS formulas (
+                id INTEGER PRIMARY KEY,
+                hash TEXT NOT NULL UNIQUE,
+                latex TEXT NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_formulas_latex ON formulas(latex)")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS post_formulas (
+                post_id INTEGER NOT NULL,
+                formula_id INTEGER NOT NULL,
+                occurrences INTEGER NOT NULL DEFAULT 1,
+                PRIMARY KEY (post_id, formula_id)
+            ) WITHOUT ROWID
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_post_formulas_formula ON post_formulas(formula_id)")
+        # Near-duplicate index over first posts: a MinHash signature per thread and its
+        # LSH band buckets; candidates are found through (band, bucket) lookups only
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS thread_signatures (
+                thread_id INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL,
+                updated_at REAL
+            )
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lsh_buckets (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                thread_id INTEGER NOT NULL,
+                PRIMARY KEY (band, bucket, thread_id)
+            ) WITHOUT ROWID
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_lsh_buckets_thread ON lsh_buckets(thread_id)")
+        # Rollups per thread and per category subtree (every category that reaches the
+        # thread through `connections`), maintained with each post write; *_posters
+        # count posts per user so distinct posters can be kept incrementally
+        for scope, key in (("thread", "thread_id"), ("category", "category_id")):
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {scope}_stats (
+                    {key} INTEGER PRIMARY KEY,
+                    {"thread_count INTEGER NOT NULL DEFAULT 0," if scope == "category" else ""}
+                    post_count INTEGER NOT NULL DEFAULT 0,
+                    first_post_at REAL,
+                    last_post_at REAL,
+                    thanks_total INTEGER NOT NULL DEFAULT 0,
+                    nothanks_total INTEGER NOT NULL DEFAULT 0,
+                    poster_count INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {scope}_posters (
+                    {key} INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    post_count INTEGER NOT NULL,
+                    PRIMARY KEY ({key}, user_id)
+                ) WITHOUT ROWID
+                """
+            )
+        # Change log (CDC): one sequence-numbered row per inserted or actually changed
+        # category, link, tag or post, so consumers read churn instead of rescanning tables.
+        # Filled by triggers, which also covers rows written by other worker processes
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                entity TEXT NOT NULL,
+                entity_id INTEGER NOT NULL,
+                parent_id INTEGER,
+                detail TEXT,
+                op TEXT NOT NULL,
+                changed_at REAL NOT NULL
+            )
+            """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_changes_changed_at ON changes(changed_at)")
+        now = "((julianday('now') - 2440587.5) * 86400.0)"
+        for name, event, when, values in (
+            ("categories_insert", "INSERT ON categories", "",
+             "'category', NEW.id, NULL, NULL, 'insert'"),
+            ("categories_update", "UPDATE ON categories",
+             "WHEN OLD.name IS NOT NEW.name OR OLD.subtitle IS NOT NEW.subtitle"
+             " OR OLD.url IS NOT NEW.url OR OLD.raw_json IS NOT NEW.raw_json",
+             "'category', NEW.id, NULL, NULL, 'update'"),
+            ("connections_insert", "INSERT ON connections", "",
+             "'link', NEW.child_id, NEW.parent_id, NEW.type_of_child, 'insert'"),
+            ("post_tags_insert", "INSERT ON post_tags", "",
+             "'tag', NEW.thread_id, NULL, NEW.tag, 'insert'"),
+            ("posts_insert", "INSERT ON posts", "",
+             "'post', NEW.id, NEW.thread_id, NULL, 'insert'"),
+            ("posts_update", "UPDATE ON posts",
+             "WHEN OLD.user_id IS NOT NEW.user_id OR OLD.created_at IS NOT NEW.created_at"
+             " OR OLD.thanks_count IS NOT NEW.thanks_count OR OLD.nothanks_count IS NOT NEW.nothanks_count"
+             " OR OLD.raw_html IS NOT NEW.raw_html OR OLD.processed_html IS NOT NEW.processed_html"
+             " OR OLD.is_first_post IS NOT NEW.is_first_post",
+             "'post', NEW.id, NEW.thread_id, NULL, 'update'"),
+        ):
+            cur.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS changes_{name} AFTER {event} {when}
+                BEGIN
+                    INSERT INTO changes(entity, entity_id, parent_id, detail, op, changed_at)
+                    VALUES ({values}, {now});
+                END
+                """
+            )
         self._conn.commit()
 
     # --- operations ---
@@ -143,13 +368,34 @@ class SqliteStore:
         )
 
     def link(self, parent_id: Optional[int], child_id: int, type_of_child: Optional[str] = None) -> None:
+        """
+        Record a parent -> child edge. Threads already stored below the child are
+        added to the rollups of the categories the edge newly puts above them.
+        """
         assert self._conn is not None
         if parent_id is None:
             return
-        self._conn.execute(
+        if type_of_child == "post":
+            threads = [child_id]
+        elif type_of_child == "category":
+            threads = self._subtree_threads(child_id)
+        else:
+            threads = []
+        before = {thread_id: set(self._ancestor_categories(thread_id)) for thread_id in threads}
+        cur = self._conn.execute(
             "INSERT OR IGNORE INTO connections(parent_id, child_id, type_of_child) VALUES (?, ?, ?)",
             (parent_id, child_id, type_of_child),
         )
+        if not cur.rowcount:
+            return
+        if type_of_child == "post":
+            self._ancestors.pop(child_id, None)
+        else:
+            self._ancestors.clear()
+        for thread_id, old in before.items():
+            for category_id in self._ancestor_categories(thread_id):
+                if category_id not in old:
+                    self._add_thread_to_category(category_id, thread_id)
 
     def insert_post_message(
         self,
@@ -162,14 +408,253 @@ class SqliteStore:
         processed_html: Optional[str],
         is_first_post: Optional[bool],
         source: Optional[str],
-    ) -> None:
+        position: Optional[int] = None,
+    ) -> int:
+        """Insert or update a message; returns its `posts.id`."""
         assert self._conn is not None
+        if position is None:
+            cur = self._conn.execute(
+                """
+                INSERT INTO posts(thread_id, user_id, created_at, thanks_count, nothanks_count, raw_html, processed_html, is_first_post, source)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (thread_id, user_id, created_at, thanks_count, nothanks_count, raw_html, processed_html, is_first_post, source),
+            )
+            self._update_rollups(thread_id, None, (user_id, created_at, thanks_count, nothanks_count))
+            return cur.lastrowid
+        previous = self._conn.execute(
+            "SELECT user_id, created_at, thanks_count, nothanks_count FROM posts WHERE thread_id = ? AND position = ?",
+            (thread_id, position),
+        ).fetchone()
+        # Positioned messages are upserted so re-fetching a thread does not duplicate rows
+        row = self._conn.execute(
+            """
+            INSERT INTO posts(thread_id, position, user_id, created_at, thanks_count, nothanks_count, raw_html, processed_html, is_first_post, source)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(thread_id, position) WHERE position IS NOT NULL DO UPDATE SET
+                user_id=excluded.user_id,
+                created_at=COALESCE(posts.created_at, excluded.created_at),
+                thanks_count=excluded.thanks_count,
+                nothanks_count=excluded.nothanks_count,
+                raw_html=excluded.raw_html,
+                processed_html=excluded.processed_html,
+                is_first_post=excluded.is_first_post,
+                source=excluded.source
+            RETURNING id
+            """,
+            (thread_id, position, user_id, created_at, thanks_count, nothanks_count, raw_html, processed_html, is_first_post, source),
+        ).fetchone()
+        if previous is not None:
+            created_at = previous[1] if previous[1] is not None else created_at
+        self._update_rollups(thread_id, previous, (user_id, created_at, thanks_count, nothanks_count))
+        return row[0]
+
+    # --- rollups ---
+    def _update_rollups(self, thread_id: int, old: Optional[tuple], new: tuple) -> None:
+        """Apply one post write, (user_id, created_at, thanks, nothanks) before and after,
+        to the thread's rollup and to those of every category above it."""
+        new_post = old is None
+        old = old or (None, None, 0, 0)
+        delta_thanks = (new[2] or 0) - (old[2] or 0)
+        delta_nothanks = (new[3] or 0) - (old[3] or 0)
+        if not new_post and not delta_thanks and not delta_nothanks and old[0] == new[0] and old[1] == new[1]:
+            return
+        new_thread = new_post and self._conn.execute(
+            "SELECT 1 FROM thread_stats WHERE thread_id = ?", (thread_id,)
+        ).fetchone() is None
+        scopes = [("thread", "thread_id", thread_id)]
+        scopes += [("category", "category_id", cid) for cid in self._ancestor_categories(thread_id)]
+        for scope, key, key_id in scopes:
+            posters = 0
+            if old[0] != new[0] or new_post:
+                if not new_post and old[0] is not None:
+                    posters -= self._count_poster(scope, key, key_id, old[0], -1)
+                if new[0] is not None:
+                    posters += self._count_poster(scope, key, key_id, new[0], 1)
+            thread_count = ", thread_count = thread_count + excluded.thread_count" if scope == "category" else ""
+            self._conn.execute(
+                f"""
+                INSERT INTO {scope}_stats({key}, {"thread_count, " if scope == "category" else ""}post_count,
+                    first_post_at, last_post_at, thanks_total, nothanks_total, poster_count)
+                VALUES (?, {"?, " if scope == "category" else ""}?, ?, ?, ?, ?, ?)
+                ON CONFLICT({key}) DO UPDATE SET
+                    post_count = post_count + excluded.post_count,
+                    first_post_at = COALESCE(MIN(first_post_at, excluded.first_post_at), first_post_at, excluded.first_post_at),
+                    last_post_at = COALESCE(MAX(last_post_at, excluded.last_post_at), last_post_at, excluded.last_post_at),
+                    thanks_total = thanks_total + excluded.thanks_total,
+                    nothanks_total = nothanks_total + excluded.nothanks_total,
+                    poster_count = poster_count + excluded.poster_count{thread_count}
+                """,
+                (key_id, *((int(new_thread),) if scope == "category" else ()), int(new_post),
+                 new[1], new[1], delta_thanks, delta_nothanks, posters),
+            )
+
+    def _count_poster(self, scope: str, key: str, key_id: int, user_id: int, delta: int) -> int:
+        """Add `delta` posts by `user_id`; returns 1 when the user appeared or disappeared."""
+        row = self._conn.execute(
+            f"""
+            INSERT INTO {scope}_posters({key}, user_id, post_count) VALUES (?, ?, ?)
+            ON CONFLICT({key}, user_id) DO UPDATE SET post_count = post_count + excluded.post_count
+            RETURNING post_count
+            """,
+            (key_id, user_id, delta),
+        ).fetchone()
+        if row[0] <= 0:
+            self._conn.execute(f"DELETE FROM {scope}_posters WHERE {key} = ? AND user_id = ?", (key_id, user_id))
+            return 1
+        return 1 if delta > 0 and row[0] == delta else 0
+
+    def _ancestor_categories(self, thread_id: int) -> List[int]:
+        cached = self._ancestors.get(thread_id)
+        if cached is not None:
+            return cached
+        ancestors = [
+            row[0]
+            for row in self._conn.execute(
+                """
+                WITH RECURSIVE up(category_id) AS (
+                    SELECT parent_id FROM connections WHERE child_id = ? AND type_of_child = 'post'
+                    UNION
+                    SELECT c.parent_id FROM connections c JOIN up ON c.child_id = up.category_id
+                    WHERE c.type_of_child = 'category'
+                )
+                SELECT category_id FROM up WHERE category_id IS NOT NULL
+                """,
+                (thread_id,),
+            )
+        ]
+        self._ancestors[thread_id] = ancestors
+        return ancestors
+
+    def _subtree_threads(self, category_id: int) -> List[int]:
+        """Threads with stored posts anywhere below `category_id`."""
+        return [
+            row[0]
+            for row in self._conn.execute(
+                """
+                WITH RECURSIVE down(category_id) AS (
+                    SELECT ?
+                    UNION
+                    SELECT c.child_id FROM connections c JOIN down ON c.parent_id = down.category_id
+                    WHERE c.type_of_child = 'category'
+                )
+                SELECT DISTINCT c.child_id FROM connections c JOIN down ON c.parent_id = down.category_id
+                JOIN thread_stats ts ON ts.thread_id = c.child_id
+                WHERE c.type_of_child = 'post'
+                """,
+                (category_id,),
+            )
+        ]
+
+    def _add_thread_to_category(self, category_id: int, thread_id: int) -> None:
+        """Fold a thread's whole rollup into a category it was just linked under."""
+        stats = self._conn.execute(
+            "SELECT post_count, first_post_at, last_post_at, thanks_total, nothanks_total FROM thread_stats WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()
+        if stats is None:
+            return
+        new_posters = self._conn.execute(
+            """
+            SELECT COUNT(*) FROM thread_posters tp WHERE tp.thread_id = ? AND NOT EXISTS (
+                SELECT 1 FROM category_posters cp WHERE cp.category_id = ? AND cp.user_id = tp.user_id
+            )
+            """,
+            (thread_id, category_id),
+        ).fetchone()[0]
+        self._conn.execute(
+            """
+            INSERT INTO category_posters(category_id, user_id, post_count)
+            SELECT ?, user_id, post_count FROM thread_posters WHERE thread_id = ?
+            ON CONFLICT(category_id, user_id) DO UPDATE SET post_count = post_count + excluded.post_count
+            """,
+            (category_id, thread_id),
+        )
         self._conn.execute(
             """
-            INSERT INTO posts(thread_id, user_id, created_at, thanks_count, nothanks_count, raw_html, processed_html, is_first_post, source)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO category_stats(category_id, thread_count, post_count, first_post_at, last_post_at,
+                                       thanks_total, nothanks_total, poster_count)
+            VALUES (?, 1, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(category_id) DO UPDATE SET
+                thread_count = thread_count + 1,
+                post_count = post_count + excluded.post_count,
+                first_post_at = COALESCE(MIN(first_post_at, excluded.first_post_at), first_post_at, excluded.first_post_at),
+                last_post_at = COALESCE(MAX(last_post_at, excluded.last_post_at), last_post_at, excluded.last_post_at),
+                thanks_total = thanks_total + excluded.thanks_total,
+                nothanks_total = nothanks_total + excluded.nothanks_total,
+                poster_count = poster_count + excluded.poster_count
             """,
-            (thread_id, user_id, created_at, thanks_count, nothanks_count, raw_html, processed_html, is_first_post, source),
+            (category_id, *stats, new_posters),
+        )
+
+    def thread_rollup(self, thread_id: int) -> Optional[Dict[str, Any]]:
+        assert self._conn is not None
+        cur = self._conn.execute("SELECT * FROM thread_stats WHERE thread_id = ?", (thread_id,))
+        row = cur.fetchone()
+        return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+    def category_rollup(self, category_id: int) -> Optional[Dict[str, Any]]:
+        """Totals over every thread below `category_id` (its whole subtree)."""
+        assert self._conn is not None
+        cur = self._conn.execute("SELECT * FROM category_stats WHERE category_id = ?", (category_id,))
+        row = cur.fetchone()
+        return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+    def rebuild_rollups(self) -> Tuple[int, int]:
+        """
+        Recompute every rollup from `posts` and `connections`: for databases that
+        predate the rollups, or after links were written by other tools than
+        `link()`. Returns the number of (thread, category) rollup rows written.
+        """
+        assert self._conn is not None
+        for table in ("thread_stats", "thread_posters", "category_stats", "category_posters"):
+            self._conn.execute(f"DELETE FROM {table}")
+        self._conn.execute(
+            """
+            INSERT INTO thread_posters(thread_id, user_id, post_count)
+            SELECT thread_id, user_id, COUNT(*) FROM posts WHERE user_id IS NOT NULL GROUP BY thread_id, user_id
+            """
+        )
+        self._conn.execute(
+            """
+            INSERT INTO thread_stats(thread_id, post_count, first_post_at, last_post_at, thanks_total, nothanks_total, poster_count)
+            SELECT thread_id, COUNT(*), MIN(created_at), MAX(created_at),
+                   COALESCE(SUM(thanks_count), 0), COALESCE(SUM(nothanks_count), 0), COUNT(DISTINCT user_id)
+            FROM posts GROUP BY thread_id
+            """
+        )
+        closure = """
+            WITH RECURSIVE up(thread_id, category_id) AS (
+                SELECT child_id, parent_id FROM connections WHERE type_of_child = 'post'
+                UNION
+                SELECT up.thread_id, c.parent_id FROM connections c JOIN up ON c.child_id = up.category_id
+                WHERE c.type_of_child = 'category'
+            )
+        """
+        self._conn.execute(
+            closure + """
+            INSERT INTO category_posters(category_id, user_id, post_count)
+            SELECT up.category_id, tp.user_id, SUM(tp.post_count)
+            FROM up JOIN thread_posters tp ON tp.thread_id = up.thread_id
+            WHERE up.category_id IS NOT NULL
+            GROUP BY up.category_id, tp.user_id
+            """
+        )
+        self._conn.execute(
+            closure + """
+            INSERT INTO category_stats(category_id, thread_count, post_count, first_post_at, last_post_at,
+                                       thanks_total, nothanks_total, poster_count)
+            SELECT up.category_id, COUNT(*), SUM(ts.post_count), MIN(ts.first_post_at), MAX(ts.last_post_at),
+                   SUM(ts.thanks_total), SUM(ts.nothanks_total),
+                   (SELECT COUNT(*) FROM category_posters cp WHERE cp.category_id = up.category_id)
+            FROM up JOIN thread_stats ts ON ts.thread_id = up.thread_id
+            WHERE up.category_id IS NOT NULL
+            GROUP BY up.category_id
+            """
+        )
+        return (
+            self._conn.execute("SELECT COUNT(*) FROM thread_stats").fetchone()[0],
+            self._conn.execute("SELECT COUNT(*) FROM category_stats").fetchone()[0],
         )
 
     def add_tag(self, thread_id: int, tag: str) -> None:
@@ -179,6 +664,448 @@ class SqliteStore:
             (thread_id, tag),
         )
 
+    # --- formula index ---
+    @staticmethod
+    def formula_hash(latex: str) -> str:
+        return hashlib.sha1(latex.encode("utf-8")).hexdigest()
+
+    def index_post_formulas(self, post_id: int, formulas: List[str]) -> None:
+        """Replace the formulas mapped to `post_id` with `formulas` (normalized LaTeX)."""
+        assert self._conn is not None
+        self._conn.execute("DELETE FROM post_formulas WHERE post_id = ?", (post_id,))
+        if not formulas:
+            return
+        counts: Dict[str, int] = {}
+        for latex in formulas:
+            counts[latex] = counts.get(latex, 0) + 1
+        hashes = {latex: self.formula_hash(latex) for latex in counts}
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO formulas(hash, latex) VALUES (?, ?)",
+            [(h, latex) for latex, h in hashes.items()],
+        )
+        self._conn.executemany(
+            """
+            INSERT INTO post_formulas(post_id, formula_id, occurrences)
+            SELECT ?, id, ? FROM formulas WHERE hash = ?
+            """,
+            [(post_id, counts[latex], h) for latex, h in hashes.items()],
+        )
+
+    def find_formula_posts(self, latex: str, prefix: bool = False, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Posts containing `latex` (normalized as by `pipelines.normalize_formula`),
+        or with `prefix=True` any formula starting with it. Exact lookups go through
+        the hash, prefix lookups through a range scan of the latex index.
+        """
+        assert self._conn is not None
+        if prefix:
+            where, params = "f.latex >= ? AND f.latex < ?", (latex, latex + "\U0010ffff")
+        else:
+            where, params = "f.hash = ?", (self.formula_hash(latex),)
+        rows = self._conn.execute(
+            f"""
+            SELECT p.id, p.thread_id, p.position, f.latex, pf.occurrences
+            FROM formulas f
+            JOIN post_formulas pf ON pf.formula_id = f.id
+            JOIN posts p ON p.id = pf.post_id
+            WHERE {where}
+            ORDER BY p.thread_id, p.position
+            LIMIT ?
+            """,
+            (*params, limit),
+        ).fetchall()
+        return [
+            {"post_id": r[0], "thread_id": r[1], "position": r[2], "latex": r[3], "occurrences": r[4]}
+            for r in rows
+        ]
+
+    # --- near-duplicate index ---
+    def index_thread_signature(self, thread_id: int, signature: bytes, band_keys: List[int]) -> None:
+        """Store (or replace) the MinHash signature and LSH buckets of a thread's first post."""
+        assert self._conn is not None
+        previous = self._conn.execute(
+            "SELECT signature FROM thread_signatures WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        if previous is not None and previous[0] == signature:
+            return
+        self._conn.execute(
+            """
+            INSERT INTO thread_signatures(thread_id, signature, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(thread_id) DO UPDATE SET signature=excluded.signature, updated_at=excluded.updated_at
+            """,
+            (thread_id, signature, time.time()),
+        )
+        self._conn.execute("DELETE FROM lsh_buckets WHERE thread_id = ?", (thread_id,))
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO lsh_buckets(band, bucket, thread_id) VALUES (?, ?, ?)",
+            [(band, key, thread_id) for band, key in enumerate(band_keys)],
+        )
+
+    def near_duplicates(self, thread_id: int, min_similarity: float = 0.5, limit: int = 50) -> List[Tuple[int, float]]:
+        """
+        Threads whose first post is a near duplicate of `thread_id`'s, as
+        (thread_id, estimated Jaccard similarity), most similar first.
+        """
+        assert self._conn is not None
+        row = self._conn.execute(
+            "SELECT signature FROM thread_signatures WHERE thread_id = ?", (thread_id,)
+        ).fetchone()
+        if row is None:
+            return []
+        candidates = self._conn.execute(
+            """
+            SELECT DISTINCT other.thread_id, s.signature
+            FROM lsh_buckets mine
+            JOIN lsh_buckets other ON other.band = mine.band AND other.bucket = mine.bucket
+            JOIN thread_signatures s ON s.thread_id = other.thread_id
+            WHERE mine.thread_id = ? AND other.thread_id != ?
+            """,
+            (thread_id, thread_id),
+        ).fetchall()
+        scored = [(other, signature_similarity(row[0], sig)) for other, sig in candidates]
+        scored = [(other, sim) for other, sim in scored if sim >= min_similarity]
+        scored.sort(key=lambda t: (-t[1], t[0]))
+        return scored[:limit]
+
+    def duplicate_clusters(self, min_similarity: float = 0.5, min_size: int = 2) -> List[List[int]]:
+        """
+        Group all indexed threads into near-duplicate clusters: candidate pairs
+        come from shared LSH buckets, are verified against `min_similarity` and
+        joined transitively. Returns clusters of at least `min_size` thread ids.
+        """
+        assert self._conn is not None
+        parent: Dict[int, int] = {}
+
+        def find(x: int) -> int:
+            while parent.setdefault(x, x) != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        signatures: Dict[int, bytes] = {}
+
+        def signature(thread_id: int) -> bytes:
+            if thread_id not in signatures:
+                signatures[thread_id] = self._conn.execute(
+                    "SELECT signature FROM thread_signatures WHERE thread_id = ?", (thread_id,)
+                ).fetchone()[0]
+            return signatures[thread_id]
+
+        checked = set()
+        buckets = self._conn.execute(
+            """
+            SELECT group_concat(thread_id) FROM lsh_buckets
+            GROUP BY band, bucket HAVING COUNT(*) > 1
+            """
+        )
+        for (members,) in buckets:
+            ids = sorted(int(t) for t in members.split(","))
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:]:
+                    if (a, b) in checked or find(a) == find(b):
+                        continue
+                    checked.add((a, b))
+                    if signature_similarity(signature(a), signature(b)) >= min_similarity:
+                        parent[find(b)] = find(a)
+        clusters: Dict[int, List[int]] = {}
+        for thread_id in list(parent):
+            clusters.setdefault(find(thread_id), []).append(thread_id)
+        return sorted(
+            (sorted(members) for members in clusters.values() if len(members) >= min_size),
+            key=lambda c: (-len(c), c[0]),
+        )
+
+    def get_seen(self, driver: str, item_id: int) -> Optional[Tuple[float, Optional[str]]]:
+        assert self._conn is not None
+        row = self._conn.execute(
+            "SELECT last_fetched, content_hash FROM seen WHERE driver = ? AND item_id = ?",
+            (driver, item_id),
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def get_settled(self, driver: str, item_id: int) -> Optional[float]:
+        assert self._conn is not None
+        row = self._conn.execute(
+            "SELECT settled_at FROM seen WHERE driver = ? AND item_id = ?", (driver, item_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def settle_fetches(self, driver: str, since: float, exclude: Iterable[int] = ()) -> int:
+        """
+        Mark fetches of `driver` made since `since` (the start of a crawl that just
+        finished) as settled: everything they discovered has been fetched too.
+        Ids in `exclude` keep their previous settled time.
+        """
+        assert self._conn is not None
+        self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS unsettled_ids (item_id INTEGER PRIMARY KEY)")
+        self._conn.execute("DELETE FROM unsettled_ids")
+        self._conn.executemany("INSERT OR IGNORE INTO unsettled_ids(item_id) VALUES (?)", ((int(i),) for i in exclude))
+        cur = self._conn.execute(
+            """
+            UPDATE seen SET settled_at = last_fetched
+            WHERE driver = ? AND last_fetched >= ? AND item_id NOT IN (SELECT item_id FROM unsettled_ids)
+            """,
+            (driver, since),
+        )
+        return cur.rowcount
+
+    def check_listing_fingerprint(self, category_id: int, fingerprint: str, now: float) -> Optional[float]:
+        """
+        Record the listing fingerprint of `category_id`. Returns the time since which
+        it has been unchanged, or None when it is new or differs from the stored one.
+        """
+        assert self._conn is not None
+        row = self._conn.execute(
+            "SELECT fingerprint, since FROM listing_fingerprints WHERE category_id = ?", (category_id,)
+        ).fetchone()
+        unchanged = row is not None and row[0] == fingerprint
+        self._conn.execute(
+            """
+            INSERT INTO listing_fingerprints(category_id, fingerprint, since, checked_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(category_id) DO UPDATE SET
+                since=CASE WHEN listing_fingerprints.fingerprint = excluded.fingerprint
+                           THEN listing_fingerprints.since ELSE excluded.since END,
+                fingerprint=excluded.fingerprint,
+                checked_at=excluded.checked_at
+            """,
+            (category_id, fingerprint, now, now),
+        )
+        return row[1] if unchanged else None
+
+    def mark_fetched(self, driver: str, item_id: int, fetched_at: float, content_hash: Optional[str]) -> bool:
+        """Record a fetch; returns True when the content hash differs from the previous fetch."""
+        assert self._conn is not None
+        previous = self.get_seen(driver, item_id)
+        self._conn.execute(
+            """
+            INSERT INTO seen(driver, item_id, last_fetched, content_hash)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(driver, item_id) DO UPDATE SET
+                last_fetched=excluded.last_fetched,
+                content_hash=excluded.content_hash
+            """,
+            (driver, item_id, fetched_at, content_hash),
+        )
+        return previous is None or previous[1] != content_hash
+
+    # --- change log ---
+    def changes_since(self, seq: int, limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Change records with a sequence number above `seq`, oldest first. Consumers
+        keep the last `seq` they processed; entity rows are read back by id
+        (posts.id, categories.id, ...). If `seq` is older than `oldest_change_seq()`
+        the records in between were pruned and the consumer has to rescan once.
+        """
+        assert self._conn is not None
+        rows = self._conn.execute(
+            """
+            SELECT seq, entity, entity_id, parent_id, detail, op, changed_at
+            FROM changes WHERE seq > ? ORDER BY seq LIMIT ?
+            """,
+            (seq, limit),
+        ).fetchall()
+        return [
+            {"seq": r[0], "entity": r[1], "id": r[2], "parent_id": r[3], "detail": r[4], "op": r[5], "changed_at": r[6]}
+            for r in rows
+        ]
+
+    def oldest_change_seq(self) -> Optional[int]:
+        assert self._conn is not None
+        return self._conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+
+    def prune_changes(self, older_than: float) -> int:
+        """Drop change records written before the `older_than` timestamp; returns rows removed."""
+        assert self._conn is not None
+        cur = self._conn.execute("DELETE FROM changes WHERE changed_at < ?", (older_than,))
+        return cur.rowcount
+
+    # --- work queue ---
+    def enqueue_work(self, rows: Iterable[Tuple[str, int, Optional[int], int]], requeue_done_before: Optional[Dict[str, float]] = None) -> int:
+        """
+        Add (driver, item_id, parent_id, priority) rows as pending work. Known rows are
+        left alone, except finished ones older than the per-driver cutoff in
+        `requeue_done_before`, which are made pending again. Returns rows changed.
+        """
+        assert self._conn is not None
+        cutoffs = requeue_done_before or {}
+        now = time.time()
+        changed = 0
+        for driver, item_id, parent_id, priority in rows:
+            cur = self._conn.execute(
+                """
+                INSERT INTO work_queue(driver, item_id, parent_id, priority, state, updated_at)
+                VALUES (?, ?, ?, ?, 'pending', ?)
+                ON CONFLICT(driver, item_id) DO UPDATE SET
+                    state='pending', owner=NULL, lease_until=NULL, attempts=0,
+                    parent_id=excluded.parent_id, priority=excluded.priority, updated_at=excluded.updated_at
+                WHERE work_queue.state = 'done' AND work_queue.updated_at < ?
+                """,
+                (driver, item_id, parent_id, priority, now, cutoffs.get(driver, float("-inf"))),
+            )
+            changed += cur.rowcount
+        return changed
+
+    def claim_work(self, owner: str, limit: int, lease_seconds: float, max_attempts: int = 3) -> List[Dict[str, Any]]:
+        """
+        Atomically lease up to `limit` rows to `owner`: lease-expired rows (their
+        worker died) first, then pending rows. Each set is read through
+        `idx_work_queue_claim` in priority order with its own LIMIT, so claiming
+        never sorts the queue.
+        """
+        assert self._conn is not None
+        now = time.time()
+        claimed = []
+        # Both updates run in one transaction (committed below), so no other worker interleaves
+        for condition, args in (
+            ("state = 'leased' AND lease_until < ?", (now,)),
+            ("state = 'pending'", ()),
+        ):
+            if len(claimed) >= limit:
+                break
+            claimed += self._conn.execute(
+                f"""
+                UPDATE work_queue SET
+                    state='leased', owner=?, lease_until=?, attempts=attempts + 1, updated_at=?
+                WHERE rowid IN (
+                    SELECT rowid FROM work_queue
+                    WHERE {condition} AND attempts < ?
+                    ORDER BY priority DESC
+                    LIMIT ?
+                )
+                RETURNING driver, item_id, parent_id, priority, attempts
+                """,
+                (owner, now + lease_seconds, now, *args, max_attempts, limit - len(claimed)),
+            ).fetchall()
+        self._conn.commit()
+        claimed.sort(key=lambda r: -r[3])
+        return [
+            {"driver": r[0], "id": r[1], "parent_id": r[2], "priority": r[3], "attempts": r[4]}
+            for r in claimed
+        ]
+
+    def heartbeat_work(self, owner: str, keys: Iterable[Tuple[str, int]], lease_seconds: float) -> None:
+        assert self._conn is not None
+        until = time.time() + lease_seconds
+        self._conn.executemany(
+            "UPDATE work_queue SET lease_until = ? WHERE driver = ? AND item_id = ? AND owner = ? AND state = 'leased'",
+            [(until, driver, item_id, owner) for driver, item_id in keys],
+        )
+
+    def complete_work(self, owner: str, driver: str, item_id: int) -> None:
+        assert self._conn is not None
+        self._conn.execute(
+            "UPDATE work_queue SET state='done', owner=NULL, lease_until=NULL, updated_at=? WHERE driver = ? AND item_id = ? AND owner = ?",
+            (time.time(), driver, item_id, owner),
+        )
+
+    def release_work(self, owner: str, driver: str, item_id: int, failed: bool = False, max_attempts: int = 3) -> None:
+        """Give a lease back; failed rows that used up their attempts become 'failed'."""
+        assert self._conn is not None
+        self._conn.execute(
+            """
+            UPDATE work_queue SET
+                state=CASE WHEN ? AND attempts >= ? THEN 'failed' ELSE 'pending' END,
+                attempts=CASE WHEN ? THEN attempts ELSE MAX(attempts - 1, 0) END,
+                owner=NULL, lease_until=NULL, updated_at=?
+            WHERE driver = ? AND item_id = ? AND owner = ?
+            """,
+            (failed, max_attempts, failed, time.time(), driver, item_id, owner),
+        )
+
+    def expire_work(self, max_attempts: int = 3) -> int:
+        """Return expired leases to the queue, or mark them failed after `max_attempts`."""
+        assert self._conn is not None
+        cur = self._conn.execute(
+            """
+            UPDATE work_queue SET
+                state=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                owner=NULL, lease_until=NULL, updated_at=?
+            WHERE state = 'leased' AND lease_until < ?
+            """,
+            (max_attempts, time.time(), time.time()),
+        )
+        return cur.rowcount
+
+    def work_counts(self) -> Dict[str, int]:
+        assert self._conn is not None
+        return {
+            state: count
+            for state, count in self._conn.execute("SELECT state, COUNT(*) FROM work_queue GROUP BY state")
+        }
+
+    # --- crawl frontier ---
+    def push_frontier(self, rows: List[Tuple[str, int, Optional[int], int, int, Optional[str]]]) -> int:
+        """
+        Batch-insert (driver, item_id, parent_id, priority, depth, retry_meta) rows.
+        Already queued entries are deduplicated and only ever raised in priority; a
+        row with `retry_meta` re-arms its in-flight entry with that meta. Returns
+        rows that became pending.
+        """
+        assert self._conn is not None
+        cur = self._conn.executemany(
+            """
+            INSERT OR IGNORE INTO frontier(driver, item_id, parent_id, priority, depth, retry_meta)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        added = cur.rowcount
+        if added < len(rows):
+            retries = [(r[3], r[5], r[0], r[1]) for r in rows if r[5] is not None]
+            if retries:
+                added += self._conn.executemany(
+                    """
+                    UPDATE frontier SET popped_at = NULL, priority = ?, retry_meta = ?
+                    WHERE driver = ? AND item_id = ? AND popped_at IS NOT NULL
+                    """,
+                    retries,
+                ).rowcount
+            self._conn.executemany(
+                """
+                UPDATE frontier SET priority = ?
+                WHERE driver = ? AND item_id = ? AND priority < ? AND popped_at IS NULL
+                """,
+                [(r[3], r[0], r[1], r[3]) for r in rows],
+            )
+        return added
+
+    def pop_frontier(self, limit: int, now: float) -> List[Tuple[str, int, Optional[int], int, int, Optional[str]]]:
+        """
+        Mark up to `limit` highest-priority pending rows as in flight (oldest first
+        within a priority) and return them. They stay in the table until
+        `ack_frontier`, or are handed out again after `rearm_frontier`.
+        """
+        assert self._conn is not None
+        rows = self._conn.execute(
+            """
+            UPDATE frontier SET popped_at = ? WHERE seq IN (
+                SELECT seq FROM frontier WHERE popped_at IS NULL ORDER BY priority DESC, seq LIMIT ?
+            )
+            RETURNING seq, driver, item_id, parent_id, priority, depth, retry_meta
+            """,
+            (now, limit),
+        ).fetchall()
+        rows.sort(key=lambda r: (-r[4], r[0]))
+        return [r[1:] for r in rows]
+
+    def ack_frontier(self, keys: List[Tuple[str, int]]) -> int:
+        """Delete the in-flight rows of fetched (driver, item_id) pairs."""
+        assert self._conn is not None
+        cur = self._conn.executemany(
+            "DELETE FROM frontier WHERE driver = ? AND item_id = ? AND popped_at IS NOT NULL", keys
+        )
+        return cur.rowcount
+
+    def rearm_frontier(self) -> int:
+        """Make every in-flight row pending again (after a crash or shutdown)."""
+        assert self._conn is not None
+        return self._conn.execute("UPDATE frontier SET popped_at = NULL WHERE popped_at IS NOT NULL").rowcount
+
+    def frontier_size(self) -> int:
+        """Number of pending (not in-flight) rows."""
+        assert self._conn is not None
+        return self._conn.execute("SELECT COUNT(*) FROM frontier WHERE popped_at IS NULL").fetchone()[0]
+
     def commit(self) -> None:
         assert self._conn is not None
         self._conn.commit()
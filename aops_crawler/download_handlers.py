@@ -1,19 +1,24 @@
  
 
+from twisted.internet import defer, reactor, task
 from twisted.internet.defer import Deferred
+from scrapy.exceptions import IgnoreRequest
 from scrapy.core.downloader.handlers.http import HTTPDownloadHandler
 from scrapy.http import Request
 from scrapy import signals
 from scrapy.utils.defer import deferred_from_coro
 from scrapy.utils.reactor import verify_installed_reactor
+from aops_crawler.archive import ResponseArchive
+from aops_crawler.backpressure import ByteBudget
 from aops_crawler.single_page import crawl_contest_page, crawl_category, crawl_post
-from patchright.async_api import async_playwright
-from aops_crawler.utils.async_threads import (
-    run_coro_on_background_loop,
-    start_background_proactor_loop,
-)
+from aops_crawler.browser_service import get_browser_service, resolve_launch_profile
+from aops_crawler.ratelimit import RateLimiter
+from aops_crawler.utils.async_threads import run_coro_on_background_loop
+from aops_crawler.utils.timing import record_interval, span
+from aops_crawler.utils.trace import set_track
 import logging
 import asyncio
+import time
 __all__ = ["ScrapyPatchrightDownloadHandler"]
 
 logger = logging.getLogger(__name__)
@@ -36,11 +41,29 @@ class ScrapyPatchrightDownloadHandler(HTTPDownloadHandler):
 
         crawler.signals.connect(self._engine_started, signal=signals.engine_started)
         crawler.signals.connect(self._engine_stopped, signal=signals.engine_stopped)
-        # shared browser context created on engine start and reused across requests
+        # shared browser context handed out by the BrowserService on engine start
         self._shared_ctx = None
-        self._browser = None  # only used when falling back to non-persistent
         self._browser_channel = crawler.settings.get("AOPS_BROWSER_CHANNEL", "msedge")
         self._headless = crawler.settings.getbool("AOPS_HEADLESS", False)
+        # Persistent profile directory; multi-process workers each get their own
+        self._user_data_dir = crawler.settings.get("AOPS_BROWSER_USER_DATA_DIR") or f"./browser_data/{self._browser_channel}"
+        # Chromium flags, viewport and disk cache of the AOPS_LAUNCH_PROFILE
+        self._launch_options = resolve_launch_profile(crawler.settings, self._user_data_dir)
+        self._headless = self._launch_options.pop("headless", self._headless)
+        # Keep the browser running between crawler instances (warm restarts)
+        self._keep_alive = crawler.settings.getbool("AOPS_BROWSER_KEEPALIVE", False)
+        # "record": archive every rendered response; "replay": serve them back, no browser
+        self._record_mode = (crawler.settings.get("AOPS_RECORD_MODE") or "").lower() or None
+        if self._record_mode not in (None, "off", "record", "replay"):
+            raise ValueError(f"Unknown AOPS_RECORD_MODE {self._record_mode!r}")
+        if self._record_mode == "off":
+            self._record_mode = None
+        self._archive_dir = crawler.settings.get("AOPS_ARCHIVE_DIR") or "./browser_data/archive"
+        self._archive = None
+        # Token bucket per driver (AOPS_RATE_LIMITS), shared by every page of the context
+        self._limiter = RateLimiter.from_settings(crawler.settings)
+        # Downloaded bytes not yet through spider and pipeline (AOPS_BYTE_BUDGET)
+        self._budget = ByteBudget.from_crawler(crawler)
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -51,113 +74,170 @@ class ScrapyPatchrightDownloadHandler(HTTPDownloadHandler):
         return deferred_from_coro(coro)
 
     def _engine_started(self) -> Deferred:
-        # Start a persistent Proactor loop and a single shared browser context
-        def _launch():
-            async def _run():
-                # Reuse manager if already started
-                if getattr(self, "_p", None) is None:
-                    p_mgr = async_playwright()
-                    self._p_mgr = p_mgr
-                    self._p = await p_mgr.start()
-                # If context already exists, nothing to do
-                if self._shared_ctx is not None:
-                    return None
-                # Try to launch persistent context; retry on transient failure
-                for _ in range(2):
-                    try:
-                        self._shared_ctx = await self._p.chromium.launch_persistent_context(
-                            headless=self._headless,
-                            channel=self._browser_channel,
-                            no_viewport=True,
-                            user_data_dir=f"./browser_data/{self._browser_channel}",
-                        )
-                        break
-                    except Exception:
-                        # small delay and retry
-                        import asyncio as _a
-                        await _a.sleep(0.5)
-                # Fallback: non-persistent browser/context
-                if self._shared_ctx is None:
-                    self._browser = await self._p.chromium.launch(
-                        headless=self._headless,
-                        channel=self._browser_channel,
-                    )
-                    self._shared_ctx = await self._browser.new_context(no_viewport=True)
-                return None
-            return run_coro_on_background_loop(_run())
-        # ensure loop is running first
-        d1 = start_background_proactor_loop()
-        def _after_start(_):
-            return _launch()
-        d1.addCallback(_after_start)
-        return d1
+        if self._record_mode is not None:
+            self._archive = ResponseArchive(self._archive_dir)
+            self._archive.open()
+            logger.info(f"[DownloadHandler] {self._record_mode} mode, archive at {self._archive_dir}")
+        if self._record_mode == "replay":
+            return None
+        # Borrow the shared browser context from the process-wide service;
+        # it is only launched when no warm context survives from a previous cycle
+        d = get_browser_service().acquire(
+            channel=self._browser_channel,
+            headless=self._headless,
+            user_data_dir=self._user_data_dir,
+            launch_options=self._launch_options,
+        )
+
+        def _set_ctx(ctx):
+            self._shared_ctx = ctx
+            return None
+        d.addCallback(_set_ctx)
+        return d
 
     def _engine_stopped(self) -> Deferred:
-        # Close shared context; keep background loop alive to avoid WinError 995
-        async def _close():
-            try:
-                if self._shared_ctx is not None:
-                    # Close context more gently
-                    try:
-                        await self._shared_ctx.close()
-                    except Exception as e:
-                        # Log but don't fail - context might already be closed
-                        logger.warning(f"Warning: Context close failed: {e}")
-            except Exception:
-                pass
-            finally:
-                self._shared_ctx = None
-                
-            try:
-                if self._browser is not None:
-                    try:
-                        await self._browser.close()
-                    except Exception as e:
-                        logger.warning(f"Warning: Browser close failed: {e}")
-            except Exception:
-                pass
-            finally:
-                self._browser = None
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+        if self._record_mode == "replay":
+            return None
+        # Hand the context back; with AOPS_BROWSER_KEEPALIVE it stays open for the
+        # next crawler. Background loop is kept alive either way to avoid WinError 995
+        self._shared_ctx = None
+        return get_browser_service().release(keep_alive=self._keep_alive)
+
+    @staticmethod
+    def _begin_trace(request, driver, submitted_at):
+        # Runs first inside the background-loop task: give this page its own trace
+        # track and record the hop from the reactor thread into the loop
+        set_track(f"{driver} {request.meta.get('id')}")
+        record_interval("thread_hop", submitted_at, time.perf_counter(), driver, url=request.url)
+
+    async def _wait_for_context(self, driver):
+        # wait until shared context is ready
+        with span("wait_context", driver):
+            while self._shared_ctx is None:
+                await asyncio.sleep(0.05)
+            service = get_browser_service()
+            if not service.is_live(self._shared_ctx):
+                # Closed or crashed mid-cycle: retries must not reuse the dead context
+                logger.warning("[DownloadHandler] Browser context is closed; relaunching")
+                self._shared_ctx = await service.context_for(
+                    self._shared_ctx,
+                    channel=self._browser_channel,
+                    headless=self._headless,
+                    user_data_dir=self._user_data_dir,
+                    launch_options=self._launch_options,
+                )
+        return self._shared_ctx
+
+    def _reserve_rate(self, driver):
+        # Runs on the reactor thread: take the token now, wait for it where the fetch runs
+        ready_at = self._limiter.reserve(driver)
+        if ready_at is None:
             return None
-        return run_coro_on_background_loop(_close())
+        stats = self._crawler.stats
+        wait = ready_at - time.monotonic()
+        if wait > 0:
+            stats.inc_value(f"aops/ratelimit/{driver}/delayed")
+            stats.inc_value(f"aops/ratelimit/{driver}/wait_seconds", round(wait, 3))
+        stats.set_value(f"aops/ratelimit/{driver}/tokens", round(self._limiter.levels()[driver], 2))
+        return ready_at
+
+    async def _wait_for_token(self, driver, ready_at):
+        if ready_at is None:
+            return
+        with span("rate_wait", driver):
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    def _record(self, response, request, driver):
+        try:
+            with span("archive_put", driver):
+                self._archive.put(driver, request.meta["id"], response)
+        except Exception as e:
+            logger.warning(f"[DownloadHandler] Failed to archive {driver} {request.meta.get('id')}: {e}")
+        return response
+
+    def _replay(self, request, driver) -> Deferred:
+        with span("archive_get", driver):
+            response = self._archive.get(driver, request.meta["id"], url=request.url)
+        if response is None:
+            return defer.fail(IgnoreRequest(f"{driver} {request.meta.get('id')} not in archive {self._archive_dir}"))
+        return defer.succeed(response)
 
     # ---- Scrapy entry point ----
     def download_request(self, request: Request, spider) -> Deferred:
         driver = request.meta.get("driver", "http")
         logger.debug(f"[DownloadHandler] driver={driver} url={request.url}")
+        if driver in ("contest", "category", "post") and request.meta.get("id") is not None:
+            if self._record_mode == "replay":
+                return self._replay(request, driver)
+            # Backpressure: lease no new page while the responses still queued for the
+            # spider and pipeline are over the byte budget
+            d = self._budget.when_available()
+            d.addCallback(lambda _: self._fetch_page(request, spider, driver))
+            d.addCallback(self._budget.hold)
+            return d
+        return self._download_with_browser(request, spider, driver)
+
+    def _fetch_page(self, request: Request, spider, driver) -> Deferred:
+        d = self._download_with_browser(request, spider, driver)
+        if self._record_mode == "record":
+            d.addCallback(self._record, request, driver)
+        return d
+
+    def _download_with_browser(self, request: Request, spider, driver) -> Deferred:
+        submitted_at = time.perf_counter()
+        ready_at = self._reserve_rate(driver)
         if driver == "contest":
             async def _run():
-                # import asyncio
-                # wait until shared context is ready
-                while self._shared_ctx is None:
-                    await asyncio.sleep(0.05)
-                return await crawl_contest_page(
-                    request.url,
-                    browser=self._shared_ctx,
-                )
+                # time spent queued for a worker thread before reaching the background loop
+                self._begin_trace(request, driver, submitted_at)
+                await self._wait_for_token(driver, ready_at)
+                browser = await self._wait_for_context(driver)
+                # Past the token, budget and context waits: what AIMD times as latency
+                request.meta["fetch_started"] = time.perf_counter()
+                with span("fetch", driver):
+                    return await crawl_contest_page(
+                        request.url,
+                        browser=browser,
+                    )
             return run_coro_on_background_loop(_run())
         if driver == "category":
             async def _run():
-                # import asyncio
-                while self._shared_ctx is None:
-                    await asyncio.sleep(0.05)
-                return await crawl_category(
-                    request.url,
-                    browser=self._shared_ctx,
-                )
+                self._begin_trace(request, driver, submitted_at)
+                await self._wait_for_token(driver, ready_at)
+                browser = await self._wait_for_context(driver)
+                request.meta["fetch_started"] = time.perf_counter()
+                with span("fetch", driver):
+                    return await crawl_category(
+                        request.url,
+                        browser=browser,
+                        watermark=request.meta.get("activity_watermark"),
+                    )
             return run_coro_on_background_loop(_run())
         if driver == "post":
             async def _run():
-                # import asyncio
-                while self._shared_ctx is None:
-                    await asyncio.sleep(0.05)
-                return await crawl_post(
-                    request.url,
-                    browser=self._shared_ctx,
-                )
+                self._begin_trace(request, driver, submitted_at)
+                await self._wait_for_token(driver, ready_at)
+                browser = await self._wait_for_context(driver)
+                request.meta["fetch_started"] = time.perf_counter()
+                with span("fetch", driver):
+                    return await crawl_post(
+                        request.url,
+                        browser=browser,
+                        resume_from=request.meta.get("resume_from", 0),
+                        resume_url=request.meta.get("resume_url"),
+                        resume_post_id=request.meta.get("resume_post_id"),
+                    )
             return run_coro_on_background_loop(_run())
 
         # unknown -> fallback
+        delay = ready_at - time.monotonic() if ready_at is not None else 0
+        if delay > 0:
+            return task.deferLater(reactor, delay, super().download_request, request, spider)
         return super().download_request(request, spider)
 # class ScrapyPatchrightDownloadHandler(HTTPDownloadHandler):
 #     def download_request(self, request, spider):
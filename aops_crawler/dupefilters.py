@@ -1,5 +1,6 @@
 import os
-from typing import Optional
+import time
+from typing import Dict, Optional, Set, Tuple
 import logging
 
 from scrapy.dupefilters import RFPDupeFilter
@@ -18,19 +19,30 @@ class LinkingDupeFilter(RFPDupeFilter):
 
     Expects requests to carry `meta["id"]` (child id) and
     `meta["parent_id"]` (parent id), as used by the project's spiders.
+
+    When `AOPS_SEEN_TTL` configures a TTL (seconds) for a request's driver,
+    freshness comes from the SQLite seen-store instead of the fingerprint set:
+    a (driver, id) is only let through again once its last fetch is older
+    than the TTL, so recrawl cycles revisit stale pages only. A request whose
+    `meta["listed_activity"]` (the topic's last activity in the listing it came
+    from) is newer than its last fetch is let through regardless of the TTL.
     """
 
-    def __init__(self, path: Optional[str] = None, debug: bool = False, sqlite_path: Optional[str] = None, fingerprinter=None, **kwargs) -> None:
+    def __init__(self, path: Optional[str] = None, debug: bool = False, sqlite_path: Optional[str] = None, fingerprinter=None, seen_ttl: Optional[Dict[str, float]] = None, **kwargs) -> None:
         # Pass through Scrapy's expected args (including fingerprinter)
         super().__init__(path=path, debug=debug, fingerprinter=fingerprinter)
         # Optional DB usage in background thread
         self._sqlite_path: Optional[str] = sqlite_path
         self._store = None
+        # Per-driver TTLs; drivers without an entry keep fingerprint semantics
+        self._seen_ttl: Dict[str, float] = {str(k): float(v) for k, v in (seen_ttl or {}).items()}
+        # (driver, id) pairs let through during this run, so they are not scheduled twice
+        self._scheduled: Set[Tuple[str, int]] = set()
         # Where to write dupe logs
         self._log_path = os.path.join("test", "dupefilter.log")
 
     @classmethod
-    def from_settings(cls, settings):
+    def from_settings(cls, settings, fingerprinter=None):
         # Mirror RFPDupeFilter's settings handling while adding sqlite path
         debug = settings.getbool("DUPEFILTER_DEBUG")
         jobdir = settings.get("JOBDIR")
@@ -38,7 +50,12 @@ class LinkingDupeFilter(RFPDupeFilter):
         fp_store_path = os.path.join(jobdir, "requests.seen") if jobdir else None
 
         sqlite_path = settings.get("AOPS_SQLITE_PATH")
-        return cls(path=fp_store_path, debug=debug, sqlite_path=sqlite_path)
+        seen_ttl = settings.getdict("AOPS_SEEN_TTL")
+        return cls(path=fp_store_path, debug=debug, sqlite_path=sqlite_path, fingerprinter=fingerprinter, seen_ttl=seen_ttl)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls.from_settings(crawler.settings, fingerprinter=crawler.request_fingerprinter)
 
     def open(self):
         # Initialize parent (fingerprint persistence if any)
@@ -78,8 +95,39 @@ class LinkingDupeFilter(RFPDupeFilter):
         except Exception:
             return None
 
+    def _seen_key(self, request) -> Optional[Tuple[str, int]]:
+        driver = request.meta.get("driver")
+        item_id = request.meta.get("id")
+        if self._store is None or driver not in self._seen_ttl or item_id is None:
+            return None
+        try:
+            return str(driver), int(item_id)
+        except (TypeError, ValueError):
+            return None
+
+    def _fresh_seen(self, key: Tuple[str, int], listed_activity: Optional[float] = None) -> bool:
+        if key in self._scheduled:
+            return True
+        try:
+            row = self._store.get_seen(*key)
+        except Exception as e:
+            logger.warning(f"[DupeFilter] Seen-store lookup failed for {key}: {e}")
+            row = None
+        if (
+            row is not None
+            and time.time() - row[0] < self._seen_ttl[key[0]]
+            and (listed_activity is None or listed_activity <= row[0])
+        ):
+            return True
+        self._scheduled.add(key)
+        return False
+
     def request_seen(self, request):
-        seen = super().request_seen(request)
+        key = self._seen_key(request)
+        seen = (
+            self._fresh_seen(key, request.meta.get("listed_activity"))
+            if key is not None else super().request_seen(request)
+        )
         if seen:
             # Duplicate detected: append to log file in test/dupefilter.log
             try:
@@ -0,0 +1,49 @@
+from typing import Optional
+
+__all__ = [
+    "FetchError",
+    "NavigationTimeout",
+    "SelectorMissing",
+    "ContextCrashed",
+    "RateLimited",
+]
+
+
+class FetchError(Exception):
+    """
+    A browser fetch (`single_page.crawl_*`) that failed.
+
+    `stage` is the step that failed (goto, scroll, ...). When the page had
+    already loaded part of its content, `partial` holds a response built from
+    it (flagged "partial") and `loaded` the number of posts/items it contains,
+    so the retry can keep that work and resume instead of starting over. For
+    topics, `resume_url` opens the topic at the last loaded post
+    (`resume_post_id`), where the retry continues scrolling.
+    """
+
+    def __init__(self, message: str = "", *, url: Optional[str] = None, stage: Optional[str] = None,
+                 partial=None, loaded: int = 0, resume_url: Optional[str] = None,
+                 resume_post_id: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.url = url
+        self.stage = stage
+        self.partial = partial
+        self.loaded = loaded
+        self.resume_url = resume_url
+        self.resume_post_id = resume_post_id
+
+
+class NavigationTimeout(FetchError):
+    """The page, or the XHR carrying its data, did not load in time."""
+
+
+class SelectorMissing(FetchError):
+    """The page loaded but an element the crawler waits for never appeared."""
+
+
+class ContextCrashed(FetchError):
+    """The page, browser context or browser went away mid-fetch."""
+
+
+class RateLimited(FetchError):
+    """The site answered 429 Too Many Requests."""
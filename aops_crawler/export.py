@@ -0,0 +1,189 @@
+import gzip
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+try:
+    import zstandard  # optional: smaller and much faster than gzip
+except Exception:  # pragma: no cover
+    zstandard = None
+try:
+    import pyarrow  # optional: Parquet output
+    import pyarrow.parquet as pyarrow_parquet
+except Exception:  # pragma: no cover
+    pyarrow = None
+    pyarrow_parquet = None
+
+__all__ = ["ExportSink", "POST_FIELDS"]
+
+logger = logging.getLogger(__name__)
+
+# One exported record per post message, in column order
+POST_FIELDS = [
+    ("thread_id", "int64"),
+    ("category_id", "int64"),
+    ("position", "int32"),
+    ("is_first_post", "bool"),
+    ("user_id", "int64"),
+    ("created_text", "string"),
+    ("created_at", "float64"),
+    ("thanks_count", "int32"),
+    ("nothanks_count", "int32"),
+    ("raw_html", "string"),
+    ("processed_html", "string"),
+    ("source", "string"),
+    ("fetched_at", "float64"),
+]
+
+
+class _JsonlFile:
+    """Appends each batch as its own zstd frame / gzip member, so the file is
+    a valid stream after every flush and readable with plain zstdcat/zcat."""
+
+    def __init__(self, path: str) -> None:
+        self.suffix = ".jsonl.zst" if zstandard is not None else ".jsonl.gz"
+        self.path = path + self.suffix
+        self._fh = open(self.path + ".tmp", "wb")
+        self._cctx = zstandard.ZstdCompressor(level=3) if zstandard is not None else None
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        if self._cctx is not None:
+            self._fh.write(self._cctx.compress(data))
+        else:
+            self._fh.write(gzip.compress(data, compresslevel=6))
+        self._fh.flush()
+
+    def size(self) -> int:
+        return self._fh.tell()
+
+    def close(self) -> None:
+        self._fh.close()
+        os.replace(self.path + ".tmp", self.path)
+
+
+class _ParquetFile:
+    """One Parquet row group per batch."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path + ".parquet"
+        self._schema = pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in POST_FIELDS])
+        self._writer = pyarrow_parquet.ParquetWriter(self.path + ".tmp", self._schema, compression="zstd")
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        table = pyarrow.Table.from_pylist(records, schema=self._schema)
+        self._writer.write_table(table)
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path + ".tmp")
+        except OSError:
+            return 0
+
+    def close(self) -> None:
+        self._writer.close()
+        os.replace(self.path + ".tmp", self.path)
+
+
+class ExportSink:
+    """
+    Buffered, append-only export of structured records for downstream jobs.
+
+    `write()` only appends to an in-memory batch (reactor thread); full
+    batches are written by a single background thread so the pipeline never
+    blocks on compression or disk. Files land in `root/cycle=<cycle>/` as
+    `part-<n>.jsonl.zst` (gzip without `zstandard`) or `part-<n>.parquet`
+    (one row group per batch, needs `pyarrow`), and roll over once they reach
+    `roll_bytes` or `roll_seconds`. A file keeps a `.tmp` suffix until it is
+    rolled or the sink is closed, so consumers can pick up every file without it.
+    """
+
+    def __init__(self, root: str, cycle: str, fmt: str = "jsonl", batch_size: int = 500,
+                 roll_bytes: int = 64 * 1024 * 1024, roll_seconds: float = 600.0, stats=None) -> None:
+        if fmt not in ("jsonl", "parquet"):
+            raise ValueError(f"Unknown export format {fmt!r}")
+        if fmt == "parquet" and pyarrow is None:
+            logger.warning("[Export] pyarrow is not installed; exporting JSONL instead of Parquet")
+            fmt = "jsonl"
+        self.fmt = fmt
+        self.directory = os.path.join(root, f"cycle={cycle}")
+        self._batch_size = max(1, int(batch_size))
+        self._roll_bytes = roll_bytes
+        self._roll_seconds = roll_seconds
+        self._stats = stats
+        self._buffer: List[Dict[str, Any]] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Writer-thread state
+        self._file = None
+        self._file_opened_at = 0.0
+        self._part = 0
+
+    def open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Continue numbering after parts written by an earlier crawler in the same cycle
+        existing = [n for n in os.listdir(self.directory) if n.startswith("part-")]
+        self._part = len(existing)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aops-export")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._buffer.append(record)
+        if len(self._buffer) >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Hand the buffered records to the writer thread."""
+        if not self._buffer or self._executor is None:
+            return
+        batch, self._buffer = self._buffer, []
+        self._executor.submit(self._write_batch, batch)
+
+    def close(self) -> None:
+        if self._executor is None:
+            return
+        self.flush()
+        self._executor.submit(self._close_file)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    # ---- writer thread ----
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            if self._file is not None and (
+                self._file.size() >= self._roll_bytes
+                or time.monotonic() - self._file_opened_at >= self._roll_seconds
+            ):
+                self._close_file()
+            if self._file is None:
+                self._open_file()
+            self._file.write(batch)
+            self._inc("aops/export/records", len(batch))
+        except Exception as e:
+            logger.warning(f"[Export] Failed to write {len(batch)} records: {e}")
+            self._inc("aops/export/errors")
+
+    def _open_file(self) -> None:
+        path = os.path.join(self.directory, f"part-{self._part:05d}")
+        self._part += 1
+        self._file = _ParquetFile(path) if self.fmt == "parquet" else _JsonlFile(path)
+        self._file_opened_at = time.monotonic()
+
+    def _close_file(self) -> None:
+        if self._file is None:
+            return
+        try:
+            size = self._file.size()
+            self._file.close()
+            self._inc("aops/export/files")
+            self._inc("aops/export/bytes", size)
+            logger.info(f"[Export] Wrote {self._file.path} ({size} bytes)")
+        except Exception as e:
+            logger.warning(f"[Export] Failed to finish {self._file.path}: {e}")
+        finally:
+            self._file = None
+
+    def _inc(self, key: str, count: int = 1) -> None:
+        if self._stats is not None:
+            self._stats.inc_value(key, count)
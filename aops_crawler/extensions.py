@@ -0,0 +1,135 @@
+import logging
+import os
+import time
+from typing import Optional
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from aops_crawler.utils.timing import get_recorder, mark
+from aops_crawler.utils.trace import start_tracing, stop_tracing
+
+__all__ = ["LatencyStatsExtension", "TraceExtension"]
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStatsExtension:
+    """
+    Publishes the per-stage latency histograms recorded by `utils.timing.span`
+    (browser fetch stages, download handler, pipeline steps).
+
+    Every `AOPS_LATENCY_EXPORT_INTERVAL` seconds, and once more on close, the
+    p50/p95/p99 of each (driver, stage) go into the stats collector as
+    `aops/latency/<driver>/<stage>/<quantile>_ms`, and the full histograms are
+    written to `AOPS_LATENCY_PROM_FILE` in Prometheus text format (for the
+    node_exporter textfile collector).
+
+    The recorder is process-wide, so it is reset when the engine starts:
+    run.py recrawl cycles share one process and each crawl reports only its
+    own timings.
+    """
+
+    def __init__(self, crawler, interval: float, prom_file: Optional[str]) -> None:
+        self._crawler = crawler
+        self._interval = interval
+        self._prom_file = prom_file
+        self._task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("AOPS_LATENCY_ENABLED", True):
+            get_recorder().enabled = False
+            raise NotConfigured
+        get_recorder().enabled = True
+        ext = cls(
+            crawler,
+            interval=settings.getfloat("AOPS_LATENCY_EXPORT_INTERVAL", 30.0),
+            prom_file=settings.get("AOPS_LATENCY_PROM_FILE"),
+        )
+        crawler.signals.connect(ext.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def engine_started(self):
+        get_recorder().reset()
+
+    def spider_opened(self, spider):
+        self._task = task.LoopingCall(self.export)
+        self._task.start(self._interval, now=False)
+
+    def spider_closed(self, spider):
+        try:
+            if self._task is not None and self._task.running:
+                self._task.stop()
+        except Exception:
+            pass
+        self.export()
+
+    def export(self):
+        recorder = get_recorder()
+        stats = self._crawler.stats
+        try:
+            for (stage, driver), summary in recorder.snapshot().items():
+                prefix = f"aops/latency/{driver}/{stage}"
+                stats.set_value(f"{prefix}/count", summary["count"])
+                for q in ("p50", "p95", "p99"):
+                    stats.set_value(f"{prefix}/{q}_ms", round(summary[q] * 1000.0, 1))
+        except Exception as e:
+            logger.warning(f"[Latency] Failed to push stats: {e}")
+        if not self._prom_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._prom_file) or ".", exist_ok=True)
+            tmp_path = f"{self._prom_file}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(recorder.prometheus_text())
+            # Atomic swap so scrapers never read a half-written file
+            os.replace(tmp_path, self._prom_file)
+        except Exception as e:
+            logger.warning(f"[Latency] Failed to write {self._prom_file}: {e}")
+
+
+class TraceExtension:
+    """
+    Optional Chrome trace-event recorder (`AOPS_TRACE_FILE`), for offline
+    profiling in Perfetto.
+
+    While enabled, every `span()` (scheduling, dupefilter, thread hop into the
+    background loop, page lease, navigation, scroll, response wrap, pipeline
+    parse and DB flush) becomes a timeline event, plus instant events for
+    engine signals. `{cycle}` in the path is replaced by the crawl start time so
+    each run.py cycle writes its own file.
+    """
+
+    def __init__(self, crawler, path: str) -> None:
+        self._crawler = crawler
+        self._path = path
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("AOPS_TRACE_FILE")
+        if not path:
+            raise NotConfigured
+        ext = cls(crawler, path)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        path = self._path.replace("{cycle}", time.strftime("%Y%m%d-%H%M%S"))
+        start_tracing(path)
+        logger.info(f"[Trace] Recording crawl timeline to {path}")
+
+    def spider_closed(self, spider):
+        stop_tracing()
+
+    def request_reached_downloader(self, request, spider):
+        mark("downloader", request.meta.get("driver"), id=request.meta.get("id"))
+
+    def response_received(self, response, request, spider):
+        mark("response", request.meta.get("driver"), id=request.meta.get("id"), bytes=len(response.body))
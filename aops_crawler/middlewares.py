@@ -3,11 +3,56 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import hashlib
+import json
+import logging
+import time
+
+import scrapy
 from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from twisted.internet import reactor, task
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from aops_crawler.db.sqlite_store import SqliteStore
+from aops_crawler.errors import FetchError
+from aops_crawler.items import CategoryItem
+from aops_crawler.pipelines import extract_post_fields, select_posts
+from aops_crawler.single_page import FOLDER_GRID_XPATH
+try:
+    import psutil  # optional: CPU / memory pressure for AdaptiveConcurrencyMiddleware
+except Exception:  # pragma: no cover
+    psutil = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _content_hash(driver, response) -> str:
+    """
+    Hash of what the pipeline reads from a page rather than of its whole body,
+    whose chrome (relative times, view counts) changes on every render: the
+    posts of a topic without their dates, the items of a category's JSON
+    listing, or the folder grid of its HTML route. Falls back to the body when
+    none of these is found.
+    """
+    content = None
+    try:
+        if driver == "post":
+            content = [extract_post_fields(post)[1:] for post in select_posts(response)]
+        elif b"application/json" in (response.headers.get(b"Content-Type") or b"").lower():
+            listing = json.loads(response.body.decode("utf-8")).get("first_filtered") or {}
+            content = (((listing.get("response_json") or {}).get("response") or {}).get("category") or {}).get("items")
+        else:
+            content = response.xpath(FOLDER_GRID_XPATH).getall()
+    except Exception as e:
+        logger.debug(f"[SeenStore] Falling back to the body hash of {response.url}: {e}")
+    if not content:
+        return hashlib.sha1(response.body).hexdigest()
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
 
 class AopsCrawlerSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -53,48 +98,559 @@ class AopsCrawlerSpiderMiddleware:
         spider.logger.info("Spider opened: %s" % spider.name)
 
 
-class AopsCrawlerDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+class ListingFingerprintSpiderMiddleware:
+    """
+    Skips unchanged subtrees on revalidation crawls.
+
+    `parse_category` leaves a fingerprint of the listing (item ids with their
+    last activity / post counts) in `response.meta`. When it matches the one
+    stored for the category, the children it covers are dropped from the
+    callback output, requests and `CategoryItem`s alike, as long as they were
+    fetched after the listing last changed. Folders must have been fetched in
+    a crawl that settled them (see `SeenStoreDownloaderMiddleware`), i.e. one
+    that also fetched their subtree: a skipped folder is never fetched, so
+    everything below it is skipped as well. Runs before the
+    work-queue middleware so skipped children are not enqueued either.
+    """
+
+    def __init__(self, crawler, sqlite_path):
+        self._crawler = crawler
+        self._sqlite_path = sqlite_path
+        self._store = None
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        if not crawler.settings.getbool("AOPS_LISTING_FINGERPRINTS", True):
+            raise NotConfigured
+        s = cls(crawler, crawler.settings.get("AOPS_SQLITE_PATH"))
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
+    def _skippable(self, response):
+        fingerprint = response.meta.get("listing_fingerprint")
+        category_id = response.meta.get("id")
+        if self._store is None or fingerprint is None or category_id is None or "partial" in response.flags:
+            return set()
+        try:
+            since = self._store.check_listing_fingerprint(int(category_id), fingerprint, time.time())
+            self._store.commit()
+            if since is None:
+                return set()
+            self._crawler.stats.inc_value("aops/listing/unchanged")
+            skip = set()
+            for driver, item_id in response.meta.get("listing_children") or ():
+                if driver == "category":
+                    fetched = self._store.get_settled(driver, int(item_id))
+                else:
+                    seen = self._store.get_seen(driver, int(item_id))
+                    fetched = seen[0] if seen is not None else None
+                if fetched is not None and fetched >= since:
+                    skip.add((driver, int(item_id)))
+            return skip
+        except Exception as e:
+            logger.warning(f"[ListingFingerprint] Failed to check category {category_id}: {e}")
+            return set()
+
+    async def process_spider_output(self, response, result, spider):
+        skip = None
+        async for r in result:
+            if skip is None:
+                # The callback sets the fingerprint before its first yield
+                skip = self._skippable(response)
+            if skip:
+                if isinstance(r, scrapy.Request):
+                    key = (r.meta.get("driver"), r.meta.get("id"))
+                elif isinstance(r, CategoryItem):
+                    key = ("category", r.get("category_id"))
+                else:
+                    key = None
+                if key in skip:
+                    if isinstance(r, scrapy.Request):
+                        self._crawler.stats.inc_value(f"aops/listing/skipped/{key[0]}")
+                    continue
+            yield r
+
+    def spider_opened(self, spider):
+        if not self._sqlite_path:
+            return
+        try:
+            self._store = SqliteStore(self._sqlite_path)
+            self._store.open()
+        except Exception as e:
+            logger.warning(f"[ListingFingerprint] Failed to open SqliteStore: {e}")
+            self._store = None
+
+    def spider_closed(self, spider):
+        try:
+            if self._store is not None:
+                self._store.close()
+        except Exception:
+            pass
+        finally:
+            self._store = None
+
+
+class _DriverWindow:
+    __slots__ = ("window", "min", "max", "target_latency", "in_flight",
+                 "latencies", "errors", "saturated")
+
+    def __init__(self, initial, minimum, maximum, target_latency):
+        self.window = float(initial)
+        self.min = minimum
+        self.max = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        # Samples of the current adjustment interval
+        self.latencies = []
+        self.errors = 0
+        self.saturated = False
+
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    AIMD limit on in-flight browser pages per download driver.
+
+    The scheduler asks `admit()` before handing out a request; requests of a
+    driver whose window is full are held back there, before they take one of
+    the downloader's CONCURRENT_REQUESTS slots, so a backlog of one driver
+    never blocks the others. Requests that reach the downloader without going
+    through the scheduler are counted in `process_request`. Every
+    `AOPS_AIMD_INTERVAL` seconds each window is re-evaluated from the samples
+    of the interval: it shrinks multiplicatively (`AOPS_AIMD_DECREASE`) when the
+    timeout/error rate exceeds `AOPS_AIMD_MAX_ERROR_RATE`, the p90 latency
+    exceeds the driver's `target_latency`, or (with psutil) the CPU / memory
+    use of the browser process tree (every process started below the crawler:
+    the Playwright driver and the browser) is above
+    `AOPS_AIMD_MAX_CPU_PERCENT` (of all cores) / `AOPS_AIMD_MAX_MEMORY_PERCENT`
+    (of RAM); otherwise it grows by `AOPS_AIMD_INCREASE` if the window was
+    actually saturated.
+    Latency counts from `meta["fetch_started"]`, set by the download handler
+    after its rate-limit, byte-budget and context waits, so the window reacts
+    to the site rather than to the crawler's own throttling.
+    Current windows are published as `aops/aimd/<driver>/window` stats.
+    """
+
+    DEFAULT_DRIVERS = {
+        "contest": {"initial": 1, "min": 1, "max": 2, "target_latency": 30.0},
+        "category": {"initial": 2, "min": 1, "max": 8, "target_latency": 20.0},
+        "post": {"initial": 4, "min": 1, "max": 16, "target_latency": 20.0},
+    }
+
+    def __init__(self, crawler, drivers, interval=10.0, increase=1.0, decrease=0.5,
+                 max_error_rate=0.05, max_cpu_percent=90.0, max_memory_percent=90.0):
+        self._crawler = crawler
+        self._windows = {}
+        for driver, defaults in self.DEFAULT_DRIVERS.items():
+            conf = dict(defaults)
+            conf.update((drivers or {}).get(driver) or {})
+            self._windows[driver] = _DriverWindow(conf["initial"], conf["min"], conf["max"], conf["target_latency"])
+        self._interval = interval
+        self._increase = increase
+        self._decrease = decrease
+        self._max_error_rate = max_error_rate
+        self._max_cpu = max_cpu_percent
+        self._max_memory = max_memory_percent
+        self._task = None
+        # psutil.Process per pid of the browser tree, kept so cpu_percent() measures since the last call
+        self._procs = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("AOPS_AIMD_ENABLED", True):
+            raise NotConfigured
+        s = cls(
+            crawler,
+            drivers=settings.getdict("AOPS_AIMD_DRIVERS"),
+            interval=settings.getfloat("AOPS_AIMD_INTERVAL", 10.0),
+            increase=settings.getfloat("AOPS_AIMD_INCREASE", 1.0),
+            decrease=settings.getfloat("AOPS_AIMD_DECREASE", 0.5),
+            max_error_rate=settings.getfloat("AOPS_AIMD_MAX_ERROR_RATE", 0.05),
+            max_cpu_percent=settings.getfloat("AOPS_AIMD_MAX_CPU_PERCENT", 90.0),
+            max_memory_percent=settings.getfloat("AOPS_AIMD_MAX_MEMORY_PERCENT", 90.0),
+        )
+        # Read by SqliteFrontierScheduler to hold back requests of full windows
+        crawler.aops_concurrency = s
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def admit(self, request):
+        """Take a slot in the request's driver window; False (and nothing taken) while it is full."""
+        state = self._windows.get(request.meta.get("driver"))
+        if state is None or request.meta.get("aimd_slot"):
+            return True
+        if state.in_flight >= int(state.window):
+            state.saturated = True
+            return False
+        state.in_flight += 1
+        request.meta["aimd_slot"] = time.perf_counter()
+        return True
+
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+        state = self._windows.get(request.meta.get("driver"))
+        if state is not None and not request.meta.get("aimd_slot"):
+            # Not admitted by the scheduler (e.g. engine.download()): count it anyway
+            state.in_flight += 1
+            request.meta["aimd_slot"] = time.perf_counter()
         return None
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+        # 429/503 mean the site is pushing back, count them like timeouts
+        self._release(request, failed=response.status in (429, 503))
         return response
 
     def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+        self._release(request, failed=not isinstance(exception, IgnoreRequest))
+        return None
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+    def _release(self, request, failed):
+        started = request.meta.pop("aimd_slot", None)
+        # Set by the download handler once its own throttling waits are over
+        fetch_started = request.meta.pop("fetch_started", None)
+        state = self._windows.get(request.meta.get("driver"))
+        if started is None or state is None:
+            return
+        if failed:
+            state.errors += 1
+        else:
+            state.latencies.append(time.perf_counter() - (fetch_started or started))
+        state.in_flight -= 1
+
+    def _browser_usage(self):
+        """(CPU % of all cores, % of RAM) used by the processes below the crawler."""
+        cpu = 0.0
+        rss = 0
+        procs = {}
+        for proc in psutil.Process().children(recursive=True):
+            cached = self._procs.get(proc.pid)
+            if cached is not None and cached.is_running():
+                proc = cached
+            try:
+                cpu += proc.cpu_percent(interval=None)
+                rss += proc.memory_info().rss
+            except psutil.Error:
+                continue
+            procs[proc.pid] = proc
+        self._procs = procs
+        return cpu / (psutil.cpu_count() or 1), 100.0 * rss / psutil.virtual_memory().total
+
+    def _pressure(self):
+        if psutil is None:
+            return None
+        try:
+            cpu, memory = self._browser_usage()
+        except Exception:
+            return None
+        if cpu > self._max_cpu or memory > self._max_memory:
+            return f"browser cpu {cpu:.0f}%, memory {memory:.0f}%"
+        return None
+
+    def adjust(self):
+        pressure = self._pressure()
+        stats = self._crawler.stats
+        for driver, state in self._windows.items():
+            samples = len(state.latencies) + state.errors
+            old = state.window
+            reason = None
+            if samples:
+                error_rate = state.errors / samples
+                p90 = sorted(state.latencies)[int(0.9 * (len(state.latencies) - 1))] if state.latencies else 0.0
+                if error_rate > self._max_error_rate:
+                    reason = f"errors {state.errors}/{samples}"
+                elif p90 > state.target_latency:
+                    reason = f"p90 {p90:.1f}s > {state.target_latency:.0f}s"
+                elif pressure is not None:
+                    reason = pressure
+                if reason is not None:
+                    state.window = max(float(state.min), state.window * self._decrease)
+                elif state.saturated:
+                    state.window = min(float(state.max), state.window + self._increase)
+            if int(state.window) != int(old):
+                logger.info(f"[AIMD] {driver} window {int(old)} -> {int(state.window)}" + (f" ({reason})" if reason else ""))
+            state.latencies = []
+            state.errors = 0
+            # Set again by admit() while the scheduler holds requests back
+            state.saturated = False
+            stats.set_value(f"aops/aimd/{driver}/window", int(state.window))
+            stats.max_value(f"aops/aimd/{driver}/max_window", int(state.window))
 
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        if psutil is not None:
+            try:
+                self._browser_usage()  # prime the per-process CPU counters
+            except Exception:
+                pass
+        for driver, state in self._windows.items():
+            self._crawler.stats.set_value(f"aops/aimd/{driver}/window", int(state.window))
+        self._task = task.LoopingCall(self.adjust)
+        self._task.start(self._interval, now=False)
+
+    def spider_closed(self, spider):
+        try:
+            if self._task is not None and self._task.running:
+                self._task.stop()
+        except Exception:
+            pass
+
+
+class ClassifiedRetryMiddleware:
+    """
+    Retries the typed `FetchError`s raised by the browser download handler with
+    a policy per error class (`AOPS_RETRY_POLICY`: max_retries, and an
+    exponential backoff of `backoff * factor ** attempt` seconds capped at
+    `max_backoff`). Other exceptions are left to Scrapy's RetryMiddleware.
+
+    When the failed fetch salvaged a partial response (a topic that scrolled
+    for minutes before a selector timed out), that response goes on to the
+    spider right away, so its posts are stored, and the retry is re-queued after
+    the backoff with `meta["resume_from"]` set to the number of posts already
+    loaded and `meta["resume_url"]` opening the topic at the last of them. Other retries are also re-queued after the backoff, rather than
+    waited out in the middleware, so they do not hold a downloader slot.
+    """
+
+    DEFAULT_POLICY = {
+        "NavigationTimeout": {"max_retries": 3, "backoff": 5.0, "factor": 2.0, "max_backoff": 120.0},
+        "SelectorMissing": {"max_retries": 2, "backoff": 2.0, "factor": 2.0, "max_backoff": 30.0},
+        "ContextCrashed": {"max_retries": 3, "backoff": 10.0, "factor": 2.0, "max_backoff": 120.0},
+        "RateLimited": {"max_retries": 6, "backoff": 60.0, "factor": 2.0, "max_backoff": 900.0},
+        "FetchError": {"max_retries": 2, "backoff": 5.0, "factor": 2.0, "max_backoff": 60.0},
+    }
+
+    def __init__(self, crawler, policy=None):
+        self._crawler = crawler
+        self._policy = {name: dict(conf) for name, conf in self.DEFAULT_POLICY.items()}
+        for name, conf in (policy or {}).items():
+            self._policy.setdefault(name, dict(self.DEFAULT_POLICY["FetchError"])).update(conf)
+        self._scheduled = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler, crawler.settings.getdict("AOPS_RETRY_POLICY"))
+        crawler.signals.connect(s.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def _policy_for(self, error):
+        for cls in type(error).__mro__:
+            if cls.__name__ in self._policy:
+                return self._policy[cls.__name__]
+        return self._policy["FetchError"]
+
+    def process_exception(self, request, exception, spider):
+        if not isinstance(exception, FetchError):
+            return None
+        stats = self._crawler.stats
+        name = type(exception).__name__
+        driver = request.meta.get("driver")
+        stats.inc_value(f"aops/fetch_error/{name}")
+        policy = self._policy_for(exception)
+        retries = request.meta.get("aops_retry_times", 0)
+        if retries >= policy["max_retries"]:
+            stats.inc_value(f"aops/retry/{name}/gave_up")
+            logger.warning(f"[Retry] Giving up on {driver} {request.meta.get('id')} after {retries} retries: {exception}")
+            # Whatever was loaded is still better than nothing
+            return exception.partial
+
+        delay = min(policy["max_backoff"], policy["backoff"] * policy["factor"] ** retries)
+        meta = dict(request.meta)
+        meta["aops_retry_times"] = retries + 1
+        if exception.partial is not None and driver == "post" and exception.loaded >= meta.get("resume_from", 0):
+            meta["resume_from"] = exception.loaded
+            meta["resume_url"] = exception.resume_url
+            meta["resume_post_id"] = exception.resume_post_id
+        retry = request.replace(meta=meta, dont_filter=True)
+        stats.inc_value(f"aops/retry/{name}/count")
+        logger.info(
+            f"[Retry] {name} on {driver} {request.meta.get('id')} ({exception}); "
+            f"retry {retries + 1}/{policy['max_retries']} in {delay:.0f}s"
+            + (f", keeping {exception.loaded} loaded" if exception.partial is not None else "")
+        )
+        if exception.partial is not None:
+            stats.inc_value("aops/retry/partial_salvaged")
+            self._schedule(retry, delay)
+            # Not done yet: the work queue keeps its lease until the retry's response
+            request.meta["retry_pending"] = True
+            return exception.partial
+        if delay <= 0:
+            return retry
+        # Wait out the backoff outside the downloader, so the slot is free meanwhile
+        self._schedule(retry, delay)
+        request.meta["retry_pending"] = True
+        raise IgnoreRequest(f"{name} on {driver} {request.meta.get('id')}: retry scheduled in {delay:.0f}s")
+
+    def _schedule(self, request, delay):
+        def _crawl():
+            self._scheduled.discard(call)
+            if self._crawler.engine.running:
+                self._crawler.engine.crawl(request)
+        call = reactor.callLater(delay, _crawl)
+        self._scheduled.add(call)
+
+    def spider_idle(self, spider):
+        # Retries waiting out their backoff still count as pending work
+        if self._scheduled:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        for call in list(self._scheduled):
+            if call.active():
+                call.cancel()
+        self._scheduled.clear()
+
+
+class SeenStoreDownloaderMiddleware:
+    """
+    Records every successful fetch of a (driver, id) request in the SQLite
+    seen-store: fetch time and a hash of its content (`_content_hash`).
+    `LinkingDupeFilter` reads these rows to decide when a page is stale enough
+    to refetch.
+
+    Sets `meta["content_unchanged"]` when the content hash matches the
+    previous fetch so downstream consumers can skip reparsing.
+
+    Before a category is downloaded, its last settled fetch time (minus
+    `AOPS_WATERMARK_SLACK`) is set as `meta["activity_watermark"]`, so
+    `crawl_category` stops loading topics that were inactive since then. A
+    fetch is settled once the crawl it was made in closes as "finished" and
+    everything it listed is up to date: every topic with activity newer than
+    the topic's last fetch (`meta["listed_activity"]`) and every subfolder
+    without a settled fetch were fetched in that crawl, and those subfolders
+    were settled in turn. Watermarking from the latest fetch would hide
+    topics that an interrupted crawl discovered, or whose retries gave up,
+    but that were never fetched; `ListingFingerprintSpiderMiddleware` relies
+    on the same guarantee to skip whole subtrees. The watermark is added here
+    rather than by the spider so scheduled requests keep only the frontier's
+    compact meta.
+    """
+
+    def __init__(self, sqlite_path=None, watermark_slack=None):
+        self._sqlite_path = sqlite_path
+        self._watermark_slack = watermark_slack
+        self._store = None
+        self._opened_at = None
+        # (driver, id) listed but not up to date in this crawl -> categories that listed them
+        self._owed = {}
+        # Category id -> categories that listed it in this crawl, to hold back ancestors too
+        self._category_parents = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        slack = crawler.settings.getfloat("AOPS_WATERMARK_SLACK", 3600.0)
+        s = cls(
+            crawler.settings.get("AOPS_SQLITE_PATH"),
+            slack if crawler.settings.getbool("AOPS_CATEGORY_WATERMARK", True) else None,
+        )
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(s.request_scheduled, signal=signals.request_scheduled)
+        return s
+
+    def request_scheduled(self, request, spider):
+        # Fired before the dupefilter runs, so pages also listed elsewhere in this crawl count too
+        driver = request.meta.get("driver")
+        item_id = request.meta.get("id")
+        parent_id = request.meta.get("parent_id")
+        if self._store is None or driver not in ("category", "post") or item_id is None or parent_id is None:
+            return
+        key = (driver, int(item_id))
+        if driver == "category":
+            self._category_parents.setdefault(key[1], set()).add(int(parent_id))
+        try:
+            owed = self._is_owed(key, request.meta.get("listed_activity"))
+        except Exception as e:
+            logger.warning(f"[SeenStore] Failed to read {driver}:{item_id}: {e}")
+            owed = True
+        if owed:
+            self._owed.setdefault(key, set()).add(int(parent_id))
+
+    def _is_owed(self, key, listed_activity):
+        seen = self._store.get_seen(*key)
+        if seen is None:
+            return True
+        if seen[0] >= self._opened_at:
+            # Already fetched in this crawl
+            return False
+        if key[0] == "post":
+            return listed_activity is not None and seen[0] < listed_activity
+        settled = self._store.get_settled(*key)
+        return settled is None or settled < seen[0]
+
+    def _unsettled(self):
+        """Categories that listed a page still owed, and every category above them."""
+        held = set()
+        stack = [parent for parents in self._owed.values() for parent in parents]
+        while stack:
+            category_id = stack.pop()
+            if category_id not in held:
+                held.add(category_id)
+                stack.extend(self._category_parents.get(category_id, ()))
+        return held
+
+    def process_request(self, request, spider):
+        if (
+            self._store is None
+            or self._watermark_slack is None
+            or request.meta.get("driver") != "category"
+            or request.meta.get("id") is None
+            or "activity_watermark" in request.meta
+        ):
+            return None
+        try:
+            settled = self._store.get_settled("category", int(request.meta["id"]))
+        except Exception as e:
+            logger.warning(f"[SeenStore] Failed to read watermark of category {request.meta.get('id')}: {e}")
+            return None
+        if settled is not None:
+            request.meta["activity_watermark"] = settled - self._watermark_slack
+        return None
+
+    def process_response(self, request, response, spider):
+        driver = request.meta.get("driver")
+        item_id = request.meta.get("id")
+        if self._store is None or driver is None or item_id is None or response.status != 200:
+            return response
+        if "partial" in response.flags:
+            # Salvaged from a failed fetch; the page is not fetched until its retry succeeds
+            return response
+        try:
+            content_hash = _content_hash(driver, response)
+            changed = self._store.mark_fetched(str(driver), int(item_id), time.time(), content_hash)
+            self._store.commit()
+            self._owed.pop((str(driver), int(item_id)), None)
+            if not changed:
+                request.meta["content_unchanged"] = True
+        except Exception as e:
+            logger.warning(f"[SeenStore] Failed to record fetch of {driver}:{item_id}: {e}")
+        return response
+
+    def spider_opened(self, spider):
+        self._opened_at = time.time()
+        self._owed = {}
+        self._category_parents = {}
+        if not self._sqlite_path:
+            return
+        try:
+            self._store = SqliteStore(self._sqlite_path)
+            self._store.open()
+        except Exception as e:
+            logger.warning(f"[SeenStore] Failed to open SqliteStore: {e}")
+            self._store = None
+
+    def spider_closed(self, spider, reason=None):
+        try:
+            if self._store is not None:
+                if reason == "finished" and self._opened_at is not None:
+                    unsettled = self._unsettled()
+                    settled = self._store.settle_fetches("category", self._opened_at, exclude=unsettled)
+                    self._store.commit()
+                    logger.info(
+                        f"[SeenStore] Crawl finished; {settled} category watermarks advanced, "
+                        f"{len(unsettled)} held back by {len(self._owed)} pages not fetched"
+                    )
+                self._store.close()
+        except Exception:
+            pass
+        finally:
+            self._store = None
@@ -0,0 +1,79 @@
+import hashlib
+import random
+import re
+from array import array
+from typing import Iterable, List, Optional, Set
+
+__all__ = ["MinHasher", "signature_similarity"]
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _hash32(data: str) -> int:
+    # Stable across processes (unlike hash()), so signatures can be persisted
+    return int.from_bytes(hashlib.blake2b(data.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def signature_similarity(a: bytes, b: bytes) -> float:
+    """Estimated Jaccard similarity of two serialized signatures."""
+    sig_a, sig_b = array("I", a), array("I", b)
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class MinHasher:
+    """
+    MinHash signatures and LSH band keys for near-duplicate problem statements.
+
+    A post becomes the set of its word `shingle_size`-grams (lowercased
+    processed text) plus one token per normalized formula, so the same problem
+    with different wording around identical LaTeX still collides. The
+    signature has `num_perm` 32-bit minima; it is split into `bands` bands
+    whose hashes are the LSH bucket keys: two posts become candidates when any
+    band matches, which happens with high probability above a Jaccard
+    similarity of about (1 / bands) ** (1 / rows) (~0.42 for 128 / 32).
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, shingle_size: int = 3, seed: int = 1) -> None:
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def shingles(self, text: Optional[str], formulas: Iterable[str] = ()) -> Set[str]:
+        words = _WORD_RE.findall((text or "").lower())
+        k = self.shingle_size
+        shingles = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))} if words else set()
+        shingles.update(f"$ {formula}" for formula in formulas)
+        return shingles
+
+    def signature(self, shingles: Set[str]) -> Optional[bytes]:
+        """Serialized signature (`num_perm` uint32), or None for an empty set."""
+        if not shingles:
+            return None
+        hashes = [_hash32(s) for s in shingles]
+        mins = array("I", (
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        ))
+        return mins.tobytes()
+
+    def band_keys(self, signature: bytes) -> List[int]:
+        """One signed 64-bit bucket key per band (fits an SQLite INTEGER)."""
+        width = self.rows * 4
+        return [
+            int.from_bytes(
+                hashlib.blake2b(signature[i * width:(i + 1) * width], digest_size=8).digest(), "little", signed=True
+            )
+            for i in range(self.bands)
+        ]
@@ -7,16 +7,20 @@
 # useful for handling different item types with a single interface
 from aops_crawler.items import CategoryItem, PostItem
 import re
+import html as html_module
 from datetime import datetime, timedelta
 try:
     import dateparser  # optional
 except Exception:  # pragma: no cover
     dateparser = None
 from aops_crawler.db.sqlite_store import SqliteStore
+from aops_crawler.export import ExportSink
+from aops_crawler.minhash import MinHasher
 import json
-import os
+import time
 import logging
-from aops_crawler.single_page import TAGS_XPATH
+from aops_crawler.single_page import POSTS_XPATH, TAGS_XPATH, post_id_of, resume_offset
+from aops_crawler.utils.timing import span
 
 
 logger = logging.getLogger(__name__)
@@ -49,6 +53,56 @@ def normalize_backslashes(text: str | None) -> str | None:
     return text.replace('\\\\', '\\')
 
 
+_LATEX_IMG_RE = re.compile(r'<img\b[^>]*\bclass="[^"]*\blatex[^"]*"[^>]*>', re.I)
+_ALT_RE = re.compile(r'\balt="([^"]*)"')
+_MATH_DELIMITERS = (("$$", "$$"), ("\\[", "\\]"), ("\\(", "\\)"), ("$", "$"))
+# \left( -> (, \left. -> nothing; sizing commands carry no meaning for search
+_SIZING_RE = re.compile(r'\\(?:left|right|big|Big|bigg|Bigg)[lr]?\b\s*(\.)?')
+_SPACE_RE = re.compile(r'\s+')
+# A control word (\sum), control space (\ ) or other control symbol (\,) and
+# the whitespace after it; consuming whole sequences keeps "\\" pairs apart
+_CONTROL_SEQUENCE_RE = re.compile(r'\\(?:([A-Za-z]+)|(\s)|.)(\s*)', re.S)
+
+
+def extract_formulas(post_html: str) -> list[str]:
+    """Normalized LaTeX of every `<img class="latex" alt="...">` in a post, in order."""
+    formulas = []
+    for tag in _LATEX_IMG_RE.findall(post_html):
+        m = _ALT_RE.search(tag)
+        if m:
+            formula = normalize_formula(html_module.unescape(m.group(1)))
+            if formula:
+                formulas.append(formula)
+    return formulas
+
+
+def _keep_control_space(m) -> str:
+    """Mark (with NUL) the whitespace a control sequence needs; the rest is dropped."""
+    word, control_space, space = m.groups()
+    if control_space:
+        return "\\\x00"
+    if word and space and re.match(r"[A-Za-z]", m.string[m.end():m.end() + 1]):
+        return "\\" + word + "\x00"
+    return m.group(0)
+
+
+def normalize_formula(latex: str) -> str:
+    """
+    Canonical form of a formula for exact/prefix lookup: math delimiters,
+    `\\left`/`\\right`/`\\big` sizing and all insignificant whitespace removed
+    (a space is kept only where it ends a control word, `\\sum k`, or is a
+    control space, `a\\ b`).
+    """
+    text = normalize_backslashes(latex).strip()
+    for opening, closing in _MATH_DELIMITERS:
+        if len(text) >= len(opening) + len(closing) and text.startswith(opening) and text.endswith(closing):
+            text = text[len(opening):-len(closing)].strip()
+            break
+    text = _SIZING_RE.sub("", text)
+    text = _CONTROL_SEQUENCE_RE.sub(_keep_control_space, text)
+    return _SPACE_RE.sub("", text).replace("\x00", " ")
+
+
 def parse_aops_time(s: str | None) -> float | None:
     if not s:
         return None
@@ -109,11 +163,34 @@ def parse_aops_time(s: str | None) -> float | None:
     return None
 
 
+def select_posts(response):
+    """The `div.cmty-post` nodes of a scrolled topic page."""
+    return response.xpath(POSTS_XPATH).xpath('./div[contains(@class, "cmty-post")]')
+
+
+def extract_post_fields(post):
+    """(created_text, thanks_count, nothanks_count, user_id, post_html) of one `div.cmty-post`."""
+    mid = post.xpath('.//div[contains(@class,"cmty-post-middle")]')
+    created_text = mid.xpath('normalize-space(.//span[contains(@class,"cmty-post-date")])').get()
+    thanks_text = mid.xpath('normalize-space(.//span[contains(@class,"cmty-post-thank-count")])').get() or ''
+    m_thanks = re.search(r'\d+', thanks_text)
+    thanks_count = int(m_thanks.group(0)) if m_thanks else 0
+
+    nothanks_text = mid.xpath('normalize-space(.//span[contains(@class,"cmty-post-nothank-count")])').get() or ''
+    m_nothanks = re.search(r'\d+', nothanks_text)
+    nothanks_count = int(m_nothanks.group(0)) if m_nothanks else 0
+    user_id = post.xpath('normalize-space(substring-after((.//a[starts-with(@href,"/community/user/")]/@href)[1], "/community/user/"))').get()
+    post_html = ''.join(post.xpath('.//div[contains(@class,"cmty-post-html")]/node()').getall()).strip()
+    return created_text, thanks_count, nothanks_count, user_id, post_html
+
+
 class AopsCrawlerPipeline:
     @classmethod
     def from_crawler(cls, crawler):
         pipeline = cls()
         pipeline._sqlite_path = crawler.settings.get("AOPS_SQLITE_PATH")
+        pipeline._change_retention = crawler.settings.getfloat("AOPS_CHANGE_LOG_RETENTION", 0)
+        pipeline._minhasher = MinHasher()
         pipeline._store = None
         if pipeline._sqlite_path:
             try:
@@ -124,6 +201,26 @@ class AopsCrawlerPipeline:
                 logger.warning(f"[PIPELINE] Failed to open SqliteStore: {e}")
         else:
             logger.info("[PIPELINE] No AOPS_SQLITE_PATH configured; DB writes disabled")
+        # Structured post export for downstream jobs, one partition per crawl cycle
+        pipeline._export = None
+        export_dir = crawler.settings.get("AOPS_EXPORT_DIR")
+        if export_dir:
+            cycle = crawler.settings.get("AOPS_EXPORT_CYCLE") or time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+            try:
+                pipeline._export = ExportSink(
+                    export_dir,
+                    cycle,
+                    fmt=crawler.settings.get("AOPS_EXPORT_FORMAT", "jsonl"),
+                    batch_size=crawler.settings.getint("AOPS_EXPORT_BATCH", 500),
+                    roll_bytes=crawler.settings.getint("AOPS_EXPORT_ROLL_BYTES", 64 * 1024 * 1024),
+                    roll_seconds=crawler.settings.getfloat("AOPS_EXPORT_ROLL_SECONDS", 600.0),
+                    stats=crawler.stats,
+                )
+                pipeline._export.open()
+                logger.info(f"[PIPELINE] Exporting {pipeline._export.fmt} to {pipeline._export.directory}")
+            except Exception as e:
+                logger.warning(f"[PIPELINE] Failed to open export sink: {e}")
+                pipeline._export = None
         return pipeline
 
     def open_spider(self, spider):
@@ -132,14 +229,28 @@ class AopsCrawlerPipeline:
     def close_spider(self, spider):
         try:
             if getattr(self, "_store", None) is not None:
+                if self._change_retention > 0:
+                    pruned = self._store.prune_changes(time.time() - self._change_retention)
+                    if pruned:
+                        logger.info(f"[PIPELINE] Pruned {pruned} change log records")
                 self._store.commit()
                 self._store.close()
                 logger.info("[PIPELINE] SqliteStore closed")
         except Exception as e:
             logger.warning(f"[PIPELINE] Error closing SqliteStore: {e}")
+        try:
+            if getattr(self, "_export", None) is not None:
+                self._export.close()
+        except Exception as e:
+            logger.warning(f"[PIPELINE] Error closing export sink: {e}")
         logger.info("[PIPELINE] Pipeline closed")
 
     def process_item(self, item, spider):
+        driver = "post" if isinstance(item, PostItem) else "category" if isinstance(item, CategoryItem) else None
+        with span("process_item", driver):
+            return self._process_item(item, spider)
+
+    def _process_item(self, item, spider):
         if isinstance(item, CategoryItem):
             category_id = item.get("category_id")
             name = item.get("raw").get("item_text")
@@ -162,7 +273,8 @@ class AopsCrawlerPipeline:
                         raw_json=raw_json,
                     )
                     self._store.link(parent_id=parent_id, child_id=category_id, type_of_child="category")
-                    self._store.commit()
+                    with span("db_commit", "category"):
+                        self._store.commit()
             except Exception as e:
                 logger.warning(f"[PIPELINE] Failed to persist CategoryItem {category_id}: {e}")
             return item
@@ -195,67 +307,89 @@ class AopsCrawlerPipeline:
             except Exception as e:
                 logger.warning(f"[PIPELINE] Failed to persist tags for thread {post_id}: {e}")
 
+            if response is not None and response.meta.get("content_unchanged"):
+                logger.info(f"[PIPELINE] Thread {post_id} unchanged since last fetch; skipping message parse")
+                response = None
+
             if response:
                 # Iterate posts in the right container
-                posts = response.xpath('/html/body/div[1]/div[3]/div/div/div[3]/div/div[4]/div/div[2]/div').xpath('./div[contains(@class, "cmty-post")]')
-                is_first = True
-                for post in posts:
-                    mid = post.xpath('.//div[contains(@class,"cmty-post-middle")]')
-                    created_text = mid.xpath('normalize-space(.//span[contains(@class,"cmty-post-date")])').get()
-                    created_ts = parse_aops_time(created_text)
-                    thanks_text = mid.xpath('normalize-space(.//span[contains(@class,"cmty-post-thank-count")])').get() or ''
-                    m_thanks = re.search(r'\d+', thanks_text)
-                    thanks_count = int(m_thanks.group(0)) if m_thanks else 0
-
-                    nothanks_text = mid.xpath('normalize-space(.//span[contains(@class,"cmty-post-nothank-count")])').get() or ''
-                    m_nothanks = re.search(r'\d+', nothanks_text)
-                    nothanks_count = int(m_nothanks.group(0)) if m_nothanks else 0
-                    user_id = post.xpath('normalize-space(substring-after((.//a[starts-with(@href,"/community/user/")]/@href)[1], "/community/user/"))').get()
-                    post_html = ''.join(post.xpath('.//div[contains(@class,"cmty-post-html")]/node()').getall()).strip()
-                    post_text = transform_cmty_post_html(post_html)
-
-                    # Append to test log
-                    try:
-                        os.makedirs("test", exist_ok=True)
-                    except Exception:
-                        pass
-                    with open("test/post_log.txt", "a", encoding="utf-8") as f:
-                        f.write(f"{post_id}\n")
-                        f.write(f"{parent_id}\n")
-                        f.write(f"{source}\n")
-                        f.write(f"{user_id}\n")
-                        f.write(f"{created_text}\n")
-                        f.write(f"{created_ts}\n")
-                        f.write(f"{thanks_count}\n")
-                        f.write(f"{nothanks_count}\n")
-                        f.write(f"{post_html}\n")
-                        f.write(f"{post_text}\n")
+                with span("xpath_posts", "post"):
+                    posts = select_posts(response)
+                # Posts before resume_from were stored from the partial response
+                # of a failed attempt. A retry opened the topic at the last of
+                # them, so its posts are numbered from there
+                resume_from = response.meta.get("resume_from", 0)
+                resume_post_id = response.meta.get("resume_post_id")
+                first = 0
+                if resume_from and resume_post_id is not None and response.meta.get("resume_url"):
+                    first = resume_offset([post_id_of(p) for p in posts.getall()], resume_from, resume_post_id)
+                    if first is None:
+                        logger.warning(
+                            f"[PIPELINE] Thread {post_id} resumed at post {resume_post_id}, which the page "
+                            f"does not show; skipping its posts"
+                        )
+                        first, posts = 0, []
+                for position, post in enumerate(posts, start=first):
+                    if position < resume_from:
+                        continue
+                    with span("xpath_fields", "post"):
+                        created_text, thanks_count, nothanks_count, user_id, post_html = extract_post_fields(post)
+                    with span("parse_time", "post"):
+                        created_ts = parse_aops_time(created_text)
+                    with span("transform_html", "post"):
+                        post_text = transform_cmty_post_html(post_html)
+
+                    user_int = int(user_id) if user_id and str(user_id).isdigit() else None
+                    if getattr(self, "_export", None) is not None:
+                        self._export.write({
+                            "thread_id": post_id,
+                            "category_id": parent_id,
+                            "position": position,
+                            "is_first_post": position == 0,
+                            "user_id": user_int,
+                            "created_text": created_text,
+                            "created_at": created_ts,
+                            "thanks_count": thanks_count,
+                            "nothanks_count": nothanks_count,
+                            "raw_html": post_html,
+                            "processed_html": post_text,
+                            "source": source,
+                            "fetched_at": time.time(),
+                        })
 
                     # Persist each message
                     try:
                         if getattr(self, "_store", None) is not None:
-                            user_int = None
-                            try:
-                                user_int = int(user_id) if user_id and str(user_id).isdigit() else None
-                            except Exception:
-                                user_int = None
-                            self._store.insert_post_message(
-                                thread_id=post_id,
-                                user_id=user_int,
-                                created_at=created_ts,
-                                thanks_count=thanks_count,
-                                nothanks_count=nothanks_count,
-                                raw_html=post_html,
-                                processed_html=post_text,
-                                is_first_post=is_first,
-                                source=source,
-                            )
-                            is_first = False
+                            with span("db_insert", "post"):
+                                row_id = self._store.insert_post_message(
+                                    thread_id=post_id,
+                                    user_id=user_int,
+                                    created_at=created_ts,
+                                    thanks_count=thanks_count,
+                                    nothanks_count=nothanks_count,
+                                    raw_html=post_html,
+                                    processed_html=post_text,
+                                    is_first_post=position == 0,
+                                    source=source,
+                                    position=position,
+                                )
+                            with span("formulas", "post"):
+                                formulas = extract_formulas(post_html)
+                                self._store.index_post_formulas(row_id, formulas)
+                            if position == 0:
+                                # The problem statement: index it for near-duplicate lookups
+                                with span("minhash", "post"):
+                                    signature = self._minhasher.signature(self._minhasher.shingles(post_text, formulas))
+                                    if signature is not None:
+                                        self._store.index_thread_signature(
+                                            post_id, signature, self._minhasher.band_keys(signature)
+                                        )
                     except Exception as e:
                         logger.warning(f"[PIPELINE] Failed to persist message in thread {post_id}: {e}")
                 try:
                     if getattr(self, "_store", None) is not None:
-                        self._store.commit()
+                        with span("db_commit", "post"):
+                            self._store.commit()
                 except Exception:
                     pass
 
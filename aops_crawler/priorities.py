@@ -0,0 +1,65 @@
+import math
+from typing import Any, Dict, Optional
+
+__all__ = ["PriorityPolicy", "estimate_cost"]
+
+# Keys under which fetch_category_data items report thread sizes
+_COST_KEYS = ("num_posts", "num_replies", "reply_count", "replies")
+
+
+def estimate_cost(item: Optional[Dict[str, Any]]) -> Optional[int]:
+    """Number of posts a listing item will render, from its (post_data) counters."""
+    if not isinstance(item, dict):
+        return None
+    sources = [item.get("post_data") or {}, item]
+    for source in sources:
+        if not isinstance(source, dict):
+            continue
+        for key in _COST_KEYS:
+            value = source.get(key)
+            try:
+                count = int(value)
+            except (TypeError, ValueError):
+                continue
+            # Reply counters exclude the opening post
+            return count + 1 if key != "num_posts" else count
+    return None
+
+
+class PriorityPolicy:
+    """
+    Scrapy request priorities (higher runs first) from driver type, depth and cost.
+
+    Bands keep contest roots ahead of category discovery, and category discovery
+    ahead of topic rendering (`AOPS_PRIORITY_BASE`). Within categories deeper
+    folders come first, so the tree is walked depth-first and the frontier stays
+    small. Within topics the largest threads come first (`num_posts` from the
+    listing), so the longest renders start early instead of trailing the crawl.
+    """
+
+    DEFAULT_BASE = {"contest": 30000, "category": 20000, "post": 0}
+
+    def __init__(self, base: Optional[Dict[str, int]] = None, depth_step: int = 10, max_depth: int = 50, post_cost_scale: int = 1000) -> None:
+        self._base = dict(self.DEFAULT_BASE)
+        self._base.update({str(k): int(v) for k, v in (base or {}).items()})
+        self._depth_step = depth_step
+        self._max_depth = max_depth
+        self._post_cost_scale = post_cost_scale
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            base=settings.getdict("AOPS_PRIORITY_BASE"),
+            depth_step=settings.getint("AOPS_PRIORITY_DEPTH_STEP", 10),
+            max_depth=settings.getint("AOPS_PRIORITY_MAX_DEPTH", 50),
+            post_cost_scale=settings.getint("AOPS_PRIORITY_POST_COST_SCALE", 1000),
+        )
+
+    def priority(self, driver: str, depth: int = 0, cost: Optional[int] = None) -> int:
+        base = self._base.get(driver, 0)
+        if driver == "post":
+            if not cost or cost <= 0:
+                return base
+            # log scale: a 1000-post thread outranks a 10-post one without overflowing the band
+            return base + min(self._post_cost_scale, int(math.log2(1 + cost) * self._post_cost_scale / 16))
+        return base + min(depth, self._max_depth) * self._depth_step
@@ -0,0 +1,68 @@
+import threading
+import time
+from typing import Dict, Optional
+
+__all__ = ["TokenBucket", "RateLimiter"]
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, up to `burst` banked. `reserve()` takes a token
+    immediately and returns when it is actually due, so waiting callers are
+    served in order and the long-run rate never exceeds `rate`.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def reserve(self) -> float:
+        """Take a token; returns the `time.monotonic()` at which it may be used."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return now
+            return now + (-self._tokens) / self.rate
+
+    def level(self) -> float:
+        """Banked tokens (negative while callers are queued)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class RateLimiter:
+    """
+    One token bucket per endpoint (download driver), configured by
+    `AOPS_RATE_LIMITS = {driver: {"rate": per_second, "burst": n}}`. Drivers
+    without an entry, or with a rate of 0/None, are not limited. Shared by all
+    browser pages of the download handler; reservations are thread-safe.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None) -> None:
+        self._buckets: Dict[str, TokenBucket] = {}
+        for key, conf in (limits or {}).items():
+            if not conf or not conf.get("rate"):
+                continue
+            self._buckets[key] = TokenBucket(conf["rate"], conf.get("burst", 1))
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.getdict("AOPS_RATE_LIMITS"))
+
+    def reserve(self, key: str) -> Optional[float]:
+        """Monotonic time the next request for `key` may start, or None if unlimited."""
+        bucket = self._buckets.get(key)
+        return bucket.reserve() if bucket is not None else None
+
+    def levels(self) -> Dict[str, float]:
+        return {key: bucket.level() for key, bucket in self._buckets.items()}
@@ -0,0 +1,231 @@
+import heapq
+import itertools
+import json
+import logging
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from scrapy import signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.utils.misc import build_from_crawler, load_object
+from aops_crawler.db.sqlite_store import SqliteStore
+from aops_crawler.utils.timing import mark, span
+
+__all__ = ["SqliteFrontierScheduler"]
+
+logger = logging.getLogger(__name__)
+
+# Meta keys a frontier row can rebuild; requests carrying anything else stay in memory
+FRONTIER_META_KEYS = {"driver", "id", "parent_id", "depth"}
+# Only read while a request is being scheduled (dupefilter, request_scheduled), so not stored
+SCHEDULING_META_KEYS = {"listed_activity"}
+# Carried by retries; stored as the row's retry_meta JSON and restored when it is popped
+RETRY_META_KEYS = {"aops_retry_times", "retry_times", "resume_from", "resume_url", "resume_post_id"}
+# Set while a request is downloaded and recomputed on the next download, so a retry drops them
+DOWNLOAD_META_KEYS = {"download_slot", "download_latency", "download_timeout", "activity_watermark"}
+STORABLE_META_KEYS = FRONTIER_META_KEYS | SCHEDULING_META_KEYS | RETRY_META_KEYS | DOWNLOAD_META_KEYS
+
+FrontierRow = Tuple[str, int, Optional[int], int, int, Optional[str]]
+
+
+class SqliteFrontierScheduler(BaseScheduler):
+    """
+    Scheduler whose pending queue is the compact `frontier` table of the SQLite
+    store instead of JOBDIR's pickled disk queues.
+
+    A request is reduced to (driver, id, parent_id, priority, depth, retry meta)
+    and rebuilt with the spider's `request_for()` when popped, so the queue
+    deduplicates on (driver, id), can raise priorities in place and survives
+    restarts. Pushes are buffered and written in batches; pops mark a batch
+    read through the priority index as in flight. A row is only deleted once
+    its response arrives (not for a partial response whose retry is pending),
+    and `open()` re-arms rows left in flight by a crash or shutdown, so no
+    popped request is lost; a retry re-arms its row with its retry meta. The
+    frontier is owned by one crawler process at a time. Requests that cannot
+    be rebuilt from a row (custom callbacks, errbacks, ...) are kept in an
+    in-memory priority heap.
+
+    With a `gate` (the crawler's `AdaptiveConcurrencyMiddleware`), a request
+    is only handed out once `gate.admit()` finds room in its driver's window.
+    Up to a pop batch of refused requests is held back and handed out first
+    when room frees up, so later requests of other drivers are not stuck
+    behind them.
+    """
+
+    def __init__(self, dupefilter, sqlite_path: str, stats=None, batch_size: int = 500, pop_batch_size: int = 64,
+                 gate=None) -> None:
+        self.df = dupefilter
+        self.stats = stats
+        self._sqlite_path = sqlite_path
+        self._batch_size = batch_size
+        self._pop_batch_size = pop_batch_size
+        self._store: Optional[SqliteStore] = None
+        self.spider = None
+        self._push_buffer: List[FrontierRow] = []
+        self._pop_buffer: Deque[FrontierRow] = deque()
+        self._ack_buffer: List[Tuple[str, int]] = []
+        self._db_count = 0
+        self._mem: List[tuple] = []
+        self._mem_seq = itertools.count()
+        self._gate = gate
+        self._held: List = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        dupefilter_cls = load_object(settings["DUPEFILTER_CLASS"])
+        scheduler = cls(
+            dupefilter=build_from_crawler(dupefilter_cls, crawler),
+            sqlite_path=settings.get("AOPS_FRONTIER_PATH") or settings.get("AOPS_SQLITE_PATH"),
+            stats=crawler.stats,
+            batch_size=settings.getint("AOPS_FRONTIER_BATCH_SIZE", 500),
+            pop_batch_size=settings.getint("AOPS_FRONTIER_POP_BATCH_SIZE", 64),
+            # Set by AdaptiveConcurrencyMiddleware, built with the downloader before the scheduler
+            gate=getattr(crawler, "aops_concurrency", None),
+        )
+        crawler.signals.connect(scheduler.response_received, signal=signals.response_received)
+        return scheduler
+
+    # ---- lifecycle ----
+    def open(self, spider):
+        self.spider = spider
+        self._store = SqliteStore(self._sqlite_path)
+        self._store.open()
+        rearmed = self._store.rearm_frontier()
+        self._store.commit()
+        self._db_count = self._store.frontier_size()
+        if self._db_count:
+            logger.info(
+                f"[Frontier] Resuming crawl ({self._db_count} requests scheduled, "
+                f"{rearmed} of them in flight when the last crawl stopped)"
+            )
+        return self.df.open()
+
+    def close(self, reason):
+        try:
+            if self._store is not None:
+                self._flush()
+                # Rows read ahead, held back or still in flight are re-armed by the next open()
+                self._pop_buffer.clear()
+                self._held.clear()
+                self._store.close()
+                if self._mem:
+                    logger.info(f"[Frontier] Dropping {len(self._mem)} in-memory requests on close")
+        except Exception as e:
+            logger.warning(f"[Frontier] Failed to persist frontier on close: {e}")
+        finally:
+            self._store = None
+        return self.df.close(reason)
+
+    # ---- scheduler interface ----
+    def has_pending_requests(self) -> bool:
+        return len(self) > 0
+
+    def __len__(self) -> int:
+        return len(self._held) + len(self._mem) + len(self._pop_buffer) + len(self._push_buffer) + self._db_count
+
+    def enqueue_request(self, request) -> bool:
+        driver = request.meta.get("driver")
+        if not request.dont_filter:
+            with span("dupefilter", driver):
+                seen = self.df.request_seen(request)
+            if seen:
+                self.df.log(request, self.spider)
+                return False
+        row = self._to_row(request)
+        if row is not None:
+            self._push_buffer.append(row)
+            if len(self._push_buffer) >= self._batch_size:
+                self._flush()
+            self.stats.inc_value("scheduler/enqueued/sqlite")
+        else:
+            heapq.heappush(self._mem, (-request.priority, next(self._mem_seq), request))
+            self.stats.inc_value("scheduler/enqueued/memory")
+        self.stats.inc_value("scheduler/enqueued")
+        mark("scheduled", driver, id=request.meta.get("id"), priority=request.priority)
+        return True
+
+    def next_request(self):
+        if self._gate is None:
+            return self._dequeued(self._pop())
+        for i, request in enumerate(self._held):
+            if self._gate.admit(request):
+                del self._held[i]
+                return self._dequeued(request)
+        while len(self._held) < self._pop_batch_size:
+            request = self._pop()
+            if request is None or self._gate.admit(request):
+                return self._dequeued(request)
+            self._held.append(request)
+            self.stats.inc_value("scheduler/held")
+        return None
+
+    def _dequeued(self, request):
+        if request is not None:
+            self.stats.inc_value("scheduler/dequeued")
+        return request
+
+    def _pop(self):
+        if not self._pop_buffer and (self._push_buffer or self._db_count):
+            self._flush()
+            rows = self._store.pop_frontier(self._pop_batch_size, time.time())
+            # Release the write lock: the pipeline and seen-store connections share the file
+            self._store.commit()
+            self._db_count = max(0, self._db_count - len(rows))
+            self._pop_buffer.extend(rows)
+        request = None
+        if self._mem and (not self._pop_buffer or -self._mem[0][0] >= self._pop_buffer[0][3]):
+            request = heapq.heappop(self._mem)[2]
+            self.stats.inc_value("scheduler/dequeued/memory")
+        elif self._pop_buffer:
+            driver, item_id, parent_id, priority, depth, retry_meta = self._pop_buffer.popleft()
+            meta = {"depth": depth}
+            if retry_meta:
+                meta.update(json.loads(retry_meta))
+            request = self.spider.request_for(driver, item_id, parent_id, priority=priority, meta=meta)
+            self.stats.inc_value("scheduler/dequeued/sqlite")
+        return request
+
+    def response_received(self, response, request, spider):
+        if self._store is None or request.meta.get("retry_pending"):
+            # A partial response's retry re-arms the row instead
+            return
+        driver, item_id = request.meta.get("driver"), request.meta.get("id")
+        if driver is None or item_id is None:
+            return
+        self._ack_buffer.append((str(driver), int(item_id)))
+        if len(self._ack_buffer) >= self._batch_size:
+            self._flush()
+
+    # ---- helpers ----
+    def _flush(self) -> None:
+        if (not self._push_buffer and not self._ack_buffer) or self._store is None:
+            return
+        if self._ack_buffer:
+            self._store.ack_frontier(self._ack_buffer)
+            self._ack_buffer = []
+        if self._push_buffer:
+            self._db_count += self._store.push_frontier(self._push_buffer)
+            self._push_buffer = []
+        self._store.commit()
+
+    def _to_row(self, request) -> Optional[FrontierRow]:
+        meta = request.meta
+        driver = meta.get("driver")
+        callbacks = getattr(self.spider, "DRIVER_CALLBACKS", {})
+        if driver not in callbacks or request.errback is not None or not set(meta) <= STORABLE_META_KEYS:
+            return None
+        callback = getattr(request.callback, "__name__", None)
+        if callback != callbacks[driver]:
+            return None
+        try:
+            item_id = int(meta["id"])
+            parent_id = int(meta["parent_id"]) if meta.get("parent_id") is not None else None
+        except (KeyError, TypeError, ValueError):
+            return None
+        retry_meta = {key: meta[key] for key in RETRY_META_KEYS if key in meta}
+        return (
+            driver, item_id, parent_id, int(request.priority), int(meta.get("depth", 0)),
+            json.dumps(retry_meta, sort_keys=True) if retry_meta else None,
+        )
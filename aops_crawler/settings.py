@@ -19,10 +19,114 @@ DOWNLOAD_HANDLERS = {
     # Add more custom handlers here
 }
 
+# Pending requests live in the SQLite `frontier` table (replaces JOBDIR disk queues)
+SCHEDULER = "aops_crawler.scheduler.SqliteFrontierScheduler"
+AOPS_FRONTIER_BATCH_SIZE = 500
+
+# Request priorities (higher first): contest > category > post bands, deeper
+# categories first, larger threads (num_posts from the listing) first
+AOPS_PRIORITY_BASE = {"contest": 30000, "category": 20000, "post": 0}
+AOPS_PRIORITY_DEPTH_STEP = 10
+
 # Duplicate request handling: run custom code while still rejecting duplicates
 DUPEFILTER_CLASS = 'aops_crawler.dupefilters.LinkingDupeFilter'
+# Site root and contest collections the crawl starts from
+AOPS_BASE_URL = "https://artofproblemsolving.com"
+AOPS_SEED_CONTESTS = [13]
+
 # Path for SQLite store used by dupefilter to record connections
 AOPS_SQLITE_PATH = "./browser_data/aops.sqlite3"
+# Skip the children of a category whose listing (item ids + last activity) is
+# unchanged since they were last fetched (ListingFingerprintSpiderMiddleware)
+AOPS_LISTING_FINGERPRINTS = True
+
+# Category refreshes stop scrolling once the loaded topics were last active
+# before the category's last fetch in a crawl that finished (minus the slack, in
+# seconds, for clock skew between AoPS and this machine). Until a crawl closes
+# as "finished" (not timeboxed or interrupted) with every topic the category
+# listed with new replies fetched, the category is scrolled in full
+AOPS_CATEGORY_WATERMARK = True
+AOPS_WATERMARK_SLACK = 3600
+
+# Backpressure: once downloaded responses still waiting for (or in) the spider
+# callback and pipeline exceed this many bytes, the download handler leases no
+# new browser page until they drain. 0 disables. Use: aops/budget/* stats
+AOPS_BYTE_BUDGET = 256 * 1024 * 1024
+
+# Change log (SqliteStore.changes_since): records older than this many seconds
+# are pruned when the pipeline closes; 0 keeps them forever
+AOPS_CHANGE_LOG_RETENTION = 14 * 24 * 3600
+
+# Structured export of every stored post message for downstream jobs
+# (aops_crawler.export): files under AOPS_EXPORT_DIR/cycle=<crawl start, UTC>/,
+# zstd JSONL (gzip without zstandard) or Parquet (needs pyarrow), written in
+# batches of AOPS_EXPORT_BATCH records off the reactor thread and rolled by
+# size or age. None disables the export
+AOPS_EXPORT_DIR = "./browser_data/export"
+AOPS_EXPORT_FORMAT = "jsonl"
+AOPS_EXPORT_BATCH = 500
+AOPS_EXPORT_ROLL_BYTES = 64 * 1024 * 1024
+AOPS_EXPORT_ROLL_SECONDS = 600
+# Per-driver refetch TTL in seconds for the SQLite seen-store; drivers not listed
+# fall back to fingerprint dedupe (seen once, never refetched)
+AOPS_SEEN_TTL = {
+    "contest": 6 * 3600,
+    "category": 3600,
+    "post": 7 * 24 * 3600,
+}
+
+# Keep the browser context open after the engine stops so the next crawler in
+# the same process (run.py cycles) reuses it warm; run.py enables this
+AOPS_BROWSER_KEEPALIVE = False
+
+# Named browser launch profiles (see browser_service.resolve_launch_profile).
+# "default" keeps the historical launch: channel defaults, window-sized viewport.
+# "lean-headless" trims what a crawler never needs: no GPU compositing,
+# extensions or background networking, a small fixed viewport so scroll
+# layout stays cheap, reduced motion, no throttling of background pages, and
+# a persistent HTTP disk cache for static assets across context recycles
+AOPS_LAUNCH_PROFILE = "default"
+AOPS_LAUNCH_PROFILES = {
+    "default": {},
+    "lean-headless": {
+        "headless": True,
+        "args": [
+            "--disable-gpu",
+            "--disable-extensions",
+            "--disable-component-extensions-with-background-pages",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-default-apps",
+            "--disable-sync",
+            "--no-first-run",
+            "--mute-audio",
+            "--disable-background-timer-throttling",
+            "--disable-backgrounding-occluded-windows",
+            "--disable-renderer-backgrounding",
+            "--disable-features=Translate,MediaRouter,OptimizationHints,CalculateNativeWinOcclusion",
+        ],
+        "viewport": {"width": 1024, "height": 768},
+        "reduced_motion": "reduce",
+        "disk_cache": True,
+        "disk_cache_size": 256 * 1024 * 1024,
+    },
+}
+# Disk cache directory for profiles with "disk_cache" (default: <profile dir>-cache)
+AOPS_BROWSER_DISK_CACHE_DIR = None
+
+# Record/replay of rendered responses (aops_crawler.archive): "record" archives every
+# contest/category/topic render, "replay" serves them back without launching a browser
+# (combine with a fresh AOPS_SQLITE_PATH to re-run parsing at CPU speed; replay is not rate limited)
+AOPS_RECORD_MODE = None
+AOPS_ARCHIVE_DIR = "./browser_data/archive"
+
+# Multi-process mode: workers claim (driver, id) leases from the work_queue table
+# in AOPS_SQLITE_PATH instead of using the local scheduler. run.py --workers N sets
+# AOPS_WORK_QUEUE/AOPS_WORKER_ID per worker process
+AOPS_WORK_QUEUE = False
+AOPS_WORK_LEASE_SECONDS = 300
+AOPS_WORK_PREFETCH = 8
+AOPS_WORK_MAX_ATTEMPTS = 3
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = "aops_crawler (+http://www.yourdomain.com)"
@@ -31,9 +135,50 @@ AOPS_SQLITE_PATH = "./browser_data/aops.sqlite3"
 ROBOTSTXT_OBEY = False
 
 # Concurrency and throttling settings
-#CONCURRENT_REQUESTS = 16
+# Upper bound only: in-flight browser pages are governed per driver by
+# AdaptiveConcurrencyMiddleware (sum of the AOPS_AIMD_DRIVERS maxima)
+CONCURRENT_REQUESTS = 32
 CONCURRENT_REQUESTS_PER_DOMAIN = 50
-DOWNLOAD_DELAY = 1
+# Politeness is per driver (AOPS_RATE_LIMITS below), not one delay for every page
+DOWNLOAD_DELAY = 0
+
+# Token bucket per download driver, shared by all pages of the browser context:
+# on average `rate` requests per second, in bursts of up to `burst`. Listing
+# XHRs are cheap and may go fast; full contest/topic renders stay polite.
+# "http" covers plain requests; drivers without an entry are not limited
+AOPS_RATE_LIMITS = {
+    "contest": {"rate": 0.2, "burst": 1},
+    "category": {"rate": 3.0, "burst": 6},
+    "post": {"rate": 1.0, "burst": 3},
+    "http": {"rate": 1.0, "burst": 1},
+}
+
+# AIMD concurrency: each window grows by AOPS_AIMD_INCREASE per interval while
+# saturated and healthy, and is multiplied by AOPS_AIMD_DECREASE on timeouts,
+# slow pages (p90 above target_latency seconds) or CPU/memory pressure of the
+# browser process tree (psutil; CPU as a percent of all cores). Full windows
+# hold requests back in the scheduler, not in a downloader slot
+AOPS_AIMD_ENABLED = True
+AOPS_AIMD_DRIVERS = {
+    "contest": {"initial": 1, "min": 1, "max": 2, "target_latency": 30.0},
+    "category": {"initial": 2, "min": 1, "max": 8, "target_latency": 20.0},
+    "post": {"initial": 4, "min": 1, "max": 16, "target_latency": 20.0},
+}
+AOPS_AIMD_INTERVAL = 10
+AOPS_AIMD_INCREASE = 1
+AOPS_AIMD_DECREASE = 0.5
+AOPS_AIMD_MAX_ERROR_RATE = 0.05
+AOPS_AIMD_MAX_CPU_PERCENT = 90
+AOPS_AIMD_MAX_MEMORY_PERCENT = 90
+
+# Retry policy per fetch error class (aops_crawler.errors); unset keys fall back to
+# ClassifiedRetryMiddleware.DEFAULT_POLICY. Backoff is backoff * factor ** attempt seconds
+AOPS_RETRY_POLICY = {
+    "NavigationTimeout": {"max_retries": 3, "backoff": 5, "factor": 2, "max_backoff": 120},
+    "SelectorMissing": {"max_retries": 2, "backoff": 2, "factor": 2, "max_backoff": 30},
+    "ContextCrashed": {"max_retries": 3, "backoff": 10, "factor": 2, "max_backoff": 120},
+    "RateLimited": {"max_retries": 6, "backoff": 60, "factor": 2, "max_backoff": 900},
+}
 
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
@@ -49,21 +194,44 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
+SPIDER_MIDDLEWARES = {
 #    "aops_crawler.middlewares.AopsCrawlerSpiderMiddleware": 543,
-#}
+    # Only active with AOPS_WORK_QUEUE (multi-process workers, see run.py --workers)
+    "aops_crawler.workqueue.WorkQueueSpiderMiddleware": 600,
+    # Closer to the spider than the work queue, so skipped children are never enqueued
+    "aops_crawler.middlewares.ListingFingerprintSpiderMiddleware": 650,
+    # Outermost, so it sees the final callback output (only active with AOPS_BYTE_BUDGET)
+    "aops_crawler.backpressure.ByteBudgetSpiderMiddleware": 50,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "aops_crawler.middlewares.AopsCrawlerDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    # Adaptive in-flight browser pages per driver (AOPS_AIMD_*); after RetryMiddleware
+    # in process_exception order so failed pages are counted before they are retried
+    "aops_crawler.middlewares.AdaptiveConcurrencyMiddleware": 560,
+    # Per-class retries/backoff for FetchError, ahead of RetryMiddleware (550)
+    "aops_crawler.middlewares.ClassifiedRetryMiddleware": 555,
+    # Record fetch time/content hash per (driver, id) for AOPS_SEEN_TTL recrawls
+    "aops_crawler.middlewares.SeenStoreDownloaderMiddleware": 950,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
+EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+    "aops_crawler.extensions.LatencyStatsExtension": 500,
+    "aops_crawler.extensions.TraceExtension": 510,
+}
+
+# Per-stage latency histograms (browser fetch stages, handler, pipeline) pushed to
+# stats as aops/latency/<driver>/<stage>/p50|p95|p99_ms and exported for Prometheus
+AOPS_LATENCY_ENABLED = True
+AOPS_LATENCY_EXPORT_INTERVAL = 30
+AOPS_LATENCY_PROM_FILE = "test/aops_latency.prom"
+# Chrome trace-event timeline of every request (open in https://ui.perfetto.dev);
+# off by default, e.g. "test/trace-{cycle}.json"
+AOPS_TRACE_FILE = None
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -2,19 +2,172 @@ from __future__ import annotations
 from scrapy.http import HtmlResponse, Response, TextResponse  # <-- JsonResponse removed
 import asyncio
 from typing import Any, Dict, List, Optional
-from urllib.parse import parse_qs
+from urllib.parse import parse_qs, urljoin
 import json
 import re
+import hashlib
 import html as html_module
 import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from patchright.async_api import TimeoutError as PlaywrightTimeoutError
-from twisted.internet.defer import TimeoutError as TwistedTimeoutError
 from patchright.async_api import async_playwright
+from aops_crawler.errors import ContextCrashed, FetchError, NavigationTimeout, RateLimited, SelectorMissing
+from aops_crawler.utils.timing import mark, span
 TAGS_XPATH='/html/body/div[1]/div[3]/div/div/div[3]/div/div[3]/div[2]/div[1]/div[2]/div'
+POSTS_XPATH = '/html/body/div[1]/div[3]/div/div/div[3]/div/div[4]/div/div[2]/div'
+# Same node as the spider's '#community-all > div > div.cmty-folder-grid'
+FOLDER_GRID_XPATH = '//*[@id="community-all"]/div/div[contains(concat(" ", normalize-space(@class), " "), " cmty-folder-grid ")]'
 
 logger = logging.getLogger(__name__)
 
+# Playwright error messages meaning the page/context/browser itself is gone
+_CRASH_MARKERS = ("target closed", "has been closed", "crashed", "browser closed", "connection closed")
+
+
+def classify_error(exc: BaseException, stage: str, url: str) -> FetchError:
+    """Map an exception raised at `stage` of a fetch to a typed `FetchError`."""
+    if isinstance(exc, FetchError):
+        return exc
+    message = str(exc).strip().splitlines()[0] if str(exc).strip() else type(exc).__name__
+    if any(marker in message.lower() for marker in _CRASH_MARKERS):
+        cls = ContextCrashed
+    elif isinstance(exc, (PlaywrightTimeoutError, asyncio.TimeoutError)):
+        # Waiting on the document or its data XHR vs. on an element of a loaded page
+        cls = NavigationTimeout if stage in ("new_page", "goto", "first_xhr") else SelectorMissing
+    else:
+        cls = FetchError
+    return cls(f"{stage}: {message}", url=url, stage=stage)
+
+
+def _check_status(response, url: str) -> None:
+    if response is not None and response.status == 429:
+        raise RateLimited(f"goto: HTTP 429 for {url}", url=url, stage="goto")
+
+
+def _log_failure(error: FetchError, what: str, url: str) -> None:
+    try:
+        if isinstance(error, (NavigationTimeout, SelectorMissing, RateLimited)):
+            logger.debug("%s while crawling %s %s: %s", type(error).__name__, what, url, error)
+        else:
+            logger.exception("%s while crawling %s %s", type(error).__name__, what, url)
+    except Exception:
+        pass
+
+
+async def _new_page(browser, driver: str, url: str):
+    try:
+        with span("new_page", driver):
+            return await browser.new_page()
+    except Exception as e:
+        raise classify_error(e, "new_page", url) from e
+
+
+# Removes all but the last `keep` items under `root` once more than twice that
+# many are loaded and returns their outerHTML in document order. A spacer grown
+# by the height they took keeps the scroll position, scrollHeight and the
+# loader's trigger point where the page expects them. The cut is moved back to
+# a row boundary so grid layouts (category cells) do not reflow.
+_HARVEST_JS = """
+([rootXpath, itemSelector, keep]) => {
+    const root = document.evaluate(rootXpath, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (!root) return [];
+    const items = Array.from(root.querySelectorAll(itemSelector));
+    if (items.length <= 2 * keep) return [];
+    let cut = items.length - keep;
+    const topOf = (el) => el.getBoundingClientRect().top;
+    while (cut > 0 && topOf(items[cut - 1]) === topOf(items[cut])) cut--;
+    if (cut === 0) return [];
+    const first = items[cut];
+    const before = topOf(first);
+    let spacer = document.getElementById("aops-harvest-spacer");
+    if (!spacer) {
+        spacer = document.createElement("div");
+        spacer.id = "aops-harvest-spacer";
+        spacer.style.gridColumn = "1 / -1";
+        spacer.style.height = "0px";
+    }
+    first.parentNode.insertBefore(spacer, first);
+    const harvested = [];
+    for (let i = 0; i < cut; i++) {
+        harvested.push(items[i].outerHTML);
+        items[i].remove();
+    }
+    const height = parseFloat(spacer.style.height) || 0;
+    spacer.style.height = (height + before - topOf(first)) + "px";
+    return harvested;
+}
+"""
+_SPACER_RE = re.compile(r'<div id="aops-harvest-spacer"[^>]*></div>')
+
+
+async def _harvest(page, root_xpath: str, item_selector: str, keep: int, driver: str) -> List[str]:
+    """Detach already-loaded items from the page (see `_HARVEST_JS`)."""
+    if keep <= 0:
+        return []
+    with span("harvest", driver):
+        harvested = await page.evaluate(_HARVEST_JS, [root_xpath, item_selector, keep])
+    if harvested:
+        mark("harvest", driver, items=len(harvested))
+    return harvested or []
+
+
+def _splice_harvested(html: str, harvested: List[str], url: str) -> str:
+    """Put harvested items back where the spacer stands in the serialized page."""
+    if not harvested:
+        return html
+    parts = _SPACER_RE.split(html, maxsplit=1)
+    if len(parts) != 2:
+        logger.warning(f"[Harvest] Spacer missing in {url}; {len(harvested)} harvested items lost")
+        return html
+    return parts[0] + "".join(harvested) + parts[1]
+
+
+# Where a `div.cmty-post` names its post id, most specific first: a data
+# attribute or element id on the post itself, else its permalink
+# (/community/c6h3358923p31205921)
+_POST_ID_RES = (
+    re.compile(r'^<div[^>]*\bdata-post-id="(\d+)"'),
+    re.compile(r'^<div[^>]*\bid="[\w-]*?post-(\d+)"'),
+    re.compile(r'href="[^"]*/community/(?:c\d+)?h\d+p(\d+)"'),
+)
+_TOPIC_PATH_RE = re.compile(r"/community/(?:c\d+)?h\d+")
+
+
+def post_id_of(post_html: str) -> Optional[int]:
+    """Post id of one serialized `div.cmty-post`, or None when it shows none."""
+    for pattern in _POST_ID_RES:
+        m = pattern.search(post_html)
+        if m:
+            return int(m.group(1))
+    return None
+
+
+def resume_offset(post_ids: List[Optional[int]], resume_from: int, resume_post_id: int) -> Optional[int]:
+    """
+    Position of the first post of a topic page opened at `resume_post_id`,
+    the last post a failed attempt loaded (its position is `resume_from - 1`).
+    None when the page does not contain that post.
+    """
+    try:
+        return resume_from - 1 - post_ids.index(resume_post_id)
+    except ValueError:
+        return None
+
+
+def _resume_point(page_url: str, post_html: str) -> tuple:
+    """(url of the topic opened at the post in `post_html`, its post id), or (None, None)."""
+    post_id = post_id_of(post_html)
+    topic = _TOPIC_PATH_RE.search(page_url)
+    if post_id is None or topic is None:
+        return None, None
+    return urljoin(page_url, f"{topic.group(0)}p{post_id}"), post_id
+
+
 def transform_cmty_post_html(html: str) -> str:
     # 1) Replace <img ... alt="..."> with its alt text
     html = re.sub(r'<img\b[^>]*\balt="([^"]*)"[^>]*>', lambda m: m.group(1), html)
@@ -73,6 +226,25 @@ def transform_cmty_post_html(html: str) -> str:
 #         return storage_state_path
 
 
+def _contest_snapshot(url, final_url, response, title, ajax_requests, partial=False) -> TextResponse:
+    result: Dict[str, Any] = {
+        "url": url,
+        "final_url": final_url,
+        "status": (response.status if response else None),
+        "title": title,
+        "ajax_requests": ajax_requests,
+    }
+    body_bytes = json.dumps(result, ensure_ascii=False).encode("utf-8")
+    return TextResponse(
+        url=url,
+        body=body_bytes,
+        status=(response.status if response else 200),
+        encoding="utf-8",
+        headers={"Content-Type": "application/json; charset=utf-8"},
+        flags=["partial"] if partial else None,
+    )
+
+
 async def crawl_contest_page(
     url: str,
     browser,
@@ -80,14 +252,22 @@ async def crawl_contest_page(
     wait_until: str = "domcontentloaded",
     wait_for_selector: str = "body",
     timeout_ms: int = 30000,
+    # Upper bound; scrolling stops as soon as the listing XHRs report no more items
     max_scrolls: int = 10,
     scroll_pause_ms: int = 800,
     block_images: bool = False,
+    filter_post_key: Optional[str] = "a",
+    filter_post_values: tuple = ("fetch_category_data", "fetch_more_items"),
+    first_xhr_timeout_ms: int = 15000,
 ) -> Response:
     capture_types = {"xhr", "fetch"}
-    page = await browser.new_page()
+    page = await _new_page(browser, "contest", url)
     ajax_requests: List[Dict[str, Any]] = []
+    # Set by the first listing XHR carrying `categories`, and once one reports no_more_items
+    first_filtered_event = asyncio.Event()
+    complete_event = asyncio.Event()
     response = None
+    stage = "goto"
     try:
         async def on_request_finished(request):
             if getattr(request, "resource_type", None) not in capture_types:
@@ -134,45 +314,61 @@ async def crawl_contest_page(
                 "response_text": resp_text,
                 "response_json": resp_json,
             })
+            try:
+                if (
+                    isinstance(post_params, dict)
+                    and post_params.get(filter_post_key) in filter_post_values
+                    and isinstance(resp_json, dict)
+                    and "categories" in (resp_json.get("response") or {})
+                ):
+                    first_filtered_event.set()
+                    category_obj = (resp_json.get("response") or {}).get("category") or {}
+                    if category_obj.get("no_more_items") is True:
+                        complete_event.set()
+            except Exception:
+                pass
 
         page.on("requestfinished", on_request_finished)
 
-        response = await page.goto(url, wait_until=wait_until, timeout=timeout_ms)
-        await page.wait_for_selector(wait_for_selector, timeout=timeout_ms)
+        with span("goto", "contest"):
+            response = await page.goto(url, wait_until=wait_until, timeout=timeout_ms)
+        _check_status(response, url)
+        stage = "wait_for_selector"
+        with span("wait_for_selector", "contest"):
+            await page.wait_for_selector(wait_for_selector, timeout=timeout_ms)
 
-        for _ in range(max_scrolls):
-            await page.evaluate("() => window.scrollTo(0, document.body.scrollHeight)")
-            await asyncio.sleep(scroll_pause_ms / 1000.0)
+        stage = "first_xhr"
+        with span("first_xhr", "contest"):
+            try:
+                await asyncio.wait_for(first_filtered_event.wait(), timeout=first_xhr_timeout_ms / 1000.0)
+            except asyncio.TimeoutError:
+                # No recognizable listing XHR: fall back to the full scroll budget
+                pass
 
+        stage = "scroll"
+        with span("scroll", "contest"):
+            for i in range(max_scrolls):
+                if complete_event.is_set():
+                    break
+                await page.evaluate("() => window.scrollTo(0, document.body.scrollHeight)")
+                try:
+                    await asyncio.wait_for(complete_event.wait(), timeout=scroll_pause_ms / 1000.0)
+                except asyncio.TimeoutError:
+                    pass
+                mark("scroll_step", "contest", i=i, xhrs=len(ajax_requests), complete=complete_event.is_set())
+
+        stage = "wrap_response"
         title = await page.title()
-        result: Dict[str, Any] = {
-            "url": url,
-            "final_url": page.url,
-            "status": (response.status if response else None),
-            "title": title,
-            "ajax_requests": ajax_requests,
-        }
-
-        body_bytes = json.dumps(result, ensure_ascii=False).encode("utf-8")
-        return TextResponse(
-            url=url,
-            body=body_bytes,
-            status=(response.status if response else 200),
-            encoding="utf-8",
-            headers={"Content-Type": "application/json; charset=utf-8"},
-        )
-    except PlaywrightTimeoutError:
-        try:
-            logger.debug("Timeout while crawling contest page %s", url)
-        except Exception:
-            pass
-        raise TwistedTimeoutError("TimeoutError")
-    except Exception:
-        try:
-            logger.exception("Unexpected error while crawling contest page %s", url)
-        except Exception:
-            pass
-        raise TwistedTimeoutError("TimeoutError")
+        with span("wrap_response", "contest"):
+            return _contest_snapshot(url, page.url, response, title, ajax_requests)
+    except Exception as e:
+        error = classify_error(e, stage, url)
+        if stage == "scroll" and ajax_requests:
+            # Keep the category pages captured before the failure
+            error.partial = _contest_snapshot(url, url, response, None, list(ajax_requests), partial=True)
+            error.loaded = len(ajax_requests)
+        _log_failure(error, "contest page", url)
+        raise error from e
     finally:
         try:
             await page.close()
@@ -180,6 +376,69 @@ async def crawl_contest_page(
             pass
 
 
+def _listing_items(entry: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    resp_json = (entry or {}).get("response_json") or {}
+    if not isinstance(resp_json, dict):
+        return []
+    return ((resp_json.get("response") or {}).get("category") or {}).get("items") or []
+
+
+def _item_activity(item: Dict[str, Any]) -> Optional[float]:
+    post_data = item.get("post_data") or {}
+    value = post_data.get("last_post_time") or post_data.get("last_update_time")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# Flags of topics pinned to the top of a listing regardless of their activity
+_PINNED_KEYS = ("pinned", "is_pinned", "sticky", "is_sticky", "announcement")
+
+
+def _is_pinned(item: Dict[str, Any]) -> bool:
+    post_data = item.get("post_data") or {}
+    return any(item.get(key) or post_data.get(key) for key in _PINNED_KEYS)
+
+
+def _below_watermark(items: List[Dict[str, Any]], watermark: float) -> bool:
+    """True once the tail of a loaded batch was last active before `watermark`:
+    listings are ordered by last activity, so nothing further down changed since
+    then. Folders and pinned topics lead a listing whatever their activity and
+    are ignored."""
+    activities = [
+        a for a in (
+            _item_activity(item) for item in items
+            if item.get("item_type") == "post" and not _is_pinned(item)
+        )
+        if a is not None
+    ]
+    return bool(activities) and activities[-1] < watermark
+
+
+def _merged_listing(first_filtered: Dict[str, Any], ajax_requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """`first_filtered` with the items of every later `fetch_more_items` XHR appended."""
+    items: List[Dict[str, Any]] = []
+    known = set()
+    no_more_items = None
+    pages = [first_filtered] + [
+        e for e in ajax_requests
+        if isinstance(e.get("post"), dict) and e["post"].get("a") == "fetch_more_items"
+    ]
+    for entry in pages:
+        for item in _listing_items(entry):
+            if item.get("item_id") not in known:
+                known.add(item.get("item_id"))
+                items.append(item)
+        category = ((entry.get("response_json") or {}).get("response") or {}).get("category") or {}
+        no_more_items = category.get("no_more_items", no_more_items)
+    resp_json = dict(first_filtered.get("response_json") or {})
+    response = dict(resp_json.get("response") or {})
+    response["category"] = dict(response.get("category") or {}, items=items, no_more_items=no_more_items)
+    resp_json["response"] = response
+    return dict(first_filtered, response_json=resp_json)
+
+
 async def crawl_category(
     url: str,
     browser,
@@ -198,13 +457,19 @@ async def crawl_category(
     # Optional: when returning HTML, wait for a specific element before scrolling/returning
     html_ready_xpath: str = "/html/body/div[1]/div[3]/div/div/div/div[3]",
     html_ready_timeout_ms: int = 15000,
+    # Unix time the listing was last crawled: stop loading more items once the
+    # loaded topics are older and return the merged JSON listing instead of HTML
+    watermark: Optional[float] = None,
+    # Category cells left in the DOM while scrolling (0 keeps everything)
+    harvest_keep: int = 200,
 ) -> Response:
     capture_types = {"xhr", "fetch"}
-    page = await browser.new_page()
+    page = await _new_page(browser, "category", url)
     ajax_requests: List[Dict[str, Any]] = []
     first_filtered_event = asyncio.Event()
     first_filtered: Optional[Dict[str, Any]] = None
     response = None
+    stage = "goto"
     try:
         async def on_request_finished(request):
             if getattr(request, "resource_type", None) not in capture_types:
@@ -268,10 +533,16 @@ async def crawl_category(
 
         page.on("requestfinished", on_request_finished)
 
-        response = await page.goto(url, wait_until=wait_until, timeout=timeout_ms)
-        await page.wait_for_selector(wait_for_selector, timeout=timeout_ms)
+        with span("goto", "category"):
+            response = await page.goto(url, wait_until=wait_until, timeout=timeout_ms)
+        _check_status(response, url)
+        stage = "wait_for_selector"
+        with span("wait_for_selector", "category"):
+            await page.wait_for_selector(wait_for_selector, timeout=timeout_ms)
 
-        await asyncio.wait_for(first_filtered_event.wait(), timeout=timeout_ms / 1000.0)
+        stage = "first_xhr"
+        with span("first_xhr", "category"):
+            await asyncio.wait_for(first_filtered_event.wait(), timeout=timeout_ms / 1000.0)
 
         # Decide whether we should switch to HTML mode (scroll and capture full content)
         should_return_html = False
@@ -284,6 +555,10 @@ async def crawl_category(
                 no_more_items = category_obj.get("no_more_items")
                 if isinstance(no_more_items, bool) and no_more_items is False:
                     should_return_html = True
+                if watermark is not None and _below_watermark(_listing_items(first_filtered), watermark):
+                    # Everything past the first page is older than the last crawl
+                    should_return_html = False
+                    mark("watermark_stop", "category", scrolls=0)
         except Exception:
             should_return_html = False
 
@@ -299,17 +574,19 @@ async def crawl_category(
                 "ajax_requests": ajax_requests,
                 "first_filtered": first_filtered,
             }
-            body_bytes = json.dumps(result, ensure_ascii=False).encode("utf-8")
-            return TextResponse(
-                url=url,
-                body=body_bytes,
-                status=(response.status if response else 200),
-                encoding="utf-8",
-                headers={"Content-Type": "application/json; charset=utf-8"},
-            )
+            with span("wrap_response", "category"):
+                body_bytes = json.dumps(result, ensure_ascii=False).encode("utf-8")
+                return TextResponse(
+                    url=url,
+                    body=body_bytes,
+                    status=(response.status if response else 200),
+                    encoding="utf-8",
+                    headers={"Content-Type": "application/json; charset=utf-8"},
+                )
 
         # Else: fully load via scrolling and return the entire HTML (similar to crawl_post)
         try:
+            stage = "html_ready"
             # If user provided a readiness element, wait for it first
             if html_ready_xpath:
                 await page.wait_for_selector(
@@ -319,83 +596,115 @@ async def crawl_category(
             if initial_wait_ms > 0:
                 await asyncio.sleep(max(0.0, initial_wait_ms / 1000.0))
 
-            last_scroll_height = 0
-            consecutive_no_progress = 0
-            for _ in range(max_scrolls):
-                # Scroll to bottom
-                await page.evaluate("() => window.scrollTo(0, document.body.scrollHeight)")
-                await asyncio.sleep(max(0.02, scroll_pause_ms / 1000.0))
+            stage = "scroll"
+            watermark_stop = False
+            checked = 0
+            harvested: List[str] = []
+            with span("scroll", "category"):
+                last_scroll_height = 0
+                consecutive_no_progress = 0
+                for scroll in range(max_scrolls):
+                    # Scroll to bottom
+                    await page.evaluate("() => window.scrollTo(0, document.body.scrollHeight)")
+                    await asyncio.sleep(max(0.02, scroll_pause_ms / 1000.0))
+                    harvested += await _harvest(page, FOLDER_GRID_XPATH, ".cmty-category-cell", harvest_keep, "category")
 
-                # Loader detection common to AoPS
-                loader = page.locator(".aops-loader")
-                loader_count = await loader.count()
-                loader_visible = await loader.is_visible() if loader_count > 0 else False
+                    # Loader detection common to AoPS
+                    loader = page.locator(".aops-loader")
+                    loader_count = await loader.count()
+                    loader_visible = await loader.is_visible() if loader_count > 0 else False
 
-                current_scroll_height = await page.evaluate("() => document.body.scrollHeight || 0")
-                if loader_visible:
-                    consecutive_no_progress = 0
-                    last_scroll_height = current_scroll_height
-                else:
-                    if current_scroll_height <= last_scroll_height:
-                        consecutive_no_progress += 1
-                    else:
+                    current_scroll_height = await page.evaluate("() => document.body.scrollHeight || 0")
+                    mark("scroll_step", "category", height=current_scroll_height, loader=loader_visible)
+                    if watermark is not None:
+                        loaded = ajax_requests[checked:]
+                        checked += len(loaded)
+                        if any(
+                            isinstance(e.get("post"), dict) and e["post"].get("a") == "fetch_more_items"
+                            and _below_watermark(_listing_items(e), watermark)
+                            for e in loaded
+                        ):
+                            watermark_stop = True
+                            mark("watermark_stop", "category", scrolls=scroll + 1)
+                            break
+                    if loader_visible:
                         consecutive_no_progress = 0
                         last_scroll_height = current_scroll_height
-
-                # If we have not progressed for a couple rounds, do a final settle check
-                if consecutive_no_progress >= 2:
-                    await asyncio.sleep(1.0)
-                    final_loader_visible = await page.locator(".aops-loader").is_visible()
-                    final_height = await page.evaluate("() => document.body.scrollHeight || 0")
-                    if not final_loader_visible and final_height <= last_scroll_height:
-                        break
                     else:
-                        consecutive_no_progress = 0
-                        last_scroll_height = final_height
+                        if current_scroll_height <= last_scroll_height:
+                            consecutive_no_progress += 1
+                        else:
+                            consecutive_no_progress = 0
+                            last_scroll_height = current_scroll_height
 
-            html_content = await page.content()
+                    # If we have not progressed for a couple rounds, do a final settle check
+                    if consecutive_no_progress >= 2:
+                        await asyncio.sleep(1.0)
+                        final_loader_visible = await page.locator(".aops-loader").is_visible()
+                        final_height = await page.evaluate("() => document.body.scrollHeight || 0")
+                        if not final_loader_visible and final_height <= last_scroll_height:
+                            break
+                        else:
+                            consecutive_no_progress = 0
+                            last_scroll_height = final_height
 
-            return HtmlResponse(
-                url=(response.url if response else url),
-                body=(html_content or "").encode("utf-8"),
-                status=(response.status if response else 200),
-                encoding="utf-8",
-                headers={"Content-Type": "text/html; charset=utf-8"},
-            )
-        except Exception:
-            # Fallback to JSON snapshot if scrolling/rendering failed
-            try:
-                result_fallback: Dict[str, Any] = {
+            if watermark_stop:
+                result = {
                     "url": url,
                     "final_url": page.url,
                     "status": (response.status if response else None),
                     "title": title,
                     "ajax_requests": ajax_requests,
-                    "first_filtered": first_filtered,
+                    "first_filtered": _merged_listing(first_filtered, ajax_requests),
+                    "watermark": watermark,
                 }
-                body_bytes_fb = json.dumps(result_fallback, ensure_ascii=False).encode("utf-8")
-                return TextResponse(
-                    url=url,
-                    body=body_bytes_fb,
+                with span("wrap_response", "category"):
+                    return TextResponse(
+                        url=url,
+                        body=json.dumps(result, ensure_ascii=False).encode("utf-8"),
+                        status=(response.status if response else 200),
+                        encoding="utf-8",
+                        headers={"Content-Type": "application/json; charset=utf-8"},
+                    )
+
+            stage = "content"
+            with span("content", "category"):
+                html_content = _splice_harvested(await page.content(), harvested, url)
+
+            with span("wrap_response", "category"):
+                return HtmlResponse(
+                    url=(response.url if response else url),
+                    body=(html_content or "").encode("utf-8"),
                     status=(response.status if response else 200),
                     encoding="utf-8",
-                    headers={"Content-Type": "application/json; charset=utf-8"},
+                    headers={"Content-Type": "text/html; charset=utf-8"},
                 )
-            except Exception:
-                # Re-raise outer exception path
-                raise
-    except PlaywrightTimeoutError:
-        try:
-            logger.debug("Timeout while crawling category %s", url)
-        except Exception:
-            pass
-        raise TwistedTimeoutError("TimeoutError")
-    except Exception:
-        try:
-            logger.exception("Unexpected error while crawling category %s", url)
-        except Exception:
-            pass
-        raise TwistedTimeoutError("TimeoutError")
+        except Exception as e:
+            # Salvage the JSON snapshot (first listing page) if scrolling/rendering failed
+            error = classify_error(e, stage, url)
+            result_fallback: Dict[str, Any] = {
+                "url": url,
+                "final_url": url,
+                "status": (response.status if response else None),
+                "title": title,
+                "ajax_requests": list(ajax_requests),
+                "first_filtered": first_filtered,
+            }
+            body_bytes_fb = json.dumps(result_fallback, ensure_ascii=False).encode("utf-8")
+            error.partial = TextResponse(
+                url=url,
+                body=body_bytes_fb,
+                status=(response.status if response else 200),
+                encoding="utf-8",
+                headers={"Content-Type": "application/json; charset=utf-8"},
+                flags=["partial"],
+            )
+            error.loaded = len(ajax_requests)
+            raise error from e
+    except Exception as e:
+        error = classify_error(e, stage, url)
+        _log_failure(error, "category", url)
+        raise error from e
     finally:
         try:
             await page.close()
@@ -418,10 +727,22 @@ async def crawl_post(
     scroll_selector:str = "/html/body/div[1]/div[3]/div/div/div[3]/div/div[4]/div/div[2]",
     ready_xpath: str = '//*[@id="cmty-topic-view-right"]/div/div[4]/div/div[2]/div/div[2]',
     ready_timeout_ms: int = 15000,
+    resume_from: int = 0,
+    # Topic view opened at the last post a failed attempt loaded (see
+    # `_resume_point`); scrolling starts there instead of at the first post
+    resume_url: Optional[str] = None,
+    resume_post_id: Optional[int] = None,
+    # Posts left in the DOM while scrolling; older ones are harvested and
+    # detached so long topics keep a bounded DOM (0 keeps everything)
+    harvest_keep: int = 40,
 ) -> Response:
-    page = await browser.new_page()
+    if not (resume_url and resume_post_id is not None):
+        resume_url = resume_post_id = None
+    page = await _new_page(browser, "post", url)
     response = None
     html_content = ""
+    harvested: List[str] = []
+    stage = "goto"
     try:
         if block_images:
             async def _block_images_route(route):
@@ -434,14 +755,18 @@ async def crawl_post(
                     await route.continue_()
             await page.route("**/*", _block_images_route)
 
-        response = await page.goto(url, wait_until=wait_until, timeout=timeout_ms)
-        await page.wait_for_selector(wait_for_selector, timeout=timeout_ms)
+        with span("goto", "post"):
+            response = await page.goto(resume_url or url, wait_until=wait_until, timeout=timeout_ms)
+        _check_status(response, url)
+        stage = "wait_for_selector"
+        with span("wait_for_selector", "post"):
+            await page.wait_for_selector(wait_for_selector, timeout=timeout_ms)
 
-        if ready_xpath:
-            await page.wait_for_selector(
-                ready_xpath if ready_xpath.startswith("xpath=") else f"xpath={ready_xpath}",
-                timeout=ready_timeout_ms,
-            )
+            if ready_xpath:
+                await page.wait_for_selector(
+                    ready_xpath if ready_xpath.startswith("xpath=") else f"xpath={ready_xpath}",
+                    timeout=ready_timeout_ms,
+                )
 
         sel = scroll_selector.strip()
         sel_for_wait = sel if sel.startswith("xpath=") else f"xpath={sel}"
@@ -451,83 +776,387 @@ async def crawl_post(
             await asyncio.sleep(initial_wait_ms / 1000.0)
 
         locator = page.locator(sel_for_wait)
+        posts_locator = page.locator(f"xpath={POSTS_XPATH}/div[contains(@class, 'cmty-post')]")
         consecutive_no_loader_checks = 0
         last_scroll_height = 0
 
-        while True:
-            current_scroll_height = await locator.evaluate("el => el ? el.scrollHeight : 0")
-
-            await locator.evaluate("el => { if (el) el.scrollTop = el.scrollHeight; }")
+        stage = "scroll"
+        with span("scroll", "post"):
+            while True:
+                current_scroll_height = await locator.evaluate("el => el ? el.scrollHeight : 0")
 
-            await asyncio.sleep(max(0.02, scroll_pause_ms / 1000.0))
+                await locator.evaluate("el => { if (el) el.scrollTop = el.scrollHeight; }")
 
-            loader = page.locator(".aops-loader")
-            loader_count = await loader.count()
-            loader_visible = await loader.is_visible() if loader_count > 0 else False
+                await asyncio.sleep(max(0.02, scroll_pause_ms / 1000.0))
+                harvested += await _harvest(page, POSTS_XPATH, ":scope > div.cmty-post", harvest_keep, "post")
 
-            if loader_visible:
-                consecutive_no_loader_checks = 0
-                last_scroll_height = current_scroll_height
-            else:
-                consecutive_no_loader_checks += 1
+                loader = page.locator(".aops-loader")
+                loader_count = await loader.count()
+                loader_visible = await loader.is_visible() if loader_count > 0 else False
+                mark("scroll_step", "post", height=current_scroll_height, loader=loader_visible)
 
-            if consecutive_no_loader_checks >= 1:
-                await asyncio.sleep(1.0)
-                final_loader_check = await page.locator(".aops-loader").is_visible()
-                final_scroll_height = await locator.evaluate("el => el ? el.scrollHeight : 0")
-                if not final_loader_check and final_scroll_height <= last_scroll_height:
-                    break
-                else:
+                if loader_visible:
                     consecutive_no_loader_checks = 0
-                    last_scroll_height = final_scroll_height
+                    last_scroll_height = current_scroll_height
+                else:
+                    consecutive_no_loader_checks += 1
 
-        html_content = await page.content()
-    except PlaywrightTimeoutError:
-        try:
-            logger.debug("Timeout while crawling %s", url)
-        except Exception:
-            pass
-        raise TwistedTimeoutError("TimeoutError")
-    except Exception:
-        try:
-            logger.exception("Unexpected error while crawling %s", url)
-        except Exception:
-            pass
-        raise TwistedTimeoutError("TimeoutError")
+                if (consecutive_no_loader_checks >= 1 and resume_from > 0 and resume_url is None
+                        and current_scroll_height > last_scroll_height):
+                    # Resuming a partial fetch whose posts showed no id to open
+                    # the topic at: skip the settle wait while still growing
+                    # towards the posts the previous attempt had loaded
+                    if len(harvested) + await posts_locator.count() < resume_from:
+                        consecutive_no_loader_checks = 0
+                        last_scroll_height = current_scroll_height
+                        continue
+
+                if consecutive_no_loader_checks >= 1:
+                    await asyncio.sleep(1.0)
+                    final_loader_check = await page.locator(".aops-loader").is_visible()
+                    final_scroll_height = await locator.evaluate("el => el ? el.scrollHeight : 0")
+                    if not final_loader_check and final_scroll_height <= last_scroll_height:
+                        break
+                    else:
+                        consecutive_no_loader_checks = 0
+                        last_scroll_height = final_scroll_height
+
+        stage = "content"
+        with span("content", "post"):
+            html_content = _splice_harvested(await page.content(), harvested, url)
+    except Exception as e:
+        error = classify_error(e, stage, url)
+        if stage == "scroll":
+            # Keep the posts loaded so far; the retry opens the topic at the
+            # last of them and scrolls on from there
+            try:
+                if len(harvested) + await posts_locator.count():
+                    partial = HtmlResponse(
+                        url=(response.url if response else url),
+                        body=_splice_harvested(await page.content(), harvested, url).encode("utf-8"),
+                        status=(response.status if response else 200),
+                        encoding="utf-8",
+                        headers={"Content-Type": "text/html; charset=utf-8"},
+                        flags=["partial"],
+                    )
+                    posts = partial.xpath(POSTS_XPATH).xpath('./div[contains(@class, "cmty-post")]').getall()
+                    first = 0
+                    if resume_url is not None:
+                        first = resume_offset([post_id_of(p) for p in posts], resume_from, resume_post_id)
+                    if posts and first is not None:
+                        error.partial = partial
+                        error.loaded = first + len(posts)
+                        error.resume_url, error.resume_post_id = _resume_point(partial.url, posts[-1])
+            except Exception:
+                pass
+        _log_failure(error, "topic", url)
+        raise error from e
     finally:
         try:
             await page.close()
         except Exception:
             pass
 
-    return HtmlResponse(
-        url=(response.url if response else url),
-        body=(html_content or "").encode("utf-8"),
-        status=(response.status if response else 200),
-        encoding="utf-8",
-        headers={"Content-Type": "text/html; charset=utf-8"},
+    with span("wrap_response", "post"):
+        return HtmlResponse(
+            url=(response.url if response else url),
+            body=(html_content or "").encode("utf-8"),
+            status=(response.status if response else 200),
+            encoding="utf-8",
+            headers={"Content-Type": "text/html; charset=utf-8"},
+        )
+
+
+_ID_LINE_RE = re.compile(r"^(?P<prefix>[cp])?(?P<id>\d+)$")
+
+
+def _read_ids(lines, default_driver: str):
+    """
+    (driver, id, parent_id) per input line: `c<id>` is a category, `p<id>` a
+    topic, a bare id uses `default_driver`; an optional second column is the
+    parent category of a topic. Blank lines and `#` comments are skipped.
+    """
+    for lineno, line in enumerate(lines, 1):
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        m = _ID_LINE_RE.match(fields[0].lower())
+        if not m or (len(fields) > 1 and not fields[1].isdigit()):
+            logger.warning(f"[BatchFetch] Skipping malformed line {lineno}: {line.strip()!r}")
+            continue
+        driver = {"c": "category", "p": "post"}.get(m.group("prefix") or "", default_driver)
+        yield driver, int(m.group("id")), int(fields[1]) if len(fields) > 1 else None
+
+
+class _JsonlResults:
+    """One JSON line per fetched page or failure; ids with an "ok" line are done."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fh = None
+        self._done = set()
+
+    async def open(self) -> None:
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of an interrupted run
+                    if record.get("status") == "ok":
+                        self._done.add((record.get("driver"), record.get("id")))
+        self._fh = open(self.path, "a", encoding="utf-8")
+
+    async def is_done(self, driver: str, item_id: int) -> bool:
+        return (driver, item_id) in self._done
+
+    async def write(self, driver: str, item_id: int, parent_id: Optional[int], response: Response) -> None:
+        self._append({
+            "driver": driver,
+            "id": item_id,
+            "parent_id": parent_id,
+            "status": "ok",
+            "url": response.url,
+            "http_status": response.status,
+            "content_type": (response.headers.get(b"Content-Type") or b"").decode("latin-1"),
+            "fetched_at": time.time(),
+            "body": response.text,
+        })
+
+    async def write_error(self, driver: str, item_id: int, parent_id: Optional[int], error: BaseException) -> None:
+        self._append({
+            "driver": driver,
+            "id": item_id,
+            "parent_id": parent_id,
+            "status": "error",
+            "error": type(error).__name__,
+            "message": str(error),
+            "fetched_at": time.time(),
+        })
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._fh.flush()
+
+    async def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+class _SqliteResults:
+    """
+    Runs each page through the spider callback and the item pipeline, exactly
+    as a crawl would store it; ids recorded in the `seen` table are done.
+    Requests the callbacks yield (subcategories, topics) are not followed.
+
+    Parsing and SQLite writes run on one writer thread (SQLite connections
+    belong to the thread that opened them), never on the fetching event loop.
+    """
+
+    def __init__(self, sqlite_path: str, settings) -> None:
+        self.sqlite_path = sqlite_path
+        self._settings = settings
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._spider = None
+        self._pipeline = None
+        self._store = None
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def open(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aops-batch-store")
+        await self._call(self._open)
+
+    async def is_done(self, driver: str, item_id: int) -> bool:
+        return await self._call(self._is_done, driver, item_id)
+
+    async def write(self, driver: str, item_id: int, parent_id: Optional[int], response: Response) -> None:
+        await self._call(self._write, driver, item_id, parent_id, response)
+
+    async def write_error(self, driver: str, item_id: int, parent_id: Optional[int], error: BaseException) -> None:
+        pass  # not marked as seen, so the next run retries it
+
+    async def close(self) -> None:
+        if self._executor is None:
+            return
+        try:
+            await self._call(self._close)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # ---- writer thread ----
+    def _open(self) -> None:
+        # Imported here: the pipeline and spider import this module
+        from scrapy.crawler import Crawler
+        from scrapy.settings import Settings
+        from scrapy.statscollectors import MemoryStatsCollector
+        from aops_crawler.db.sqlite_store import SqliteStore
+        from aops_crawler.pipelines import AopsCrawlerPipeline
+        from aops_crawler.spiders.aops_spider import QuotesSpider
+
+        aops_settings = {k: v for k, v in self._settings.copy_to_dict().items() if k.startswith("AOPS_")}
+        aops_settings["AOPS_SQLITE_PATH"] = self.sqlite_path
+        # Never crawled: only gives the spider and pipeline their settings and stats
+        crawler = Crawler(QuotesSpider, Settings(aops_settings))
+        crawler.stats = MemoryStatsCollector(crawler)
+        self._spider = QuotesSpider.from_crawler(crawler)
+        self._pipeline = AopsCrawlerPipeline.from_crawler(crawler)
+        self._store = SqliteStore(self.sqlite_path)
+        self._store.open()
+
+    def _is_done(self, driver: str, item_id: int) -> bool:
+        return self._store.get_seen(driver, item_id) is not None
+
+    def _write(self, driver: str, item_id: int, parent_id: Optional[int], response: Response) -> None:
+        from scrapy.http import Request
+
+        meta = {"driver": driver, "id": item_id, "parent_id": parent_id}
+        response = response.replace(request=Request(response.url, meta=meta))
+        callback = getattr(self._spider, self._spider.DRIVER_CALLBACKS[driver])
+        for output in callback(response) or ():
+            if not isinstance(output, Request):
+                self._pipeline.process_item(output, self._spider)
+        self._store.mark_fetched(driver, item_id, time.time(), hashlib.sha1(response.body).hexdigest())
+        self._store.commit()
+
+    def _close(self) -> None:
+        if self._pipeline is not None:
+            self._pipeline.close_spider(self._spider)
+        if self._store is not None:
+            self._store.close()
+
+
+async def batch_fetch(ids, browser, results, *, base_url: str = "https://artofproblemsolving.com",
+                      workers: int = 4, limiter=None, resume: bool = True) -> Dict[str, int]:
+    """
+    Fetch every (driver, id, parent_id) of `ids` with up to `workers` pages
+    open at once and hand each page (or failure) to `results`. With `resume`,
+    ids `results` already has are skipped.
+    """
+    counts = {"ok": 0, "failed": 0, "skipped": 0}
+    await results.open()
+    base_url = base_url.rstrip("/")
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, workers) * 2)
+
+    async def _worker():
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            driver, item_id, parent_id = entry
+            url = f"{base_url}/community/{'p' if driver == 'post' else 'c'}{item_id}"
+            ready_at = limiter.reserve(driver) if limiter is not None else None
+            if ready_at is not None and ready_at > time.monotonic():
+                await asyncio.sleep(ready_at - time.monotonic())
+            try:
+                if driver == "post":
+                    response = await crawl_post(url, browser)
+                else:
+                    response = await crawl_category(url, browser)
+            except Exception as e:
+                counts["failed"] += 1
+                logger.warning(f"[BatchFetch] {driver} {item_id} failed: {type(e).__name__}: {e}")
+                await results.write_error(driver, item_id, parent_id, e)
+                continue
+            try:
+                await results.write(driver, item_id, parent_id, response)
+                counts["ok"] += 1
+                logger.info(f"[BatchFetch] {driver} {item_id}: {len(response.body)} bytes")
+            except Exception as e:
+                counts["failed"] += 1
+                logger.warning(f"[BatchFetch] Failed to store {driver} {item_id}: {e}")
+
+    tasks = [asyncio.create_task(_worker()) for _ in range(max(1, workers))]
+    try:
+        for driver, item_id, parent_id in ids:
+            if resume and await results.is_done(driver, item_id):
+                counts["skipped"] += 1
+                continue
+            await queue.put((driver, item_id, parent_id))
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        await results.close()
+    return counts
+
+
+def main(argv=None) -> int:
+    import argparse
+    from scrapy.utils.project import get_project_settings
+    from aops_crawler.browser_service import resolve_launch_profile, split_launch_options
+    from aops_crawler.ratelimit import RateLimiter
+
+    parser = argparse.ArgumentParser(
+        description="Fetch a list of category / topic ids with the browser drivers, without a Scrapy crawl"
     )
+    parser.add_argument("ids", nargs="?", default="-",
+                        help="file with one id per line: c<id>, p<id> [parent category id], or a bare id (default: stdin)")
+    parser.add_argument("--driver", choices=("category", "post"), default="post", help="driver for bare ids (default: post)")
+    parser.add_argument("--workers", type=int, default=4, help="pages fetched concurrently (default: 4)")
+    out = parser.add_mutually_exclusive_group()
+    out.add_argument("--db", default=None, help="store through the item pipeline into this database (default: AOPS_SQLITE_PATH)")
+    out.add_argument("--jsonl", default=None, help="append raw pages to this JSONL file instead")
+    parser.add_argument("--refetch", action="store_true", help="also fetch ids the output already has")
+    parser.add_argument("--no-rate-limit", action="store_true", help="ignore AOPS_RATE_LIMITS")
+    parser.add_argument("--channel", default=None, help="browser channel (default: AOPS_BROWSER_CHANNEL)")
+    parser.add_argument("--headed", action="store_true", help="show the browser window")
+    args = parser.parse_args(argv)
 
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    settings = get_project_settings()
+    if args.jsonl:
+        results = _JsonlResults(args.jsonl)
+    else:
+        sqlite_path = args.db or settings.get("AOPS_SQLITE_PATH")
+        if not sqlite_path:
+            parser.error("no --db or --jsonl given and AOPS_SQLITE_PATH is not set")
+        results = _SqliteResults(sqlite_path, settings)
 
-async def main():
-    # print("Starting...")
-    async with async_playwright() as p:
-        browser = await p.chromium.launch_persistent_context(headless=False, channel="msedge", no_viewport=True, user_data_dir="./browser_data/msedge")
-        res = await crawl_post(
-            "https://artofproblemsolving.com/community/c6h3358923p31205921",
-            browser=browser,
-        )
-        # print(res.xpath('normalize-space(substring-after(string(//div[contains(@class,"cmty-topic-source-display")]), ":"))').get())
-        # Example tag extraction (kept for reference)
-        _ = [
-            t.strip()
-            for t in res.xpath(f'{TAGS_XPATH}//a/div[contains(@class,"cmty-item-tag")]/text()').getall()
-            if t and t.strip()
-        ]
-        # print(tag_texts)
-        for item in res.xpath('/html/body/div[1]/div[3]/div/div/div[3]/div/div[4]/div/div[2]/div').xpath('./div[contains(@class, "cmty-post")]'):
-            _ = item  # noop to avoid unused warnings in sample code
+    channel = args.channel or settings.get("AOPS_BROWSER_CHANNEL", "msedge")
+    # Own profile directory: the crawl's may be locked by a running browser
+    user_data_dir = f"{settings.get('AOPS_BROWSER_USER_DATA_DIR') or f'./browser_data/{channel}'}-batch"
+    launch_options = resolve_launch_profile(settings, user_data_dir)
+    headless = launch_options.pop("headless", settings.getbool("AOPS_HEADLESS", False)) and not args.headed
+    limiter = None if args.no_rate_limit else RateLimiter.from_settings(settings)
+
+    async def _run():
+        launch_kwargs, context_kwargs = split_launch_options(launch_options)
+        async with async_playwright() as p:
+            browser = await p.chromium.launch_persistent_context(
+                headless=headless,
+                channel=channel,
+                user_data_dir=user_data_dir,
+                **launch_kwargs,
+                **context_kwargs,
+            )
+            try:
+                lines = sys.stdin if args.ids == "-" else open(args.ids, encoding="utf-8")
+                with lines:
+                    return await batch_fetch(
+                        _read_ids(lines, args.driver),
+                        browser,
+                        results,
+                        base_url=settings.get("AOPS_BASE_URL") or "https://artofproblemsolving.com",
+                        workers=args.workers,
+                        limiter=limiter,
+                        resume=not args.refetch,
+                    )
+            finally:
+                await browser.close()
+
+    started = time.monotonic()
+    counts = asyncio.run(_run())
+    print(f"Fetched {counts['ok']}, failed {counts['failed']}, skipped {counts['skipped']} "
+          f"in {time.monotonic() - started:.1f}s")
+    return 1 if counts["failed"] else 0
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    sys.exit(main())
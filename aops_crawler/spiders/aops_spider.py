@@ -1,28 +1,98 @@
+import hashlib
 import json
 import scrapy
 from aops_crawler.items import CategoryItem, PostItem
+from aops_crawler.priorities import PriorityPolicy, estimate_cost
 import logging
 import re
 
 logger = logging.getLogger(__name__)
 
+BASE_URL = "https://artofproblemsolving.com"
+
+# Listing fields that change when something below an item changes
+_FOLDER_ACTIVITY_KEYS = ("last_post_time", "last_update_time", "num_posts", "num_topics", "num_items")
+_TOPIC_ACTIVITY_KEYS = ("num_posts", "last_post_time", "last_update_time")
+
+
+def listing_fingerprint(items):
+    """
+    (fingerprint, children) of a `fetch_category_data` item list. The
+    fingerprint hashes every item id and type with its activity fields;
+    `children` are the (driver, id) of items that carry such fields, i.e. whose
+    subtree is covered by the fingerprint. Folders without activity fields are
+    left out of `children` and are always revisited.
+    """
+    digest = hashlib.sha1()
+    children = set()
+    for item in sorted(items, key=lambda it: (str(it.get("item_type")), str(it.get("item_id")))):
+        item_type = item.get("item_type")
+        if item_type == "post":
+            source, keys, driver = item.get("post_data") or {}, _TOPIC_ACTIVITY_KEYS, "post"
+        else:
+            source, keys, driver = item, _FOLDER_ACTIVITY_KEYS, "category"
+        activity = [source.get(key) for key in keys]
+        digest.update(json.dumps([item.get("item_id"), item_type, activity], default=str).encode("utf-8"))
+        if item.get("item_id") is not None and any(value is not None for value in activity):
+            children.add((driver, item.get("item_id")))
+    return digest.hexdigest(), children
+
+
+def listed_activity(item):
+    """Last activity of a topic as shown in its category listing (epoch seconds), or None."""
+    post_data = item.get("post_data") or {}
+    value = post_data.get("last_post_time") or post_data.get("last_update_time")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
 class QuotesSpider(scrapy.Spider):
     name = "aops_crawler"
 
+    # Callback per download driver, so requests can be rebuilt from (driver, id) alone
+    DRIVER_CALLBACKS = {
+        "contest": "parse_contest",
+        "category": "parse_category",
+        "post": "parse_post",
+    }
+
+    _priority_policy = None
+
+    @property
+    def base_url(self):
+        # AOPS_BASE_URL points the crawl at a stand-in server (see aops_crawler.bench)
+        return (self.settings.get("AOPS_BASE_URL") or BASE_URL).rstrip("/")
+
+    @property
+    def priority_policy(self):
+        if self._priority_policy is None:
+            self._priority_policy = PriorityPolicy.from_settings(self.settings)
+        return self._priority_policy
+
+    def request_for(self, driver, item_id, parent_id=None, *, response=None, cost=None, **kwargs):
+        """Build the request for (driver, id); priority follows `PriorityPolicy` unless given."""
+        if "priority" not in kwargs:
+            depth = response.meta.get("depth", 0) + 1 if response is not None else 0
+            kwargs["priority"] = self.priority_policy.priority(driver, depth, cost)
+        prefix = "p" if driver == "post" else "c"
+        meta = dict(kwargs.pop("meta", None) or {})
+        meta.update({
+            "driver": driver,
+            "id": item_id,
+            "parent_id": parent_id,
+        })
+        return scrapy.Request(
+            url=f"{self.base_url}/community/{prefix}{item_id}",
+            callback=getattr(self, self.DRIVER_CALLBACKS[driver]),
+            meta=meta,
+            **kwargs,
+        )
+
     async def start(self):
-        urls = [
-            "https://artofproblemsolving.com/community/c13",
-        ]
-        for url in urls:
-            yield scrapy.Request(
-                url=url,
-                callback=self.parse_contest,
-                meta={
-                    "driver": "contest",
-                    "id": 13,
-                    "parent_id": None,
-                },
-            )
+        for contest_id in self.settings.getlist("AOPS_SEED_CONTESTS") or [13]:
+            yield self.request_for("contest", int(contest_id))
 
     def parse_contest(self, response):
         # response.body is json.dump.encode('utf-8') we need to decode it to a object   
@@ -39,15 +109,7 @@ class QuotesSpider(scrapy.Spider):
                 logger.info(f"[Spider] Found {len(cats)} categories in contest page")
                 for c in cats :
                     if "category_id" in c:
-                        yield scrapy.Request(
-                            url=f"https://artofproblemsolving.com/community/c{c.get('category_id')}",
-                            callback=self.parse_category,
-                            meta={
-                                "driver": "category",
-                                "id": c.get("category_id"),
-                                "parent_id": response.meta.get("id", 13),
-                            },
-                        )
+                        yield self.request_for("category", c.get("category_id"), response.meta.get("id", 13), response=response)
                         # yield scrapy.Request(url=, callback=self.parse_contest,meta={"driver":"contest"})
     def parse_category(self, response):
         # Keep JSON-based logic; skip DOM parsing (to be implemented manually).
@@ -77,18 +139,10 @@ class QuotesSpider(scrapy.Spider):
                 if not subtitle:
                     subtitle = (el.css('.cmty-category-cell-long-desc::text').get() or '').strip()
 
-                normalized_url = f"https://artofproblemsolving.com/community/c{item_id}"
+                normalized_url = f"{self.base_url}/community/c{item_id}"
 
                 # Recurse to subcategories
-                yield scrapy.Request(
-                    url=normalized_url,
-                    callback=self.parse_category,
-                    meta={
-                        "driver": "category",
-                        "id": item_id,
-                        "parent_id": parent_id,
-                    }
-                )
+                yield self.request_for("category", item_id, parent_id, response=response)
 
                 # Emit CategoryItem compatible with pipelines
                 yield CategoryItem(
@@ -116,37 +170,31 @@ class QuotesSpider(scrapy.Spider):
         items = (category_data or {}).get("items", [])
 
         logger.info(f"[Spider] Category {response.meta.get('id')} has {len(items)} items (JSON)")
+        # Read by ListingFingerprintSpiderMiddleware to skip unchanged subtrees
+        response.meta["listing_fingerprint"], response.meta["listing_children"] = listing_fingerprint(items)
 
         for item in items:
             item_id = item.get("item_id")
             item_type = item.get("item_type")
 
             if item_type == "folder" or item_type == 'view_posts':
-                yield scrapy.Request(
-                    url=f"https://artofproblemsolving.com/community/c{item_id}",
-                    callback=self.parse_category,
-                    meta={
-                        "driver": "category",
-                        "id": item_id,
-                        "parent_id": response.meta.get("id"),
-                    }
-                )
+                yield self.request_for("category", item_id, response.meta.get("id"), response=response)
                 yield CategoryItem(
                     category_id=item_id,
                     parent_id=response.meta.get("id"),
                     name=item.get("title") or item.get("name") or item.get("item_text"),
-                    url=f"https://artofproblemsolving.com/community/c{item_id}",
+                    url=f"{self.base_url}/community/c{item_id}",
                     raw=item,
                 )
             elif item_type == "post" and item.get("post_data", {}).get("post_type") == "forum":
-                yield scrapy.Request(
-                    url=f"https://artofproblemsolving.com/community/p{item_id}",
-                    callback=self.parse_post,
-                    meta={
-                        "driver": "post",
-                        "id": item_id,
-                        "parent_id": response.meta.get("id"),
-                    }
+                yield self.request_for(
+                    "post",
+                    item_id,
+                    response.meta.get("id"),
+                    response=response,
+                    cost=estimate_cost(item),
+                    # Lets the topic past the seen-store TTL when it has replies since its last fetch
+                    meta={"listed_activity": listed_activity(item)},
                 )
     def parse_post(self, response):
         yield PostItem(
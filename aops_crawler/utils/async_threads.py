@@ -43,33 +43,54 @@ def start_background_proactor_loop():
     return deferToThread(_start)
 
 
+def _ensure_background_loop():
+    """The persistent background loop, started synchronously if needed."""
+    import asyncio
+    global _BG_LOOP, _BG_THREAD
+    if _BG_LOOP is None:
+        import sys
+        if sys.platform.startswith("win"):
+            asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+        from threading import Event, Thread
+        loop = asyncio.new_event_loop()
+        ready = Event()
+        def _run():
+            asyncio.set_event_loop(loop)
+            ready.set()
+            loop.run_forever()
+        t = Thread(target=_run, name="bg-proactor-loop", daemon=True)
+        t.start()
+        ready.wait()  # Wait for loop to be ready before proceeding
+        # publish
+        _BG_LOOP = loop
+        _BG_THREAD = t
+    return _BG_LOOP
+
+
 def run_coro_on_background_loop(coro):
-    """Schedule a coroutine on the persistent background loop, return Deferred."""
-    def _submit():
-        import asyncio
-        global _BG_LOOP
-        if _BG_LOOP is None:
-            # start synchronously in this worker thread
-            import sys
-            if sys.platform.startswith("win"):
-                asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-            from threading import Event, Thread
-            loop = asyncio.new_event_loop()
-            ready = Event()
-            def _run():
-                asyncio.set_event_loop(loop)
-                ready.set()
-                loop.run_forever()
-            t = Thread(target=_run, name="bg-proactor-loop", daemon=True)
-            t.start()
-            ready.wait()  # Wait for loop to be ready before proceeding
-            # publish
-            global _BG_THREAD
-            _BG_LOOP = loop
-            _BG_THREAD = t
-        fut = asyncio.run_coroutine_threadsafe(coro, _BG_LOOP)
-        return fut.result()
-    return deferToThread(_submit)
+    """
+    Schedule a coroutine on the persistent background loop, return a Deferred
+    fired on the reactor thread. No reactor pool thread is held while the
+    coroutine runs, so the number of concurrent pages is not capped by
+    REACTOR_THREADPOOL_MAXSIZE. Cancelling the Deferred cancels the coroutine.
+    """
+    import asyncio
+    from twisted.internet import defer, reactor
+
+    fut = asyncio.run_coroutine_threadsafe(coro, _ensure_background_loop())
+    d = defer.Deferred(lambda _: fut.cancel())
+
+    def _fire(f):
+        if d.called:
+            return
+        if f.cancelled():
+            d.errback(defer.CancelledError())
+        elif f.exception() is not None:
+            d.errback(f.exception())
+        else:
+            d.callback(f.result())
+    fut.add_done_callback(lambda f: reactor.callFromThread(_fire, f))
+    return d
 
 
 def stop_background_proactor_loop():
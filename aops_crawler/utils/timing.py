@@ -0,0 +1,146 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from aops_crawler.utils.trace import get_tracer
+
+__all__ = ["LatencyRecorder", "get_recorder", "span", "record_interval", "mark"]
+
+# Log-scale buckets: 4 per doubling from 0.5 ms up to ~17 minutes, plus an
+# overflow bucket (index _NUM_BUCKETS) that only the +Inf bound counts
+_BUCKET_BASE = 0.0005
+_BUCKETS_PER_DOUBLING = 4
+_NUM_BUCKETS = 4 * 21 + 1
+_BOUNDS: List[float] = [_BUCKET_BASE * 2 ** (i / _BUCKETS_PER_DOUBLING) for i in range(_NUM_BUCKETS)]
+
+
+def _bucket_index(seconds: float) -> int:
+    if seconds <= _BUCKET_BASE:
+        return 0
+    if seconds > _BOUNDS[-1]:
+        return _NUM_BUCKETS
+    i = int(math.ceil(math.log2(seconds / _BUCKET_BASE) * _BUCKETS_PER_DOUBLING))
+    return min(i, _NUM_BUCKETS - 1)
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (_NUM_BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, c in zip(_BOUNDS, self.counts):
+            seen += c
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class LatencyRecorder:
+    """
+    Thread-safe per-(stage, driver) latency histograms.
+
+    Recording is a bucket increment under a lock, cheap enough to leave on for
+    every browser fetch and pipeline step; quantiles are estimated from the
+    fixed log-scale buckets (within ~19%).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._hists: Dict[Tuple[str, str], _Histogram] = {}
+        self.enabled = True
+
+    def record(self, stage: str, seconds: float, driver: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        key = (stage, driver or "-")
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = _Histogram()
+            h.counts[_bucket_index(seconds)] += 1
+            h.count += 1
+            h.total += seconds
+            if seconds > h.max:
+                h.max = seconds
+
+    def snapshot(self) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """Per (stage, driver): count, sum, max and p50/p95/p99 in seconds."""
+        with self._lock:
+            return {
+                key: {
+                    "count": h.count,
+                    "sum": h.total,
+                    "max": h.max,
+                    "p50": h.quantile(0.50),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for key, h in self._hists.items()
+            }
+
+    def prometheus_text(self, metric: str = "aops_stage_latency_seconds") -> str:
+        """Render all histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {metric} Latency of crawler stages per download driver.",
+            f"# TYPE {metric} histogram",
+        ]
+        with self._lock:
+            items = sorted((k, list(h.counts), h.count, h.total) for k, h in self._hists.items())
+        for (stage, driver), counts, count, total in items:
+            labels = f'stage="{stage}",driver="{driver}"'
+            cumulative = 0
+            for bound, c in zip(_BOUNDS, counts):
+                cumulative += c
+                lines.append(f'{metric}_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hists.clear()
+
+
+_RECORDER = LatencyRecorder()
+
+
+def get_recorder() -> LatencyRecorder:
+    return _RECORDER
+
+
+def record_interval(stage: str, start: float, end: float, driver: Optional[str] = None, **args: Any) -> None:
+    """Record an interval measured elsewhere (two `perf_counter()` readings)."""
+    _RECORDER.record(stage, end - start, driver)
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.complete(stage, start, end, cat=driver, args=args)
+
+
+def mark(name: str, driver: Optional[str] = None, **args: Any) -> None:
+    """Instant trace event (no histogram), e.g. one per scroll iteration."""
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.instant(name, cat=driver, args=args)
+
+
+@contextmanager
+def span(stage: str, driver: Optional[str] = None, **args: Any):
+    """Time the enclosed block into the process-wide recorder (also on errors),
+    and into the trace timeline when tracing is on."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_interval(stage, start, time.perf_counter(), driver, **args)
@@ -0,0 +1,122 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+__all__ = ["TraceRecorder", "get_tracer", "start_tracing", "stop_tracing", "set_track"]
+
+# Named track (e.g. one per browser page) for events emitted by the current task
+_TRACK: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("aops_trace_track", default=None)
+
+
+def set_track(name: Optional[str]) -> None:
+    """Route trace events of the current asyncio task / thread to the track `name`."""
+    _TRACK.set(name)
+
+
+class TraceRecorder:
+    """
+    Streams Chrome trace-event JSON (viewable in Perfetto / chrome://tracing).
+
+    Events are grouped by real thread (reactor, background loop, thread pool) or,
+    inside a task that called `set_track()`, by a virtual per-page track, so the
+    lifecycle of every request shows up as its own row. Timestamps come from
+    `time.perf_counter()`, the clock used by `utils.timing.span`.
+    Events are buffered and appended to the file in batches.
+    """
+
+    def __init__(self, path: str, flush_every: int = 2000) -> None:
+        self._path = path
+        self._flush_every = flush_every
+        self._lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._tids: Dict[Any, int] = {}
+        self._pid = os.getpid()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write("[\n")
+
+    def _tid(self) -> int:
+        # Caller holds the lock
+        track = _TRACK.get()
+        key = track if track is not None else threading.get_ident()
+        tid = self._tids.get(key)
+        if tid is None:
+            tid = self._tids[key] = len(self._tids) + 1
+            name = track if track is not None else threading.current_thread().name
+            self._buffer.append(json.dumps({
+                "ph": "M", "name": "thread_name", "pid": self._pid, "tid": tid,
+                "args": {"name": name},
+            }))
+        return tid
+
+    def _append(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            event["pid"] = self._pid
+            event["tid"] = self._tid()
+            self._buffer.append(json.dumps(event, default=str))
+            if len(self._buffer) >= self._flush_every:
+                self._flush_locked()
+
+    def complete(self, name: str, start: float, end: float, cat: Optional[str] = None, args: Optional[Dict[str, Any]] = None) -> None:
+        """A duration event between two `perf_counter()` readings."""
+        self._append({
+            "ph": "X", "name": name, "cat": cat or "-",
+            "ts": start * 1e6, "dur": max(0.0, end - start) * 1e6,
+            "args": args or {},
+        })
+
+    def instant(self, name: str, cat: Optional[str] = None, args: Optional[Dict[str, Any]] = None) -> None:
+        self._append({
+            "ph": "i", "s": "t", "name": name, "cat": cat or "-",
+            "ts": time.perf_counter() * 1e6,
+            "args": args or {},
+        })
+
+    def _flush_locked(self) -> None:
+        if self._buffer and self._file is not None:
+            self._file.write(",\n".join(self._buffer) + ",\n")
+            self._file.flush()
+            self._buffer = []
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_locked()
+            # Closing metadata event keeps the array valid JSON (no trailing comma)
+            self._file.write(json.dumps({
+                "ph": "M", "name": "process_name", "pid": self._pid, "tid": 0,
+                "args": {"name": "aops_crawler"},
+            }) + "\n]\n")
+            self._file.close()
+            self._file = None
+
+
+_TRACER: Optional[TraceRecorder] = None
+
+
+def get_tracer() -> Optional[TraceRecorder]:
+    return _TRACER
+
+
+def start_tracing(path: str) -> TraceRecorder:
+    global _TRACER
+    stop_tracing()
+    _TRACER = TraceRecorder(path)
+    return _TRACER
+
+
+def stop_tracing() -> None:
+    global _TRACER
+    tracer, _TRACER = _TRACER, None
+    if tracer is not None:
+        tracer.close()
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Dict, Optional, Tuple
+
+import scrapy
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from twisted.internet import task
+from aops_crawler.db.sqlite_store import SqliteStore
+
+__all__ = ["WorkQueueSpiderMiddleware"]
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueueSpiderMiddleware:
+    """
+    Spider middleware that turns a crawler into a worker of the shared SQLite
+    work queue (enabled with `AOPS_WORK_QUEUE`, used by `run.py --workers N`).
+
+    - start requests and every discovered (driver, id) request are enqueued in
+      `work_queue` instead of the local scheduler;
+    - `process_start` keeps claiming leased batches of work for this worker
+      (`AOPS_WORKER_ID`) until the queue is drained;
+    - leases of in-flight work are heartbeated, completed once the callback has
+      run, and released on failure so another worker can pick them up. While a
+      retry is pending (`meta["retry_pending"]`, e.g. after a partial response)
+      the lease is kept and completed by the retry's response. Leases of a dead
+      worker simply expire.
+    """
+
+    def __init__(self, crawler) -> None:
+        settings = crawler.settings
+        self._crawler = crawler
+        self._enabled = settings.getbool("AOPS_WORK_QUEUE", False)
+        self._sqlite_path: Optional[str] = settings.get("AOPS_SQLITE_PATH")
+        self._owner = settings.get("AOPS_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+        self._lease_seconds = settings.getfloat("AOPS_WORK_LEASE_SECONDS", 300.0)
+        self._prefetch = settings.getint("AOPS_WORK_PREFETCH", 8)
+        self._max_attempts = settings.getint("AOPS_WORK_MAX_ATTEMPTS", 3)
+        self._poll_seconds = settings.getfloat("AOPS_WORK_POLL_SECONDS", 2.0)
+        # Finished work is offered again once it is older than the seen-store TTL
+        self._seen_ttl: Dict[str, float] = {str(k): float(v) for k, v in settings.getdict("AOPS_SEEN_TTL").items()}
+        self._store: Optional[SqliteStore] = None
+        self._inflight: Dict[Tuple[str, int], float] = {}
+        self._heartbeat = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        s = cls(crawler)
+        if not s._enabled:
+            raise NotConfigured
+        if not s._sqlite_path:
+            logger.warning("[WorkQueue] AOPS_WORK_QUEUE needs AOPS_SQLITE_PATH; worker mode disabled")
+            raise NotConfigured
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    # ---- lifecycle ----
+    def _ensure_open(self) -> None:
+        if self._store is not None:
+            return
+        self._store = SqliteStore(self._sqlite_path)
+        self._store.open()
+        self._heartbeat = task.LoopingCall(self._beat)
+        self._heartbeat.start(max(1.0, self._lease_seconds / 3.0), now=False)
+        logger.info(f"[WorkQueue] Worker {self._owner} attached to {self._sqlite_path}")
+
+    def spider_opened(self, spider):
+        self._ensure_open()
+
+    def spider_closed(self, spider):
+        try:
+            if self._heartbeat is not None and self._heartbeat.running:
+                self._heartbeat.stop()
+        except Exception:
+            pass
+        try:
+            if self._store is not None:
+                # Hand unfinished leases back immediately rather than waiting for expiry
+                for driver, item_id in list(self._inflight):
+                    self._store.release_work(self._owner, driver, item_id)
+                self._inflight.clear()
+                self._store.close()
+        except Exception as e:
+            logger.warning(f"[WorkQueue] Failed to release leases on close: {e}")
+        finally:
+            self._store = None
+
+    def _beat(self):
+        try:
+            if self._store is None:
+                return
+            self._store.heartbeat_work(self._owner, list(self._inflight), self._lease_seconds)
+            expired = self._store.expire_work(self._max_attempts)
+            self._store.commit()
+            if expired:
+                logger.info(f"[WorkQueue] Expired {expired} stale leases")
+            self._crawler.stats.set_value("aops/workqueue/inflight", len(self._inflight))
+        except Exception as e:
+            logger.warning(f"[WorkQueue] Heartbeat failed: {e}")
+
+    # ---- helpers ----
+    @staticmethod
+    def _key(request) -> Optional[Tuple[str, int]]:
+        driver = request.meta.get("driver")
+        item_id = request.meta.get("id")
+        if driver is None or item_id is None:
+            return None
+        try:
+            return str(driver), int(item_id)
+        except (TypeError, ValueError):
+            return None
+
+    def _enqueue(self, requests) -> None:
+        now = time.time()
+        rows = []
+        for request in requests:
+            driver, item_id = self._key(request)
+            rows.append((driver, item_id, request.meta.get("parent_id"), request.priority))
+        if not rows:
+            return
+        cutoffs = {driver: now - ttl for driver, ttl in self._seen_ttl.items()}
+        added = self._store.enqueue_work(rows, requeue_done_before=cutoffs)
+        self._store.commit()
+        self._crawler.stats.inc_value("aops/workqueue/enqueued", added)
+
+    def _on_download_error(self, failure):
+        if failure.request.meta.get("retry_pending") and failure.check(IgnoreRequest):
+            return  # backing off before a retry; the lease stays ours
+        key = self._key(failure.request)
+        if key is not None and self._inflight.pop(key, None) is not None and self._store is not None:
+            self._store.release_work(self._owner, key[0], key[1], failed=True, max_attempts=self._max_attempts)
+            self._store.commit()
+            self._crawler.stats.inc_value("aops/workqueue/failed")
+        logger.warning(f"[WorkQueue] Download failed for {failure.request.url}: {failure.value!r}")
+
+    # ---- spider middleware hooks ----
+    async def process_start(self, start):
+        self._ensure_open()
+        # Seeds go through the queue too; whichever worker starts first plants them
+        seeds = []
+        async for item_or_request in start:
+            if isinstance(item_or_request, scrapy.Request) and self._key(item_or_request) is not None:
+                seeds.append(item_or_request)
+            else:
+                yield item_or_request
+        self._enqueue(seeds)
+
+        spider = self._crawler.spider
+        while self._store is not None:
+            claimed = []
+            room = self._prefetch - len(self._inflight)
+            if room > 0:
+                claimed = self._store.claim_work(self._owner, room, self._lease_seconds, self._max_attempts)
+            for row in claimed:
+                self._inflight[(row["driver"], row["id"])] = time.time()
+                yield spider.request_for(
+                    row["driver"],
+                    row["id"],
+                    row["parent_id"],
+                    priority=row["priority"],
+                    dont_filter=True,
+                    errback=self._on_download_error,
+                    meta={"work_lease": True},
+                )
+            if claimed:
+                continue
+            counts = self._store.work_counts()
+            if not self._inflight and not counts.get("pending") and not counts.get("leased"):
+                logger.info(f"[WorkQueue] Queue drained ({counts}); worker {self._owner} finishing")
+                return
+            await asyncio.sleep(self._poll_seconds)
+
+    async def process_spider_output(self, response, result, spider):
+        discovered = []
+        async for r in result:
+            if isinstance(r, scrapy.Request) and self._key(r) is not None:
+                discovered.append(r)
+            else:
+                yield r
+        self._enqueue(discovered)
+        key = self._key(response.request) if response.meta.get("work_lease") else None
+        if key is not None and response.meta.get("retry_pending"):
+            # Partial response: the rest of the thread is still to come
+            self._crawler.stats.inc_value("aops/workqueue/partial")
+            key = None
+        if key is not None and self._inflight.pop(key, None) is not None:
+            self._store.complete_work(self._owner, key[0], key[1])
+            self._store.commit()
+            self._crawler.stats.inc_value("aops/workqueue/completed")
+
+    def process_spider_exception(self, response, exception, spider):
+        key = self._key(response.request) if response.meta.get("work_lease") else None
+        if key is not None and self._inflight.pop(key, None) is not None and self._store is not None:
+            self._store.release_work(self._owner, key[0], key[1], failed=True, max_attempts=self._max_attempts)
+            self._store.commit()
+        return None
@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import logging
+import argparse
+import tempfile
+
+# Same reactor bootstrap as run.py: the download handler requires the asyncio reactor
+os.environ.setdefault("TWISTED_REACTOR", "twisted.internet.asyncioreactor.AsyncioSelectorReactor")
+try:
+    import asyncio
+    if sys.platform.startswith("win"):
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    from twisted.internet import asyncioreactor
+    try:
+        asyncioreactor.install()
+    except Exception:
+        pass
+except Exception:
+    pass
+
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.log import configure_logging
+from twisted.internet import reactor
+from aops_crawler.bench.runner import format_comparison, format_report, run_benchmark, run_profiles, write_report
+from aops_crawler.bench.stub_server import add_config_arguments, config_from_args
+from aops_crawler.browser_service import get_browser_service
+
+
+def _parse_override(value):
+    key, sep, raw = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got {value!r}")
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the crawler end to end against a local synthetic AoPS server"
+    )
+    add_config_arguments(parser)
+    parser.add_argument("--workdir", default=None, help="where the DB, browser profile and logs go (default: a temp dir)")
+    parser.add_argument("--channel", default=None, help="browser channel (default: AOPS_BROWSER_CHANNEL)")
+    parser.add_argument("--headed", action="store_true", help="show the browser window")
+    parser.add_argument("--timeout", type=float, default=0, help="stop the crawl after N seconds (CLOSESPIDER_TIMEOUT)")
+    parser.add_argument("--profile", dest="profiles", action="append", default=[],
+                        help="AOPS_LAUNCH_PROFILES entry to run; repeat to compare profiles on the same tree")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the report as JSON")
+    parser.add_argument("-s", dest="overrides", action="append", type=_parse_override, default=[],
+                        metavar="KEY=VALUE", help="override a Scrapy setting (value parsed as JSON when possible)")
+    args = parser.parse_args()
+
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(project_dir)
+    os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "aops_crawler.settings")
+    settings = get_project_settings()
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="aops-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+
+    settings.set("TWISTED_REACTOR", "twisted.internet.asyncioreactor.AsyncioSelectorReactor", priority="cmdline")
+    settings.set("AOPS_HEADLESS", not args.headed, priority="cmdline")
+    if args.channel:
+        settings.set("AOPS_BROWSER_CHANNEL", args.channel, priority="cmdline")
+    if args.timeout:
+        settings.set("CLOSESPIDER_TIMEOUT", args.timeout, priority="cmdline")
+    settings.set("LOG_FILE", os.path.join(workdir, "bench.log"), priority="cmdline")
+    for key, value in args.overrides:
+        settings.set(key, value, priority="cmdline")
+    configure_logging(settings)
+
+    result = {}
+
+    def _done(report):
+        result["report"] = report
+        if len(args.profiles) > 1:
+            for name, profile_report in report.items():
+                print(f"== {name}")
+                print(format_report(profile_report))
+            print(format_comparison(report))
+        else:
+            print(format_report(report))
+        if args.json_path:
+            write_report(report, args.json_path)
+        print(f"(workdir: {workdir})")
+
+    def _failed(failure):
+        logging.getLogger(__name__).error(f"[bench] Benchmark failed: {failure.getErrorMessage()}")
+        print(failure.getTraceback(), file=sys.stderr)
+
+    if len(args.profiles) > 1:
+        d = run_profiles(settings, config_from_args(args), workdir, args.profiles)
+    else:
+        if args.profiles:
+            settings.set("AOPS_LAUNCH_PROFILE", args.profiles[0], priority="cmdline")
+        d = run_benchmark(settings, config_from_args(args), workdir)
+    d.addCallbacks(_done, _failed)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.addSystemEventTrigger("before", "shutdown", get_browser_service().shutdown)
+    reactor.run()
+    return 0 if "report" in result else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
 import os
 import sys
+import time
 import logging
+import argparse
+import subprocess
 
 # Request asyncio reactor via env and install it BEFORE importing Scrapy/Twisted reactor users
 os.environ.setdefault("TWISTED_REACTOR", "twisted.internet.asyncioreactor.AsyncioSelectorReactor")
@@ -22,9 +25,16 @@ from scrapy.crawler import CrawlerRunner
 from scrapy.utils.project import get_project_settings
 from scrapy.utils.log import configure_logging
 from twisted.internet import reactor
+from aops_crawler.browser_service import get_browser_service
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Run the AoPS crawler in timeboxed cycles")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="start N worker processes sharing the SQLite work queue")
+    parser.add_argument("--worker-id", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
     # Resolve relative paths (e.g., LOG_FILE) from project root
     project_dir = os.path.dirname(os.path.abspath(__file__))
     try:
@@ -32,6 +42,9 @@ def main():
     except Exception:
         pass
 
+    if args.workers > 1 and args.worker_id is None:
+        return run_workers(args.workers)
+
     # Load project settings
     os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "aops_crawler.settings")
     settings = get_project_settings()
@@ -43,12 +56,23 @@ def main():
         priority="project",
     )
 
-    # Enable job persistence so the crawl can be paused/resumed across runs
+    # Pending requests persist in the SQLite frontier and fetch history in the
+    # seen-store (both under browser_data), so the crawl resumes across runs without JOBDIR
     try:
         os.makedirs(os.path.join(project_dir, "browser_data"), exist_ok=True)
     except Exception:
         pass
-    settings.set("JOBDIR", os.path.join("browser_data", "job-aops"), priority="project")
+    if args.worker_id is not None:
+        # Worker process: pending work lives in the shared work_queue table, each
+        # worker drives its own browser profile and writes its own log
+        channel = settings.get("AOPS_BROWSER_CHANNEL", "msedge")
+        settings.set("AOPS_WORK_QUEUE", True, priority="project")
+        settings.set("AOPS_WORKER_ID", f"worker-{args.worker_id}", priority="project")
+        settings.set("AOPS_BROWSER_USER_DATA_DIR", f"./browser_data/{channel}-worker-{args.worker_id}", priority="project")
+        settings.set("LOG_FILE", f"test/aops-worker-{args.worker_id}.log", priority="project")
+
+    # Keep one browser alive across crawl cycles; each new crawler reuses the warm context
+    settings.set("AOPS_BROWSER_KEEPALIVE", True, priority="project")
 
     # Configure logging explicitly (CrawlerRunner does not configure logging)
     configure_logging(settings)
@@ -59,12 +83,15 @@ def main():
 
     # Timebox each run and restart indefinitely
     run_for_seconds = 1800  # set to 1800 for 30 minutes
+    # Cycles that end early (nothing stale to crawl) wait this long before restarting
+    min_cycle_seconds = 60
 
     logger = logging.getLogger(__name__)
 
     def start_cycle():
         logger.info("[cycle] starting new crawl")
         crawler = runner.create_crawler("aops_crawler")
+        started_at = time.monotonic()
 
         d = runner.crawl(crawler)
 
@@ -83,18 +110,59 @@ def main():
             except Exception:
                 pass
             try:
-                logger.info("[cycle] crawl finished, restarting")
-                reactor.callLater(0, start_cycle)
+                delay = max(0.0, min_cycle_seconds - (time.monotonic() - started_at))
+                logger.info(f"[cycle] crawl finished, restarting in {delay:.0f}s")
+                reactor.callLater(delay, start_cycle)
             except Exception:
                 pass
             return _
         d.addBoth(_after_cycle)
 
+    # Close the long-lived browser only when the whole process shuts down
+    reactor.addSystemEventTrigger("before", "shutdown", get_browser_service().shutdown)
+
     # Kick off the first cycle and run reactor once
     start_cycle()
     reactor.run()
 
 
+def run_workers(count):
+    """Launch `count` worker processes on the shared work queue and keep them running."""
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+    script = os.path.abspath(__file__)
+    workers = {}
+
+    def _spawn(worker_id):
+        logger.info(f"[launcher] starting worker {worker_id}")
+        workers[worker_id] = subprocess.Popen([sys.executable, script, "--worker-id", str(worker_id)])
+
+    for worker_id in range(count):
+        _spawn(worker_id)
+    try:
+        while True:
+            time.sleep(5)
+            for worker_id, proc in list(workers.items()):
+                code = proc.poll()
+                if code is not None:
+                    # A crashed worker's leases expire and are claimed by the others meanwhile
+                    logger.warning(f"[launcher] worker {worker_id} exited with {code}; restarting")
+                    _spawn(worker_id)
+    except KeyboardInterrupt:
+        logger.info("[launcher] stopping workers")
+    finally:
+        for proc in workers.values():
+            try:
+                proc.terminate()
+            except Exception:
+                pass
+        for proc in workers.values():
+            try:
+                proc.wait(timeout=30)
+            except Exception:
+                proc.kill()
+
+
 def _timeboxed_shutdown(crawler):
     logging.getLogger(__name__).info("[cycle] timeboxed shutdown")
     try:
@@ -0,0 +1,43 @@
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+
+from aops_crawler.middlewares import AdaptiveConcurrencyMiddleware
+from aops_crawler.scheduler import SqliteFrontierScheduler
+from aops_crawler.spiders.aops_spider import QuotesSpider
+
+
+def _open(tmp_path):
+    crawler = get_crawler(QuotesSpider, {
+        "AOPS_SQLITE_PATH": str(tmp_path / "db.sqlite3"),
+        "AOPS_AIMD_DRIVERS": {"post": {"initial": 2}, "category": {"initial": 1}},
+    })
+    spider = QuotesSpider.from_crawler(crawler)
+    aimd = AdaptiveConcurrencyMiddleware.from_crawler(crawler)
+    scheduler = SqliteFrontierScheduler(
+        BaseDupeFilter(), str(tmp_path / "db.sqlite3"), stats=crawler.stats, gate=crawler.aops_concurrency,
+    )
+    scheduler.open(spider)
+    return scheduler, spider, aimd
+
+
+def test_full_post_window_does_not_block_categories(tmp_path):
+    scheduler, spider, aimd = _open(tmp_path)
+    try:
+        # Posts outrank the category here, so they are popped first
+        for item_id in range(10):
+            scheduler.enqueue_request(spider.request_for("post", item_id, 1, priority=100))
+        scheduler.enqueue_request(spider.request_for("category", 50, 1, priority=0))
+
+        first = [scheduler.next_request() for _ in range(3)]
+        assert [r.meta["driver"] for r in first] == ["post", "post", "category"]
+        assert scheduler.next_request() is None
+        assert len(scheduler) == 8
+
+        # A finished post frees a slot for the highest-priority held post
+        done = first[0]
+        aimd.process_response(done, TextResponse(done.url, body=b"{}", request=done), spider)
+        assert scheduler.next_request().meta["id"] == 2
+        assert scheduler.next_request() is None
+    finally:
+        scheduler.close("shutdown")
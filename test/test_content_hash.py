@@ -0,0 +1,54 @@
+import json
+import os
+
+from scrapy.http import HtmlResponse, Request, TextResponse
+from scrapy.utils.test import get_crawler
+
+from aops_crawler.middlewares import SeenStoreDownloaderMiddleware
+
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+
+
+def _fetches(tmp_path, driver, responses):
+    """content_unchanged of each successive fetch of one page."""
+    crawler = get_crawler(settings_dict={"AOPS_SQLITE_PATH": str(tmp_path / "db.sqlite3")})
+    mw = SeenStoreDownloaderMiddleware.from_crawler(crawler)
+    mw.spider_opened(None)
+    unchanged = []
+    for make_response in responses:
+        request = Request("http://aops/community/x", meta={"driver": driver, "id": 7})
+        mw.process_response(request, make_response(request), None)
+        unchanged.append(request.meta.get("content_unchanged", False))
+    return unchanged
+
+
+def test_topic_chrome_does_not_count_as_a_change(tmp_path):
+    with open(os.path.join(CORPUS, "topic-small.html"), encoding="utf-8") as f:
+        html = f.read()
+
+    def render(title, date, body="find that show"):
+        page = html.replace("<title>Problem 100002</title>", f"<title>{title}</title>")
+        page = page.replace("Sep 27, 2026, 10:50 PM", date).replace("find that show", body, 1)
+        return lambda request: HtmlResponse(request.url, body=page.encode("utf-8"), request=request)
+
+    assert _fetches(tmp_path, "post", [
+        render("Problem 100002", "Sep 27, 2026, 10:50 PM"),
+        render("Problem 100002 (1,024 views)", "Today at 10:50 PM"),
+        render("Problem 100002 (1,024 views)", "Today at 10:50 PM", body="find that an edit shows"),
+    ]) == [False, True, False]
+
+
+def test_category_listing_items_are_hashed(tmp_path):
+    def listing(items, **extra):
+        body = dict(first_filtered={"response_json": {"response": {"category": {"items": items}}}}, **extra)
+        return lambda request: TextResponse(
+            request.url, body=json.dumps(body).encode("utf-8"), request=request,
+            headers={"Content-Type": "application/json"},
+        )
+
+    items = [{"item_id": 1, "item_type": "post", "post_data": {"last_post_time": 100}}]
+    assert _fetches(tmp_path, "category", [
+        listing(items, ajax_requests=[{"elapsed_ms": 812}]),
+        listing(items, ajax_requests=[{"elapsed_ms": 95}]),
+        listing([dict(items[0], post_data={"last_post_time": 200})]),
+    ]) == [False, True, False]
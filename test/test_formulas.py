@@ -0,0 +1,28 @@
+from aops_crawler.pipelines import extract_formulas, normalize_formula
+
+
+def test_normalize_formula_drops_insignificant_whitespace():
+    assert normalize_formula(r"$ x ^ {2} + 1 $") == "x^{2}+1"
+    assert normalize_formula(r"\[ \left( a + b \right) \]") == "(a+b)"
+    assert normalize_formula(r"\sum k") == r"\sum k"
+    assert normalize_formula(r"\sum  _{k} k") == r"\sum_{k}k"
+    assert normalize_formula(r"\frac {1} {2}") == r"\frac{1}{2}"
+    assert normalize_formula(r"a \, b") == r"a\,b"
+
+
+def test_normalize_formula_keeps_control_spaces():
+    # Dropping the space would turn "\ b" into the control word \b
+    assert normalize_formula(r"a\ b") == r"a\ b"
+    assert normalize_formula(r"a \\ b") == r"a\ b"
+    assert normalize_formula(r"\alpha\  \beta") == r"\alpha\ \beta"
+    assert normalize_formula(r"a\ b") != normalize_formula(r"a\b")
+
+
+def test_extract_formulas_reads_latex_images_in_order():
+    post = (
+        '<div>Let <img class="latex" alt="$x \\ge 0$" src="a.png"> and '
+        '<img src="smile.png" alt=":)"> then '
+        '<img alt="$$\\frac{a}{b} &lt; 1$$" class="latexcenter" src="b.png">'
+        '<img class="latex" alt="$ $" src="c.png"></div>'
+    )
+    assert extract_formulas(post) == [r"x\ge0", r"\frac{a}{b}<1"]
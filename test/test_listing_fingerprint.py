@@ -0,0 +1,70 @@
+from scrapy.http import Request, TextResponse
+from scrapy.utils.test import get_crawler
+
+from aops_crawler.middlewares import ListingFingerprintSpiderMiddleware, SeenStoreDownloaderMiddleware
+from aops_crawler.spiders.aops_spider import listing_fingerprint
+
+LISTING = [
+    {"item_id": 20, "item_type": "folder", "last_post_time": 100, "num_topics": 3},
+    {"item_id": 21, "item_type": "folder"},
+    {"item_id": 30, "item_type": "post", "post_data": {"last_post_time": 90, "num_posts": 4}},
+]
+
+
+def test_fingerprint_covers_items_with_activity():
+    fingerprint, children = listing_fingerprint(LISTING)
+    assert children == {("category", 20), ("post", 30)}
+    assert listing_fingerprint(list(reversed(LISTING)))[0] == fingerprint
+    replied = [dict(LISTING[2], post_data={"last_post_time": 95, "num_posts": 5})] + LISTING[:2]
+    assert listing_fingerprint(replied)[0] != fingerprint
+
+
+def _fetch(seen, driver, item_id, parent_id=None, fails=False):
+    request = Request(f"http://aops/{driver}/{item_id}", meta={"driver": driver, "id": item_id, "parent_id": parent_id})
+    seen.request_scheduled(request, None)
+    seen.process_request(request, None)
+    if not fails:
+        seen.process_response(request, TextResponse(request.url, body=b"{}", request=request), None)
+
+
+def _cycle(tmp_path, reason, fetch_children):
+    """One crawl of category 10 listing LISTING; returns the children skipped as
+    unchanged and category 10's settled fetch time after the crawl."""
+    crawler = get_crawler(settings_dict={"AOPS_SQLITE_PATH": str(tmp_path / "db.sqlite3")})
+    seen = SeenStoreDownloaderMiddleware.from_crawler(crawler)
+    listing = ListingFingerprintSpiderMiddleware.from_crawler(crawler)
+    seen.spider_opened(None)
+    listing.spider_opened(None)
+    _fetch(seen, "category", 10)
+    fingerprint, children = listing_fingerprint(LISTING)
+    response = TextResponse(
+        "http://aops/category/10", body=b"{}",
+        request=Request("http://aops/category/10", meta={
+            "driver": "category", "id": 10, "listing_fingerprint": fingerprint, "listing_children": children,
+        }),
+    )
+    skip = listing._skippable(response)
+    for driver, item_id in sorted(children - skip):
+        _fetch(seen, driver, item_id, 10, fails=not fetch_children)
+    listing.spider_closed(None)
+    seen.spider_closed(None, reason=reason)
+    listing.spider_opened(None)
+    settled = listing._store.get_settled("category", 10)
+    listing.spider_closed(None)
+    return skip, settled
+
+
+def test_folder_fetched_in_interrupted_crawl_is_not_skipped(tmp_path):
+    # Folder 20 is fetched, but the crawl stops before its subtree is
+    assert _cycle(tmp_path, "shutdown", fetch_children=True) == (set(), None)
+    skip, settled = _cycle(tmp_path, "finished", fetch_children=True)
+    assert skip == {("post", 30)} and settled is not None
+    skip, _ = _cycle(tmp_path, "finished", fetch_children=True)
+    assert skip == {("category", 20), ("post", 30)}
+
+
+def test_unfetched_children_hold_back_their_parent(tmp_path):
+    # Fetching the listed folder and topic fails: category 10 is not settled
+    assert _cycle(tmp_path, "finished", fetch_children=False) == (set(), None)
+    skip, settled = _cycle(tmp_path, "finished", fetch_children=True)
+    assert skip == set() and settled is not None
@@ -0,0 +1,38 @@
+import glob
+import os
+
+import pytest
+
+from aops_crawler.bench.corpus import load_corpus
+from aops_crawler.bench.parsers import _stage_functions
+
+pytest.importorskip("pytest_benchmark")
+
+# Small pages written by `python -m aops_crawler.bench.parsers dump-corpus`;
+# the large and pathological cases stay generated (`... parsers run`)
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+_STAGES_BY_KIND = {
+    "topic": ("extract_posts", "transform_html", "process_item"),
+    "category": ("parse_category_html",),
+}
+STAGES = sorted(
+    f"{stage}/{case}"
+    for kind, case in (
+        os.path.basename(path)[:-len(".html")].split("-", 1) for path in glob.glob(os.path.join(CORPUS, "*.html"))
+    )
+    for stage in _STAGES_BY_KIND[kind]
+) + ["parse_time/mixed"]
+
+
+@pytest.fixture(scope="module")
+def stages(tmp_path_factory):
+    functions = _stage_functions(load_corpus(CORPUS), str(tmp_path_factory.mktemp("bench")))
+    close = functions.pop("_close")
+    yield functions
+    close()
+
+
+@pytest.mark.parametrize("name", STAGES)
+def test_stage_throughput(benchmark, stages, name):
+    benchmark.group = name.split("/", 1)[0]
+    assert benchmark(stages[name]) > 0
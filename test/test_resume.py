@@ -0,0 +1,66 @@
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from aops_crawler.errors import SelectorMissing
+from aops_crawler.middlewares import ClassifiedRetryMiddleware
+from aops_crawler.single_page import _resume_point, post_id_of, resume_offset
+from aops_crawler.spiders.aops_spider import QuotesSpider
+
+TOPIC_URL = "https://artofproblemsolving.com/community/c6h3358923"
+
+
+def _post(post_id):
+    return (
+        f'<div class="cmty-post"><div class="cmty-post-top">'
+        f'<a href="/community/c6h3358923p{post_id}">#</a></div>'
+        f'<div class="cmty-post-middle">post {post_id} quoting '
+        f'<a href="/community/c6h3358923p1">the first post</a></div></div>'
+    )
+
+
+def test_resume_point_opens_the_topic_at_the_last_loaded_post():
+    assert post_id_of(_post(31205921)) == 31205921
+    assert post_id_of('<div class="cmty-post" data-post-id="7"><a href="/community/h1p9">x</a></div>') == 7
+    assert post_id_of('<div class="cmty-post">no permalink</div>') is None
+
+    assert _resume_point(TOPIC_URL, _post(31205921)) == (
+        "https://artofproblemsolving.com/community/c6h3358923p31205921", 31205921,
+    )
+    # A resumed attempt's own URL already addresses a post
+    assert _resume_point(TOPIC_URL + "p31205921", _post(31206000))[0] == TOPIC_URL + "p31206000"
+    assert _resume_point(TOPIC_URL, '<div class="cmty-post"></div>') == (None, None)
+
+
+def test_resumed_posts_are_numbered_from_the_anchor():
+    # 120 posts were stored; the anchor (position 119) is the page's third post
+    assert resume_offset([40, 41, 42, 43], 120, 42) == 117
+    assert resume_offset([42, 43], 120, 42) == 119
+    assert resume_offset([43, 44], 120, 42) is None
+
+
+def test_retry_resumes_from_the_last_loaded_post(tmp_path, monkeypatch):
+    crawler = get_crawler(QuotesSpider, {"AOPS_SQLITE_PATH": str(tmp_path / "db.sqlite3")})
+    spider = QuotesSpider.from_crawler(crawler)
+    crawler.stats.open_spider(spider)
+    retry = ClassifiedRetryMiddleware.from_crawler(crawler)
+    scheduled = []
+    monkeypatch.setattr(retry, "_schedule", lambda request, delay: scheduled.append(request))
+
+    def _fail(request, loaded, post_id):
+        partial = HtmlResponse(TOPIC_URL, body=b"<html></html>", flags=["partial"], request=request)
+        return retry.process_exception(request, SelectorMissing(
+            "scroll: timeout", url=TOPIC_URL, stage="scroll", partial=partial, loaded=loaded,
+            resume_url=f"{TOPIC_URL}p{post_id}", resume_post_id=post_id,
+        ), spider)
+
+    request = spider.request_for("post", 3358923, 1)
+    assert "partial" in _fail(request, 120, 31205921).flags
+    first = scheduled.pop()
+    assert first.meta["resume_from"] == 120
+    assert first.meta["resume_url"] == TOPIC_URL + "p31205921"
+    assert first.meta["resume_post_id"] == 31205921
+
+    # The resumed attempt got further before failing again
+    _fail(first, 200, 31206000)
+    second = scheduled.pop()
+    assert (second.meta["resume_from"], second.meta["resume_post_id"]) == (200, 31206000)
@@ -0,0 +1,45 @@
+import random
+
+from aops_crawler.db.sqlite_store import SqliteStore
+
+
+def _snapshot(store):
+    conn = store._conn
+    return {
+        table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall())
+        for table in ("thread_stats", "category_stats", "thread_posters", "category_posters")
+    }
+
+
+def test_incremental_rollups_match_rebuild_with_links_in_any_order(tmp_path):
+    rng = random.Random(7)
+    store = SqliteStore(str(tmp_path / "db.sqlite3"))
+    store.open()
+    try:
+        # category tree 1 <- 2 <- {3, 4}, 1 <- 5; threads 100..119
+        category_links = [(1, 2), (2, 3), (2, 4), (1, 5)]
+        thread_links = [(rng.choice([2, 3, 4, 5]), 100 + t) for t in range(20)]
+        posts = [
+            (100 + rng.randrange(20), pos, rng.randrange(6), rng.uniform(0, 1e6), rng.randrange(4))
+            for pos in range(300)
+        ]
+        ops = [("category", link) for link in category_links]
+        ops += [("post", link) for link in thread_links]
+        ops += [("message", post) for post in posts]
+        rng.shuffle(ops)
+        for kind, op in ops:
+            if kind == "message":
+                thread_id, position, user_id, created_at, thanks = op
+                store.insert_post_message(thread_id, user_id, created_at, thanks, 0, "", "", position == 0, None,
+                                          position=position)
+            else:
+                store.link(op[0], op[1], kind)
+        # Re-fetching a thread updates its messages in place
+        for thread_id, position, user_id, created_at, thanks in posts[:50]:
+            store.insert_post_message(thread_id, (user_id + 1) % 6, created_at, thanks + 1, 0, "", "", False, None,
+                                      position=position)
+        incremental = _snapshot(store)
+        store.rebuild_rollups()
+        assert incremental == _snapshot(store)
+    finally:
+        store.close()
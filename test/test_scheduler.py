@@ -0,0 +1,91 @@
+import sqlite3
+
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.http import TextResponse
+from scrapy.utils.test import get_crawler
+
+from aops_crawler.db.sqlite_store import SqliteStore
+from aops_crawler.scheduler import SqliteFrontierScheduler
+from aops_crawler.spiders.aops_spider import QuotesSpider
+
+
+def _open_scheduler(tmp_path):
+    crawler = get_crawler(QuotesSpider, {"AOPS_SQLITE_PATH": str(tmp_path / "db.sqlite3")})
+    spider = QuotesSpider.from_crawler(crawler)
+    crawler.stats.open_spider(spider)
+    scheduler = SqliteFrontierScheduler(BaseDupeFilter(), str(tmp_path / "db.sqlite3"), stats=crawler.stats)
+    scheduler.open(spider)
+    return scheduler, spider
+
+
+def test_next_request_releases_write_lock(tmp_path):
+    scheduler, spider = _open_scheduler(tmp_path)
+    try:
+        assert scheduler.enqueue_request(spider.request_for("post", 1, 2))
+        request = scheduler.next_request()
+        assert request.meta["id"] == 1
+
+        other = SqliteStore(str(tmp_path / "db.sqlite3"))
+        other.open()
+        other._conn.execute("PRAGMA busy_timeout = 100")
+        try:
+            other.mark_fetched("post", 1, 0.0, "hash")
+            other.commit()
+        except sqlite3.OperationalError as e:  # pragma: no cover - the regression
+            raise AssertionError(f"scheduler kept the write lock: {e}")
+        finally:
+            other.close()
+    finally:
+        scheduler.close("finished")
+
+
+def _respond(scheduler, request, **meta):
+    request.meta.update(meta)
+    scheduler.response_received(TextResponse(request.url, body=b"{}", request=request), request, None)
+
+
+def test_popped_requests_survive_a_crash(tmp_path):
+    scheduler, spider = _open_scheduler(tmp_path)
+    for item_id in (1, 2, 3):
+        scheduler.enqueue_request(spider.request_for("post", item_id, 9))
+    fetched, crashed = scheduler.next_request(), scheduler.next_request()
+    _respond(scheduler, fetched)
+    scheduler._flush()
+    # Killed without close(): the read-ahead and the in-flight request stay in the table
+    scheduler._store._conn.close()
+
+    scheduler, spider = _open_scheduler(tmp_path)
+    try:
+        assert len(scheduler) == 2
+        ids = {scheduler.next_request().meta["id"] for _ in range(2)}
+        assert ids == {crashed.meta["id"], 3} and fetched.meta["id"] not in ids
+    finally:
+        scheduler.close("shutdown")
+
+
+def test_retries_are_stored_with_their_meta(tmp_path):
+    scheduler, spider = _open_scheduler(tmp_path)
+    assert scheduler.enqueue_request(spider.request_for("post", 1, 9))
+    request = scheduler.next_request()
+    # A partial response keeps the row; its retry re-arms it with the retry meta
+    _respond(scheduler, request, retry_pending=True)
+    retry = request.replace(meta={**request.meta, "aops_retry_times": 1, "resume_from": 40, "download_slot": "x"}, dont_filter=True)
+    del retry.meta["retry_pending"]
+    assert scheduler.enqueue_request(retry)
+    assert scheduler.stats.get_value("scheduler/enqueued/sqlite") == 2
+    scheduler.close("shutdown")
+
+    scheduler, spider = _open_scheduler(tmp_path)
+    try:
+        resumed = scheduler.next_request()
+        assert (resumed.meta["id"], resumed.meta["aops_retry_times"], resumed.meta["resume_from"]) == (1, 1, 40)
+        _respond(scheduler, resumed)
+    finally:
+        scheduler.close("finished")
+    store = SqliteStore(str(tmp_path / "db.sqlite3"))
+    store.open()
+    try:
+        assert store.frontier_size() == 0
+        assert store._conn.execute("SELECT COUNT(*) FROM frontier").fetchone()[0] == 0
+    finally:
+        store.close()
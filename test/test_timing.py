@@ -0,0 +1,24 @@
+from aops_crawler.utils.timing import _BOUNDS, LatencyRecorder
+
+
+def _buckets(text):
+    return {
+        line.split('le="', 1)[1].split('"', 1)[0]: int(line.rsplit(" ", 1)[1])
+        for line in text.splitlines() if "_bucket{" in line
+    }
+
+
+def test_samples_above_the_top_bound_count_only_towards_inf():
+    recorder = LatencyRecorder()
+    for seconds in (0.0001, _BOUNDS[40], _BOUNDS[-1], 5000.0, 7200.0):
+        recorder.record("fetch", seconds, "post")
+    buckets = _buckets(recorder.prometheus_text())
+    assert buckets["0.0005"] == 1
+    assert buckets[f"{_BOUNDS[40]:.6g}"] == 2
+    assert buckets[f"{_BOUNDS[-2]:.6g}"] == 2
+    assert buckets[f"{_BOUNDS[-1]:.6g}"] == 3
+    assert buckets["+Inf"] == 5
+
+    stats = recorder.snapshot()[("fetch", "post")]
+    assert stats["p50"] == _BOUNDS[-1]
+    assert stats["p99"] == stats["max"] == 7200.0
@@ -0,0 +1,90 @@
+import time
+
+from scrapy.http import Request, TextResponse
+from scrapy.utils.test import get_crawler
+
+from aops_crawler.dupefilters import LinkingDupeFilter
+from aops_crawler.middlewares import SeenStoreDownloaderMiddleware
+from aops_crawler.single_page import _below_watermark
+
+
+def _topic(item_id, last_post_time, **flags):
+    return {"item_id": item_id, "item_type": "post", "post_data": dict(last_post_time=last_post_time, **flags)}
+
+
+def test_pinned_topics_do_not_stop_scrolling():
+    items = [_topic(1, 100, is_sticky=True), _topic(2, 5000), _topic(3, 4000)]
+    assert not _below_watermark(items, 1000)
+
+
+def test_tail_of_batch_decides():
+    assert _below_watermark([_topic(2, 5000), _topic(3, 500)], 1000)
+    assert not _below_watermark([{"item_id": 9, "item_type": "folder"}], 1000)
+
+
+def _crawl(tmp_path, reason, fetch_category):
+    crawler = get_crawler(settings_dict={"AOPS_SQLITE_PATH": str(tmp_path / "db.sqlite3"), "AOPS_WATERMARK_SLACK": 0})
+    mw = SeenStoreDownloaderMiddleware.from_crawler(crawler)
+    mw.spider_opened(None)
+    request = Request("http://aops/community/c5", meta={"driver": "category", "id": 5})
+    mw.process_request(request, None)
+    if fetch_category:
+        mw.process_response(request, TextResponse(request.url, body=b"{}", request=request), None)
+    mw.spider_closed(None, reason=reason)
+    return request.meta.get("activity_watermark")
+
+
+def test_watermark_only_from_finished_crawls(tmp_path):
+    # A category fetched in an interrupted crawl gives no watermark: topics it
+    # listed may never have been fetched
+    assert _crawl(tmp_path, "closespider_timeout", True) is None
+    assert _crawl(tmp_path, "finished", True) is None
+    watermark = _crawl(tmp_path, "shutdown", True)
+    assert watermark is not None
+    # ... and stays at the finished crawl's fetch after later interrupted ones
+    assert _crawl(tmp_path, "shutdown", False) == watermark
+
+
+def test_topic_with_new_replies_bypasses_ttl_and_holds_back_watermark(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    settings = {"AOPS_SQLITE_PATH": str(tmp_path / "db.sqlite3"), "AOPS_WATERMARK_SLACK": 0}
+
+    def topic_request(listed_activity):
+        return Request(
+            "http://aops/community/p7",
+            meta={"driver": "post", "id": 7, "parent_id": 5, "listed_activity": listed_activity},
+        )
+
+    def crawl(listed_activity, fetch_topic):
+        # One crawl: category 5 lists topic 7, which goes through the dupefilter
+        # and, unless its fetch fails, the downloader
+        crawler = get_crawler(settings_dict=settings)
+        mw = SeenStoreDownloaderMiddleware.from_crawler(crawler)
+        df = LinkingDupeFilter(sqlite_path=settings["AOPS_SQLITE_PATH"], seen_ttl={"post": 7 * 24 * 3600})
+        mw.spider_opened(None)
+        df.open()
+        category = Request("http://aops/community/c5", meta={"driver": "category", "id": 5})
+        mw.process_request(category, None)
+        mw.process_response(category, TextResponse(category.url, body=b"{}", request=category), None)
+        topic = topic_request(listed_activity)
+        mw.request_scheduled(topic, None)
+        scheduled = not df.request_seen(topic)
+        if scheduled and fetch_topic:
+            mw.process_response(topic, TextResponse(topic.url, body=b"<html/>", request=topic), None)
+        df.close("finished")
+        mw.spider_closed(None, reason="finished")
+        return scheduled, category.meta.get("activity_watermark")
+
+    # Day 0: the topic is fetched and the crawl finishes
+    assert crawl(listed_activity=1.0, fetch_topic=True)[0]
+    # The listing shows no new reply: the TTL keeps the topic out
+    assert not crawl(listed_activity=1.0, fetch_topic=True)[0]
+    # Day 1: a reply newer than the topic's last fetch gets it past the TTL...
+    reply = time.time() + 60
+    scheduled, watermark = crawl(listed_activity=reply, fetch_topic=False)
+    assert scheduled and watermark is not None
+    # ... and while its fetch keeps failing, category 5's watermark does not move
+    scheduled, held = crawl(listed_activity=reply, fetch_topic=False)
+    assert scheduled and held == watermark
+    crawl(listed_activity=reply, fetch_topic=True)
+    assert crawl(listed_activity=1.0, fetch_topic=True)[1] > watermark
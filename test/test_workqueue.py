@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+from scrapy.exceptions import IgnoreRequest
+from scrapy.http import Request, TextResponse
+from scrapy.utils.test import get_crawler
+from twisted.python.failure import Failure
+
+from aops_crawler.db.sqlite_store import SqliteStore
+from aops_crawler.workqueue import WorkQueueSpiderMiddleware
+
+
+def _store(tmp_path):
+    store = SqliteStore(str(tmp_path / "db.sqlite3"))
+    store.open()
+    return store
+
+
+def _state(store, item_id):
+    return store._conn.execute(
+        "SELECT state, owner, attempts FROM work_queue WHERE driver = 'post' AND item_id = ?", (item_id,)
+    ).fetchone()
+
+
+def _ignored(request):
+    try:
+        raise IgnoreRequest("retry scheduled")
+    except IgnoreRequest:
+        failure = Failure()
+    failure.request = request
+    return failure
+
+
+def test_claim_plans_use_the_claim_index(tmp_path):
+    store = _store(tmp_path)
+    for condition in ("state = 'leased' AND lease_until < 0", "state = 'pending'"):
+        plan = " ".join(row[3] for row in store._conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT rowid FROM work_queue WHERE {condition} AND attempts < 3 "
+            "ORDER BY priority DESC LIMIT 8"
+        ))
+        assert "idx_work_queue_claim" in plan and "TEMP B-TREE" not in plan
+
+
+def test_claim_takes_expired_leases_then_pending_by_priority(tmp_path):
+    store = _store(tmp_path)
+    store.enqueue_work([("post", i, 1, i) for i in range(1, 6)])
+    assert [r["id"] for r in store.claim_work("a", 2, 60)] == [5, 4]
+    # Live leases are not handed to another worker
+    assert [r["id"] for r in store.claim_work("b", 2, 60)] == [3, 2]
+    store._conn.execute("UPDATE work_queue SET lease_until = 0 WHERE owner = 'a'")
+    claimed = store.claim_work("b", 3, 60)
+    assert [(r["id"], r["attempts"]) for r in claimed] == [(5, 2), (4, 2), (1, 1)]
+
+
+def test_heartbeat_keeps_a_lease_alive(tmp_path):
+    store = _store(tmp_path)
+    store.enqueue_work([("post", 1, None, 0)])
+    store.claim_work("a", 1, -1)
+    store.heartbeat_work("a", [("post", 1)], 60)
+    assert store.expire_work() == 0
+    assert store.claim_work("b", 1, 60) == []
+
+
+def test_expire_release_and_complete(tmp_path):
+    store = _store(tmp_path)
+    store.enqueue_work([("post", i, None, 0) for i in (1, 2, 3)])
+    store.claim_work("a", 3, -1)
+    assert store.expire_work(max_attempts=1) == 3
+    assert _state(store, 1) == ("failed", None, 1)
+
+    store.enqueue_work([("post", 4, None, 0)])
+    store.claim_work("a", 1, 60)
+    store.release_work("a", "post", 4)
+    assert _state(store, 4) == ("pending", None, 0)
+    store.claim_work("a", 1, 60)
+    store.release_work("b", "post", 4, failed=True, max_attempts=1)
+    assert _state(store, 4) == ("leased", "a", 1)
+    store.release_work("a", "post", 4, failed=True, max_attempts=1)
+    assert _state(store, 4) == ("failed", None, 1)
+
+    store.enqueue_work([("post", 5, None, 0)])
+    store.claim_work("a", 1, 60)
+    store.complete_work("a", "post", 5)
+    assert _state(store, 5) == ("done", None, 1)
+    assert store.enqueue_work([("post", 5, None, 0)], requeue_done_before={"post": time.time() - 60}) == 0
+    assert store.enqueue_work([("post", 5, None, 0)], requeue_done_before={"post": time.time() + 60}) == 1
+    assert _state(store, 5) == ("pending", None, 0)
+
+
+def test_lease_is_kept_while_a_retry_is_pending(tmp_path):
+    crawler = get_crawler(settings_dict={
+        "AOPS_WORK_QUEUE": True, "AOPS_SQLITE_PATH": str(tmp_path / "db.sqlite3"), "AOPS_WORKER_ID": "a",
+    })
+    mw = WorkQueueSpiderMiddleware.from_crawler(crawler)
+    mw.spider_opened(None)
+    store = _store(tmp_path)
+    try:
+        store.enqueue_work([("post", 1, None, 0)])
+        store.claim_work("a", 1, 60)
+        store.commit()
+        mw._inflight[("post", 1)] = time.time()
+        request = Request("http://aops/community/p1", meta={"driver": "post", "id": 1, "work_lease": True})
+
+        async def consume(response):
+            async def nothing():
+                return
+                yield
+            return [r async for r in mw.process_spider_output(response, nothing(), None)]
+
+        # Backing off before a retry, then a partial response: the lease stays
+        request.meta["retry_pending"] = True
+        mw._on_download_error(_ignored(request))
+        asyncio.run(consume(TextResponse(request.url, body=b"{}", request=request)))
+        assert _state(store, 1)[0] == "leased" and ("post", 1) in mw._inflight
+
+        # The retry's full response completes it
+        retry = request.replace(meta={"driver": "post", "id": 1, "work_lease": True})
+        asyncio.run(consume(TextResponse(retry.url, body=b"{}", request=retry)))
+        assert _state(store, 1)[0] == "done"
+    finally:
+        store.close()
+        mw.spider_closed(None)
+